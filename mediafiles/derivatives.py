@@ -0,0 +1,169 @@
+"""
+Sized derivatives (thumbnail/card/full) for uploaded images.
+
+Rendering happens in a process pool once the upload's transaction commits;
+the resulting files are written through the field's storage and their names
+recorded in a JSON column next to the image field, e.g.
+``{"thumbnail": "derivatives/blobs/ab/cd/abcd…_thumbnail.webp", ...}``.
+Derivative names follow the source name, so rows sharing a content-addressed
+blob share its derivatives too. Until a derivative exists, readers fall back
+to the original upload.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.dispatch import Signal
+
+from .imaging import OUTPUT_EXTENSION, render_derivatives
+from .storage import is_blob_name
+
+logger = logging.getLogger(__name__)
+
+# (model label, image field, variants JSON field)
+IMAGE_FIELDS = [
+    ("store.ProductImage", "image", "image_variants"),
+    ("users.SellerProfile", "profile_picture", "profile_picture_variants"),
+    ("users.CustomerProfile", "profile_picture", "profile_picture_variants"),
+]
+
+DERIVATIVE_PREFIX = "derivatives"
+
+# Sent once derivatives for a row have been stored: sender=model, pk, field_name, variants
+derivatives_ready = Signal()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def tracked_fields(model):
+    """(image field, variants field) pairs that get derivatives on ``model``"""
+    label = model._meta.label
+    return [(field, variants) for model_label, field, variants in IMAGE_FIELDS if model_label == label]
+
+
+def derivative_name(source_name, variant):
+    stem, _ = os.path.splitext(source_name)
+    return f"{DERIVATIVE_PREFIX}/{stem}_{variant}{OUTPUT_EXTENSION}"
+
+
+def variant_url(fieldfile, variants, variant):
+    """URL of the requested derivative, falling back to the original upload"""
+    if not fieldfile:
+        return None
+    name = (variants or {}).get(variant)
+    if name:
+        return fieldfile.storage.url(name)
+    return fieldfile.url
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # "spawn" keeps forked copies of open DB connections out of the workers
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_DERIVATIVE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def render(data):
+    return render_derivatives(data, settings.IMAGE_DERIVATIVES, settings.IMAGE_DERIVATIVE_QUALITY)
+
+
+def read_source(fieldfile):
+    fieldfile.open("rb")
+    try:
+        return fieldfile.read()
+    finally:
+        fieldfile.close()
+
+
+def existing_derivatives(storage, source_name):
+    """
+    Derivatives already on disk for a content-addressed source (shared by every
+    row using that blob), or None if any size is missing.
+    """
+    if not is_blob_name(source_name):
+        return None
+    names = {variant: derivative_name(source_name, variant) for variant in settings.IMAGE_DERIVATIVES}
+    if all(storage.exists(name) for name in names.values()):
+        return names
+    return None
+
+
+def record_derivatives(model, pk, field_name, variants_field, source_name, variants):
+    """Point the row at its derivatives, unless its image changed meanwhile"""
+    updated = model.objects.filter(pk=pk, **{field_name: source_name}).update(**{variants_field: variants})
+    if updated:
+        derivatives_ready.send(sender=model, pk=pk, field_name=field_name, variants=variants)
+    return variants
+
+
+def store_derivatives(model, pk, field_name, variants_field, source_name, rendered):
+    """Save rendered derivatives (replacing older renders) and record them"""
+    storage = model._meta.get_field(field_name).storage
+    variants = {}
+    for variant, content in rendered.items():
+        name = derivative_name(source_name, variant)
+        if storage.exists(name):
+            storage.delete(name)
+        variants[variant] = storage.save(name, ContentFile(content))
+    return record_derivatives(model, pk, field_name, variants_field, source_name, variants)
+
+
+def generate_derivatives(instance, field_name, variants_field):
+    """Render and store derivatives for one row in the current process"""
+    fieldfile = getattr(instance, field_name)
+    rendered = render(read_source(fieldfile))
+    return store_derivatives(type(instance), instance.pk, field_name, variants_field, fieldfile.name, rendered)
+
+
+def _run_job(model_label, pk, field_name, variants_field):
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not getattr(instance, field_name):
+        return
+    fieldfile = getattr(instance, field_name)
+    existing = existing_derivatives(fieldfile.storage, fieldfile.name)
+    if existing:
+        record_derivatives(model, pk, field_name, variants_field, fieldfile.name, existing)
+        return
+    if not settings.IMAGE_DERIVATIVES_ASYNC:
+        generate_derivatives(instance, field_name, variants_field)
+        return
+
+    source_name = fieldfile.name
+    future = get_executor().submit(render, read_source(fieldfile))
+
+    def on_done(future):
+        try:
+            store_derivatives(model, pk, field_name, variants_field, source_name, future.result())
+        except Exception:
+            logger.exception("Generating derivatives for %s %s failed", model_label, pk)
+        finally:
+            # Runs on the pool's management thread, which Django never cleans up after
+            connections.close_all()
+
+    future.add_done_callback(on_done)
+
+
+def schedule_derivatives(instance, field_name, variants_field):
+    """Generate derivatives for ``instance`` once the current transaction commits"""
+    job = (instance._meta.label, instance.pk, field_name, variants_field)
+
+    def run():
+        try:
+            _run_job(*job)
+        except Exception:
+            logger.exception("Scheduling derivatives for %s %s failed", job[0], job[1])
+
+    transaction.on_commit(run)
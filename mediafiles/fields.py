@@ -0,0 +1,67 @@
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.template.defaultfilters import filesizeformat
+from rest_framework import serializers
+
+from .derivatives import variant_url
+from .imaging import EXTENSIONS, reencode
+
+
+class DerivativeImageField(serializers.ImageField):
+    """
+    Image field that renders the URL of a sized derivative instead of the original.
+
+    The size comes from ``variant`` or else the serializer context's
+    ``image_variant`` (default "full"); derivatives are read from the
+    ``<field>_variants`` column next to the image.
+    """
+
+    def __init__(self, variant=None, **kwargs):
+        self.variant = variant
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        variant = self.variant or self.context.get("image_variant", "full")
+        variants = getattr(value.instance, f"{value.field.name}_variants", None)
+        url = variant_url(value, variants, variant)
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+
+class ReencodedImageField(DerivativeImageField):
+    """
+    Accepts large uploads (streamed to a temp file past FILE_UPLOAD_MAX_MEMORY_SIZE)
+    and stores a compact re-encoding: upright, without EXIF, downscaled to
+    IMAGE_UPLOAD_MAX_DIMENSION and brought under IMAGE_UPLOAD_TARGET_BYTES.
+    """
+    default_error_messages = {
+        "too_large": "Files cannot be larger than {max_size}.",
+        "incompressible": "This image could not be compressed enough; please upload a smaller one.",
+    }
+
+    def to_internal_value(self, data):
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        if getattr(data, "size", 0) > max_size:
+            self.fail("too_large", max_size=filesizeformat(max_size))
+        upload = super().to_internal_value(data)
+
+        image_format = settings.IMAGE_UPLOAD_FORMAT
+        upload.seek(0)
+        try:
+            content = reencode(
+                upload,
+                settings.IMAGE_UPLOAD_MAX_DIMENSION,
+                settings.IMAGE_UPLOAD_TARGET_BYTES,
+                image_format=image_format,
+                max_pixels=settings.IMAGE_UPLOAD_MAX_PIXELS,
+            )
+        except (OSError, ValueError):
+            self.fail("invalid_image")
+        if content is None:
+            self.fail("incompressible")
+        stem, _ = os.path.splitext(os.path.basename(upload.name))
+        return ContentFile(content, name=f"{stem}{EXTENSIONS[image_format]}")
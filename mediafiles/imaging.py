@@ -0,0 +1,78 @@
+"""
+Pillow image operations.
+
+Deliberately free of Django imports so these functions can run inside
+worker processes started with the "spawn" method.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+OUTPUT_FORMAT = "WEBP"
+OUTPUT_EXTENSION = ".webp"
+
+EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg"}
+SAVE_OPTIONS = {"WEBP": {"method": 4}, "JPEG": {"optimize": True, "progressive": True}}
+# Never shrink below this on the long edge while chasing a byte target
+MIN_DIMENSION = 320
+
+
+def _open_normalized(source, largest_size, max_pixels=None):
+    """Decode the image (at reduced scale when the format allows it) upright and in RGB(A)"""
+    image = Image.open(source if hasattr(source, "read") else io.BytesIO(source))
+    if max_pixels and image.width * image.height > max_pixels:
+        raise ValueError("Image dimensions are too large.")
+    # JPEG can decode directly at 1/2, 1/4 or 1/8 scale, which saves most of the work and memory
+    image.draft("RGB", largest_size)
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    return image
+
+
+def _flatten(image):
+    """Composite transparency onto white for formats without an alpha channel"""
+    background = Image.new("RGB", image.size, "white")
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def reencode(source, max_dimension, target_bytes, image_format="WEBP",
+             qualities=(85, 75, 65, 55, 45), max_pixels=None):
+    """
+    Re-encode an uploaded image without its metadata, at most ``max_dimension``
+    on the long edge, stepping quality (then dimensions) down until the result
+    fits ``target_bytes``. Returns the encoded bytes, or None if it cannot fit.
+    """
+    image = _open_normalized(source, (max_dimension, max_dimension), max_pixels)
+    if image_format == "JPEG" and image.mode == "RGBA":
+        image = _flatten(image)
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    options = SAVE_OPTIONS.get(image_format, {})
+    while True:
+        for quality in qualities:
+            buffer = io.BytesIO()
+            # No exif=/icc_profile= passed, so camera metadata (GPS etc.) is dropped
+            image.save(buffer, image_format, quality=quality, **options)
+            if buffer.tell() <= target_bytes:
+                return buffer.getvalue()
+        if max(image.size) <= MIN_DIMENSION:
+            return None
+        image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)), Image.LANCZOS)
+
+
+def render_derivatives(data, sizes, quality=80):
+    """
+    Render one downscaled copy per entry of ``sizes`` ({name: (width, height)}).
+    Returns {name: encoded bytes}. Images are only ever shrunk, never enlarged.
+    """
+    largest = max(sizes.values())
+    source = _open_normalized(data, largest)
+    rendered = {}
+    for name, size in sizes.items():
+        image = source.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, OUTPUT_FORMAT, quality=quality, method=4)
+        rendered[name] = buffer.getvalue()
+    return rendered
@@ -0,0 +1,90 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+
+from mediafiles.derivatives import IMAGE_FIELDS, derivative_name
+from mediafiles.models import StoredBlob
+from mediafiles.storage import BLOB_PREFIX, ContentAddressedStorage
+
+
+class Command(BaseCommand):
+    help = "Move existing product/profile images into content-addressed storage, keeping one copy per unique file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report how much space would be saved.")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        legacy = {}  # legacy name -> (storage, size)
+        digests = {}
+        migrated = missing = 0
+
+        for model_label, field_name, variants_field in IMAGE_FIELDS:
+            model = apps.get_model(model_label)
+            storage = model._meta.get_field(field_name).storage
+            rows = (
+                model.objects.exclude(**{f"{field_name}__isnull": True})
+                .exclude(**{field_name: ""})
+                .exclude(**{f"{field_name}__startswith": f"{BLOB_PREFIX}/"})
+                .values_list("pk", field_name)
+            )
+            for pk, name in rows.iterator():
+                if not storage.exists(name):
+                    missing += 1
+                    self.stderr.write(f"{model_label} {pk}: {name} is missing")
+                    continue
+                if name not in legacy:
+                    legacy[name] = (storage, storage.size(name))
+                    with storage.open(name) as source:
+                        digests[name] = ContentAddressedStorage.content_hash(source)
+                if dry_run:
+                    continue
+                with storage.open(name) as source:
+                    blob_name = storage.save(name, source)
+                with transaction.atomic():
+                    # Derivatives are rebuilt below under the blob's name
+                    updated = model.objects.filter(pk=pk, **{field_name: name}).update(
+                        **{field_name: blob_name, variants_field: {}}
+                    )
+                    if updated:
+                        StoredBlob.acquire(blob_name)
+                        migrated += 1
+
+        total = sum(size for _, size in legacy.values())
+        unique = {digests[name]: size for name, (_, size) in legacy.items()}
+        if dry_run:
+            self.stdout.write(
+                f"{len(legacy)} file(s), {filesizeformat(total)}; "
+                f"{len(unique)} unique, {filesizeformat(sum(unique.values()))} after de-duplication."
+            )
+            return
+
+        reclaimed = 0
+        for name, (storage, size) in legacy.items():
+            if self.is_referenced(name):
+                continue
+            storage.delete(name)
+            reclaimed += size
+            for variant_name in self.derivative_names(name):
+                storage.delete(variant_name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {migrated} reference(s) into {len(unique)} blob(s); "
+            f"reclaimed {filesizeformat(reclaimed - sum(unique.values()))}. {missing} missing file(s)."
+        ))
+        if migrated:
+            call_command("generate_image_derivatives", stdout=self.stdout, stderr=self.stderr)
+
+    @staticmethod
+    def is_referenced(name):
+        return any(
+            apps.get_model(model_label).objects.filter(**{field_name: name}).exists()
+            for model_label, field_name, _ in IMAGE_FIELDS
+        )
+
+    @staticmethod
+    def derivative_names(name):
+        return [derivative_name(name, variant) for variant in settings.IMAGE_DERIVATIVES]
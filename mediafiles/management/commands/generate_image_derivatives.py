@@ -0,0 +1,57 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mediafiles.derivatives import IMAGE_FIELDS, read_source, render, store_derivatives
+
+
+class Command(BaseCommand):
+    help = "Generate sized derivatives for existing product and profile images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Regenerate rows that already have derivatives.")
+        parser.add_argument(
+            "--workers", type=int, default=settings.IMAGE_DERIVATIVE_WORKERS, help="Rendering processes."
+        )
+        parser.add_argument("--batch-size", type=int, default=50, help="Images read into memory at a time.")
+
+    def handle(self, *args, **options):
+        executor = ProcessPoolExecutor(
+            max_workers=options["workers"], mp_context=multiprocessing.get_context("spawn")
+        )
+        with executor:
+            for model_label, field_name, variants_field in IMAGE_FIELDS:
+                model = apps.get_model(model_label)
+                queryset = model.objects.exclude(**{field_name: ""}).exclude(**{f"{field_name}__isnull": True})
+                if not options["force"]:
+                    queryset = queryset.filter(**{variants_field: {}})
+                done, failed = self.process(executor, model, queryset, field_name, variants_field, options["batch_size"])
+                self.stdout.write(self.style.SUCCESS(f"{model_label}: {done} generated, {failed} failed."))
+
+    def process(self, executor, model, queryset, field_name, variants_field, batch_size):
+        done = failed = 0
+        rows = queryset.order_by("pk").only("pk", field_name).iterator(chunk_size=batch_size)
+        while True:
+            futures = {}
+            for instance in rows:
+                fieldfile = getattr(instance, field_name)
+                try:
+                    futures[executor.submit(render, read_source(fieldfile))] = (instance.pk, fieldfile.name)
+                except OSError as exc:
+                    failed += 1
+                    self.stderr.write(f"{model._meta.label} {instance.pk}: {exc}")
+                if len(futures) >= batch_size:
+                    break
+            if not futures:
+                return done, failed
+            for future in as_completed(futures):
+                pk, source_name = futures[future]
+                try:
+                    store_derivatives(model, pk, field_name, variants_field, source_name, future.result())
+                    done += 1
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"{model._meta.label} {pk}: {exc}")
@@ -0,0 +1,87 @@
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from mediafiles.derivatives import IMAGE_FIELDS, derivative_name
+from mediafiles.models import StoredBlob
+from mediafiles.storage import BLOB_PREFIX, blob_storage, is_blob_name
+
+
+class Command(BaseCommand):
+    help = "Delete content-addressed blobs (and their derivatives) that no image field references any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours",
+            type=int,
+            default=24,
+            help="Keep unreferenced blobs touched more recently than this (uploads still being saved).",
+        )
+        parser.add_argument(
+            "--recount",
+            action="store_true",
+            help="Rebuild reference counts from the tables and register untracked files first. "
+            "Run while uploads are quiet.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted.")
+
+    def handle(self, *args, **options):
+        if options["recount"]:
+            self.recount()
+
+        cutoff = timezone.now() - timedelta(hours=options["grace_hours"])
+        candidates = StoredBlob.objects.filter(ref_count=0, updated_at__lt=cutoff)
+        pruned = reclaimed = 0
+        for blob in candidates.iterator():
+            if options["dry_run"]:
+                pruned += 1
+                reclaimed += blob.size
+                continue
+            # Re-check under the delete itself in case the blob was referenced meanwhile
+            deleted, _ = StoredBlob.objects.filter(pk=blob.pk, ref_count=0, updated_at__lt=cutoff).delete()
+            if not deleted:
+                continue
+            for name in [blob.name] + [derivative_name(blob.name, variant) for variant in settings.IMAGE_DERIVATIVES]:
+                if blob_storage.exists(name):
+                    reclaimed += blob_storage.size(name)
+                    blob_storage.delete(name)
+            pruned += 1
+
+        verb = "Would prune" if options["dry_run"] else "Pruned"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {pruned} blob(s), {filesizeformat(reclaimed)}."))
+
+    def recount(self):
+        counts = Counter()
+        for model_label, field_name, _ in IMAGE_FIELDS:
+            names = apps.get_model(model_label).objects.filter(**{f"{field_name}__startswith": f"{BLOB_PREFIX}/"})
+            counts.update(names.values_list(field_name, flat=True).iterator())
+
+        tracked = set()
+        for blob in StoredBlob.objects.iterator():
+            tracked.add(blob.name)
+            if blob.ref_count != counts[blob.name]:
+                StoredBlob.objects.filter(pk=blob.pk).update(ref_count=counts[blob.name])
+
+        # Files whose upload transaction rolled back never got (or lost) their row
+        untracked = [
+            StoredBlob(name=name, size=blob_storage.size(name), ref_count=counts[name])
+            for name in self.walk(BLOB_PREFIX)
+            if is_blob_name(name) and name not in tracked
+        ]
+        StoredBlob.objects.bulk_create(untracked, ignore_conflicts=True)
+        self.stdout.write(f"Recounted references; registered {len(untracked)} untracked file(s).")
+
+    def walk(self, path):
+        if not blob_storage.exists(path):
+            return
+        directories, files = blob_storage.listdir(path)
+        for name in files:
+            yield os.path.join(path, name).replace(os.sep, "/")
+        for directory in directories:
+            yield from self.walk(os.path.join(path, directory))
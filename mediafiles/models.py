@@ -0,0 +1,45 @@
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+from .storage import is_blob_name
+
+
+class StoredBlob(models.Model):
+    """One content-addressed file and how many image fields point at it"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every upload and reference change; prune_media leaves recent blobs alone
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["ref_count", "updated_at"], name="storedblob_prune_idx")]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+    @classmethod
+    def register(cls, name, size):
+        """Record a freshly stored (or re-uploaded) blob"""
+        blob, created = cls.objects.get_or_create(name=name, defaults={"size": size})
+        if not created:
+            cls.objects.filter(pk=blob.pk).update(updated_at=timezone.now())
+
+    @classmethod
+    def acquire(cls, name):
+        if not is_blob_name(name):
+            return
+        updated = cls.objects.filter(name=name).update(ref_count=F("ref_count") + 1, updated_at=timezone.now())
+        if not updated:
+            # Row missing (e.g. pruned between upload and save); the file itself is still there
+            cls.objects.get_or_create(name=name, defaults={"ref_count": 1})
+
+    @classmethod
+    def release(cls, name):
+        if not is_blob_name(name):
+            return
+        cls.objects.filter(name=name, ref_count__gt=0).update(
+            ref_count=F("ref_count") - 1, updated_at=timezone.now()
+        )
@@ -0,0 +1,153 @@
+"""
+Fetch-once cache of resized remote images (e.g. deal banners).
+
+Each remote URL is downloaded at most once per cache lifetime, rendered to
+every configured size and kept on local disk. The cache is bounded by
+``max_bytes``; the least recently served files are evicted first (recency is
+the file mtime, refreshed on every hit).
+"""
+import hashlib
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from PIL import Image
+
+from .imaging import OUTPUT_EXTENSION, render_derivatives
+
+
+class RemoteImageError(Exception):
+    """The remote image could not be fetched or decoded"""
+
+
+class RemoteImageCache:
+    max_redirects = 3
+    # Misses for one URL serialize on one of these; a fixed pool, so memory stays flat
+    lock_stripes = 64
+
+    def __init__(self, directory, sizes, max_bytes, max_source_bytes, timeout, quality=80, allow_private_hosts=False):
+        self.directory = directory
+        self.sizes = sizes
+        self.max_bytes = max_bytes
+        self.max_source_bytes = max_source_bytes
+        self.timeout = timeout
+        self.quality = quality
+        self.allow_private_hosts = allow_private_hosts
+        self._locks = [threading.Lock() for _ in range(self.lock_stripes)]
+
+    @staticmethod
+    def digest(url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def path(self, url, size):
+        digest = self.digest(url)
+        return os.path.join(self.directory, digest[:2], f"{digest}_{size}{OUTPUT_EXTENSION}")
+
+    def get(self, url, size):
+        """Local path of ``url`` rendered at ``size``, fetching and rendering it on a miss"""
+        if size not in self.sizes:
+            raise KeyError(size)
+        path = self.path(url, size)
+        if self._touch(path):
+            return path
+        # One fetch per URL per process, however many requests miss at once
+        with self._lock_for(url):
+            if not self._touch(path):
+                self._fill(url)
+        return path
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _lock_for(self, url):
+        return self._locks[int(self.digest(url)[:8], 16) % self.lock_stripes]
+
+    def _fill(self, url):
+        data = self.fetch(url)
+        try:
+            rendered = render_derivatives(data, self.sizes, self.quality)
+        except (OSError, ValueError, Image.DecompressionBombError) as exc:
+            raise RemoteImageError(f"Not a usable image: {exc}") from exc
+        paths = set()
+        for size, content in rendered.items():
+            paths.add(self.path(url, size))
+            self._write(self.path(url, size), content)
+        self.evict(keep=paths)
+
+    def _write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as temp:
+            temp.write(content)
+        os.replace(temp_path, path)
+
+    def check_host(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise RemoteImageError("Only http(s) URLs can be proxied")
+        if self.allow_private_hosts:
+            return
+        try:
+            addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or 443)}
+        except socket.gaierror as exc:
+            raise RemoteImageError(f"Cannot resolve {parts.hostname}") from exc
+        for address in addresses:
+            if not ipaddress.ip_address(address.split("%")[0]).is_global:
+                raise RemoteImageError(f"{parts.hostname} resolves to a non-public address")
+
+    def fetch(self, url):
+        """Download the source image, following a few checked redirects, up to max_source_bytes"""
+        for _ in range(self.max_redirects + 1):
+            self.check_host(url)
+            try:
+                response = requests.get(url, timeout=self.timeout, stream=True, allow_redirects=False)
+            except requests.RequestException as exc:
+                raise RemoteImageError(str(exc)) from exc
+            with response:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers["Location"])
+                    continue
+                if response.status_code != 200:
+                    raise RemoteImageError(f"Upstream returned {response.status_code}")
+                if int(response.headers.get("Content-Length") or 0) > self.max_source_bytes:
+                    raise RemoteImageError("Upstream image is too large")
+                body = bytearray()
+                for chunk in response.iter_content(64 * 1024):
+                    body.extend(chunk)
+                    if len(body) > self.max_source_bytes:
+                        raise RemoteImageError("Upstream image is too large")
+                return bytes(body)
+        raise RemoteImageError("Too many redirects")
+
+    def evict(self, keep=()):
+        """Delete least recently served files (except ``keep``) until the cache fits max_bytes"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
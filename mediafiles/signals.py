@@ -0,0 +1,48 @@
+# mediafiles/signals.py
+from django.apps import apps
+from django.db.models.signals import post_delete, post_init, post_save
+
+from .derivatives import IMAGE_FIELDS, schedule_derivatives, tracked_fields
+from .models import StoredBlob
+
+
+def _file_name(instance, field_name):
+    value = instance.__dict__.get(field_name)
+    return getattr(value, "name", value) or ""
+
+
+def remember_image_names(sender, instance, **kwargs):
+    instance._loaded_image_names = {
+        field_name: _file_name(instance, field_name) for field_name, _ in tracked_fields(sender)
+    }
+
+
+def track_image_changes(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = {} if created else getattr(instance, "_loaded_image_names", {})
+    for field_name, variants_field in tracked_fields(sender):
+        name = _file_name(instance, field_name)
+        old_name = loaded.get(field_name, "")
+        if not created and name == old_name:
+            continue
+        StoredBlob.acquire(name)
+        StoredBlob.release(old_name)
+        if name:
+            schedule_derivatives(instance, field_name, variants_field)
+        elif getattr(instance, variants_field):
+            sender.objects.filter(pk=instance.pk).update(**{variants_field: {}})
+            setattr(instance, variants_field, {})
+    remember_image_names(sender, instance)
+
+
+def release_image_blobs(sender, instance, **kwargs):
+    for field_name, _ in tracked_fields(sender):
+        StoredBlob.release(_file_name(instance, field_name))
+
+
+for model_label in {label for label, _, _ in IMAGE_FIELDS}:
+    model = apps.get_model(model_label)
+    post_init.connect(remember_image_names, sender=model, dispatch_uid=f"remember_image_names_{model_label}")
+    post_save.connect(track_image_changes, sender=model, dispatch_uid=f"track_image_changes_{model_label}")
+    post_delete.connect(release_image_blobs, sender=model, dispatch_uid=f"release_image_blobs_{model_label}")
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = "blobs"
+# Files written under these prefixes keep the name they were given
+PASSTHROUGH_PREFIXES = ("derivatives/",)
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(f"{BLOB_PREFIX}/")
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each file as ``blobs/ab/cd/<sha256><ext>`` regardless of the name
+    it was uploaded under, so identical content is written only once and
+    shared by every row that references it. References are counted in
+    mediafiles.StoredBlob; unreferenced blobs are removed by ``prune_media``.
+    """
+
+    @staticmethod
+    def content_hash(content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        return digest.hexdigest()
+
+    def blob_name(self, digest, extension):
+        return f"{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension.lower()}"
+
+    def _save(self, name, content):
+        if name.startswith(PASSTHROUGH_PREFIXES):
+            return super()._save(name, content)
+        from .models import StoredBlob
+
+        name = self.blob_name(self.content_hash(content), os.path.splitext(name)[1])
+        if not self.exists(name):
+            self._write_blob(name, content)
+        StoredBlob.register(name, content.size)
+        return name
+
+    def _write_blob(self, name, content):
+        """
+        Write via a temp file linked into place, so readers never see a partial
+        blob. If a concurrent upload of the same content links first, its file
+        is kept: the name is the content, so there is never a suffixed copy.
+        """
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+            try:
+                os.link(temp_path, full_path)
+            except FileExistsError:
+                pass
+        finally:
+            os.unlink(temp_path)
+
+
+blob_storage = ContentAddressedStorage()
@@ -0,0 +1,334 @@
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from PIL import Image
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from store.models import Categories, Product, ProductImage
+from users.models import CustomUser, SellerProfile
+from . import derivatives
+from .fields import DerivativeImageField, ReencodedImageField
+from .imaging import reencode, render_derivatives
+from .models import StoredBlob
+from .storage import BLOB_PREFIX, blob_storage
+
+
+def image_bytes(size=(1000, 500), image_format="PNG", color="orange", **options):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def noise_bytes(size):
+    """Random pixels, which barely compress, as PNG"""
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def call_command_output(*args):
+    out = StringIO()
+    call_command(*args, stdout=out, stderr=StringIO())
+    return out.getvalue()
+
+
+def open_image(data):
+    return Image.open(io.BytesIO(data))
+
+
+class MediaTestCase(TestCase):
+    """Points MEDIA_ROOT at a throwaway directory"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, IMAGE_DERIVATIVES_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        seller_user = CustomUser.objects.create_user("seller@example.com", "pass", role="seller", is_active=True)
+        seller = SellerProfile.objects.create(user=seller_user, business_name="Shop", phone="1")
+        self.product = Product.objects.create(
+            title="Pie", unit_price=5, inventory=10, category=Categories.objects.create(title="Food"), vendor=seller
+        )
+
+    def add_image(self, data=None, name="photo.png"):
+        upload = SimpleUploadedFile(name, data or image_bytes(), content_type="image/png")
+        return ProductImage.objects.create(product=self.product, image=upload)
+
+
+class DerivativeTests(MediaTestCase):
+    def test_each_size_fits_its_box_and_is_never_enlarged(self):
+        rendered = render_derivatives(image_bytes((1000, 500)), {"small": (160, 160), "large": (1280, 1280)})
+        self.assertEqual(open_image(rendered["small"]).size, (160, 80))
+        self.assertEqual(open_image(rendered["large"]).size, (1000, 500))
+        self.assertEqual(open_image(rendered["small"]).format, "WEBP")
+
+    def test_derivatives_recorded_after_commit(self):
+        field = DerivativeImageField(variant="card")
+        with self.captureOnCommitCallbacks(execute=True):
+            image = self.add_image()
+            # Until they exist, readers get the original
+            self.assertEqual(field.to_representation(image.image), image.image.url)
+
+        image.refresh_from_db()
+        self.assertEqual(set(image.image_variants), {"thumbnail", "card", "full"})
+        self.assertTrue(field.to_representation(image.image).endswith("_card.webp"))
+        with image.image.storage.open(image.image_variants["thumbnail"]) as thumbnail:
+            self.assertEqual(Image.open(thumbnail).size, (160, 80))
+
+    def test_rows_sharing_a_blob_reuse_its_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.add_image()
+        with mock.patch.object(derivatives, "render") as render, self.captureOnCommitCallbacks(execute=True):
+            second = self.add_image(name="copy.png")
+        render.assert_not_called()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(second.image_variants, first.image_variants)
+
+    def test_process_pool_renders_outside_django(self):
+        self.addCleanup(setattr, derivatives, "_executor", None)
+        executor = derivatives.get_executor()
+        self.addCleanup(executor.shutdown)
+        rendered = executor.submit(derivatives.render, image_bytes((2000, 1000))).result(timeout=120)
+        self.assertEqual(open_image(rendered["full"]).size, (1280, 640))
+
+
+class StoredBlobTests(MediaTestCase):
+    def blob(self, name):
+        return StoredBlob.objects.get(name=name)
+
+    def blob_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), blob_storage.location)
+            for root, _, files in os.walk(os.path.join(blob_storage.location, BLOB_PREFIX)) for name in files
+        )
+
+    def prune(self, *args):
+        StoredBlob.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        return call_command_output("prune_media", *args)
+
+    def test_identical_uploads_share_one_counted_blob(self):
+        first = self.add_image(name="a.png")
+        second = self.add_image(name="b.png")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith(f"{BLOB_PREFIX}/"))
+        self.assertEqual(self.blob_files(), [first.image.name])
+        self.assertEqual(self.blob(first.image.name).ref_count, 2)
+
+        # Replacing one image moves its reference
+        shared = first.image.name
+        first.image = SimpleUploadedFile("c.png", image_bytes(color="blue"), content_type="image/png")
+        first.save()
+        self.assertEqual((self.blob(shared).ref_count, self.blob(first.image.name).ref_count), (1, 1))
+        # Saving without a change keeps the counts
+        first.position = 3
+        first.save()
+        self.assertEqual(self.blob(first.image.name).ref_count, 1)
+
+        ProductImage.objects.get(pk=first.pk).delete()
+        second.delete()
+        self.assertEqual(set(StoredBlob.objects.values_list("ref_count", flat=True)), {0})
+
+    def test_concurrent_upload_of_the_same_content_keeps_the_canonical_name(self):
+        name = self.add_image().image.name
+        # Another writer stored the blob between our existence check and our write
+        with mock.patch.object(blob_storage, "exists", return_value=False):
+            again = self.add_image(name="again.png")
+        self.assertEqual(again.image.name, name)
+        self.assertEqual(self.blob_files(), [name])
+        self.assertEqual(self.blob(name).ref_count, 2)
+
+    def test_prune_only_deletes_unreferenced_blobs(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            kept = self.add_image()
+            dropped = self.add_image(image_bytes(color="blue"))
+        dropped.refresh_from_db()
+        dropped_files = [dropped.image.name, *dropped.image_variants.values()]
+        kept.refresh_from_db()
+        dropped.delete()
+
+        # Within the grace period nothing goes
+        self.assertIn("Pruned 0 blob(s)", call_command_output("prune_media"))
+        self.assertIn("Would prune 1 blob(s)", self.prune("--dry-run"))
+        self.assertIn("Pruned 1 blob(s)", self.prune())
+        for name in dropped_files:
+            self.assertFalse(blob_storage.exists(name))
+        for name in [kept.image.name, *kept.image_variants.values()]:
+            self.assertTrue(blob_storage.exists(name))
+
+        # A drifted count is repaired by --recount before anything is deleted
+        StoredBlob.objects.filter(name=kept.image.name).update(ref_count=0)
+        self.assertIn("Pruned 0 blob(s)", self.prune("--recount"))
+        self.assertEqual(self.blob(kept.image.name).ref_count, 1)
+        self.assertTrue(blob_storage.exists(kept.image.name))
+
+    def test_dedupe_moves_legacy_files_into_shared_blobs(self):
+        legacy = FileSystemStorage()
+        data = image_bytes()
+        images = []
+        for name in ("products/one.png", "products/two.png"):
+            legacy.save(name, ContentFile(data))
+            image = self.add_image(image_bytes(color="blue"))
+            ProductImage.objects.filter(pk=image.pk).update(image=name)
+            images.append(image)
+
+        self.assertIn("2 file(s)", call_command_output("dedupe_media", "--dry-run"))
+        self.assertIn("1 unique", call_command_output("dedupe_media", "--dry-run"))
+        with mock.patch("mediafiles.management.commands.dedupe_media.call_command") as regenerate:
+            output = call_command_output("dedupe_media")
+        regenerate.assert_called_once()
+        self.assertIn("Moved 2 reference(s) into 1 blob(s)", output)
+
+        names = set(ProductImage.objects.filter(pk__in=[i.pk for i in images]).values_list("image", flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(name.startswith(f"{BLOB_PREFIX}/"))
+        self.assertEqual(self.blob(name).ref_count, 2)
+        self.assertFalse(legacy.exists("products/one.png"))
+        self.assertFalse(legacy.exists("products/two.png"))
+
+
+class ServeMediaTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            image = self.add_image()
+        image.refresh_from_db()
+        self.blob_name = image.image.name
+        self.derivative_name = image.image_variants["thumbnail"]
+        self.data = image_bytes()
+
+    def get(self, name, **headers):
+        return self.client.get(f"/media/{name}", headers=headers)
+
+    def test_blob_served_immutable(self):
+        response = self.get(self.blob_name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("immutable", response["Cache-Control"])
+
+    @override_settings(MEDIA_CACHE_SECONDS=60)
+    def test_derivative_not_immutable_and_revalidated_after_rerender(self):
+        response = self.get(self.derivative_name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "public, max-age=60")
+        etag = response["ETag"]
+        self.assertEqual(self.get(self.derivative_name, if_none_match=etag).status_code, 304)
+
+        # Re-rendered under the same name: the old validator no longer matches
+        path = blob_storage.path(self.derivative_name)
+        with open(path, "ab") as handle:
+            handle.write(b"\0")
+        os.utime(path, (0, 0))
+        self.assertEqual(self.get(self.derivative_name, if_none_match=etag).status_code, 200)
+
+    def test_conditional_request_not_modified(self):
+        etag = self.get(self.blob_name)["ETag"]
+        response = self.get(self.blob_name, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertIn("immutable", response["Cache-Control"])
+
+    def test_byte_ranges(self):
+        size = len(self.data)
+        response = self.get(self.blob_name, range="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.data[10:20])
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{size}")
+        self.assertEqual(response["Content-Length"], "10")
+
+        suffix = self.get(self.blob_name, range="bytes=-5")
+        self.assertEqual(b"".join(suffix.streaming_content), self.data[-5:])
+
+        response = self.get(self.blob_name, range=f"bytes={size}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{size}")
+
+        # A stale If-Range gets the whole file
+        response = self.get(self.blob_name, range="bytes=10-19", if_range='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_sendfile_backends_only_send_headers(self):
+        with override_settings(MEDIA_SENDFILE_BACKEND="nginx", MEDIA_SENDFILE_ROOT="/protected-media/"):
+            response = self.get(self.blob_name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.blob_name}")
+        self.assertIn("immutable", response["Cache-Control"])
+
+        with override_settings(MEDIA_SENDFILE_BACKEND="xsendfile"):
+            response = self.get(self.derivative_name)
+        self.assertEqual(response["X-Sendfile"], blob_storage.path(self.derivative_name))
+        self.assertNotIn("immutable", response["Cache-Control"])
+
+    def test_missing_and_escaping_paths_404(self):
+        self.assertEqual(self.get("blobs/00/00/missing.png").status_code, 404)
+        self.assertEqual(self.get("../settings.py").status_code, 404)
+        self.assertEqual(self.client.post(f"/media/{self.blob_name}").status_code, 405)
+
+
+class ReencodeTests(TestCase):
+    def test_downscaled_to_the_maximum_dimension(self):
+        encoded = reencode(io.BytesIO(image_bytes((3000, 1500))), 1600, 1024 * 1024)
+        self.assertEqual(open_image(encoded).size, (1600, 800))
+        self.assertEqual(open_image(encoded).format, "WEBP")
+
+    def test_quality_then_size_stepped_down_to_the_target(self):
+        source = noise_bytes((1000, 1000))
+        roomy = reencode(io.BytesIO(source), 1000, 10 * 1024 * 1024)
+        self.assertEqual(open_image(roomy).size, (1000, 1000))
+
+        target = 60 * 1024
+        tight = reencode(io.BytesIO(source), 1000, target, image_format="JPEG")
+        self.assertLessEqual(len(tight), target)
+        self.assertLess(open_image(tight).width, 1000)
+        self.assertEqual(open_image(tight).format, "JPEG")
+
+        # Never below MIN_DIMENSION: gives up instead
+        self.assertIsNone(reencode(io.BytesIO(source), 1000, 100))
+
+    def test_exif_applied_then_stripped(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees
+        exif[0x010F] = "PhoneMaker"  # Make
+        source = image_bytes((400, 200), "JPEG", exif=exif.tobytes())
+        self.assertIn(0x010F, open_image(source).getexif())
+
+        for image_format in ("WEBP", "JPEG"):
+            encoded = open_image(reencode(io.BytesIO(source), 1600, 1024 * 1024, image_format=image_format))
+            self.assertEqual(encoded.size, (200, 400))
+            self.assertEqual(dict(encoded.getexif()), {})
+            self.assertNotIn("exif", encoded.info)
+
+    def test_oversized_pixel_counts_refused(self):
+        with self.assertRaises(ValueError):
+            reencode(io.BytesIO(image_bytes((1000, 1000))), 1600, 1024, max_pixels=500_000)
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1024 * 1024, IMAGE_UPLOAD_TARGET_BYTES=100 * 1024)
+    def test_upload_field_stores_a_compact_reencoding(self):
+        field = ReencodedImageField()
+        upload = SimpleUploadedFile("menu photo.png", noise_bytes((400, 400)), content_type="image/png")
+        self.assertGreater(upload.size, 100 * 1024)
+        stored = field.to_internal_value(upload)
+        self.assertEqual(stored.name, "menu photo.webp")
+        self.assertLessEqual(stored.size, 100 * 1024)
+
+        huge = SimpleUploadedFile("huge.png", b"x" * (1024 * 1024 + 1), content_type="image/png")
+        with self.assertRaises(ValidationError) as raised:
+            field.to_internal_value(huge)
+        self.assertIn("cannot be larger than", str(raised.exception.detail[0]))
@@ -0,0 +1,131 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .storage import is_blob_name
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def is_content_hashed(path):
+    """
+    Blobs never change under the same name. Derivatives are named after their
+    blob but are re-rendered in place (``--force``, changed IMAGE_DERIVATIVES),
+    so they get ordinary validators and the short lifetime.
+    """
+    return is_blob_name(path)
+
+
+def file_etag(path, stat):
+    if is_content_hashed(path):
+        return quote_etag(posixpath.splitext(posixpath.basename(path))[0])
+    return quote_etag(f"{int(stat.st_mtime):x}-{stat.st_size:x}")
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single satisfiable byte range, None to send it all, or False if unsatisfiable"""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        # Multiple or malformed ranges: fall back to the whole file
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), int(last) if last else size - 1
+    else:
+        start, end = max(0, size - int(last)), size - 1
+    if start >= size or start > end:
+        return False
+    return start, min(end, size - 1)
+
+
+def read_range(path, start, length):
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve a file from MEDIA_ROOT.
+
+    With MEDIA_SENDFILE_BACKEND set, only headers are produced and the front
+    server streams the file (X-Sendfile for Apache/lighttpd, X-Accel-Redirect
+    for nginx). Otherwise the file is streamed from here with validators,
+    long-lived caching for content-hashed names and single byte-range support.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("File not found")
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404("File not found")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found")
+
+    etag = file_etag(path, stat)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return with_cache_headers(not_modified, path, etag, stat)
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or "application/octet-stream"
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    if backend:
+        response = HttpResponse(content_type=content_type)
+        if backend == "nginx":
+            response["X-Accel-Redirect"] = settings.MEDIA_SENDFILE_ROOT.rstrip("/") + "/" + path.lstrip("/")
+        else:
+            response["X-Sendfile"] = full_path
+        return with_cache_headers(response, path, etag, stat)
+
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if range_header and request.headers.get("If-Range", etag) == etag:
+        byte_range = parse_range(range_header, stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416, content_type=content_type)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+        return with_cache_headers(response, path, etag, stat)
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(full_path, start, end - start + 1), status=206, content_type=content_type
+        )
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    else:
+        # FileResponse lets the WSGI server use its file wrapper (sendfile where available)
+        response = FileResponse(open(full_path, "rb"), content_type=content_type)
+    if encoding:
+        response["Content-Encoding"] = encoding
+    return with_cache_headers(response, path, etag, stat)
+
+
+def with_cache_headers(response, path, etag, stat):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    response["Accept-Ranges"] = "bytes"
+    if is_content_hashed(path):
+        response["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response["Cache-Control"] = f"public, max-age={settings.MEDIA_CACHE_SECONDS}"
+    return response
@@ -1,34 +1,90 @@
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.conf import settings
 from rest_framework import generics, permissions
 from rest_framework.response import Response
 from .models import Notification, UserDevice
-from .serializers import NotificationSerializer
-from rest_framework.pagination import PageNumberPagination
+from .serializers import BroadcastNotificationSerializer, InboxEntrySerializer, NotificationSerializer
+from . import inbox, topics
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.utils.urls import replace_query_param
 from .utils import notify_user
 from store.models import Order, Review 
-from .serializers import SuccessResponseSerializer
+from .serializers import StreamTicketSerializer, SuccessResponseSerializer, UnreadCountSerializer
+from .stream import issue_ticket
 from .serializers import UserDeviceSerializer
 
 
-class NotificationPagination(PageNumberPagination):
+class InboxCursorPagination(BasePagination):
+    """
+    Keyset pagination over the merged inbox: ?cursor= carries the position of
+    the last entry on the previous page, so no page runs COUNT(*) or OFFSET.
+    """
     page_size = 10
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_inbox(self, request, notification_type=None):
+        self.request = request
+        entries, has_next = inbox.inbox_page(
+            request.user, notification_type, self.decode_cursor(request), self.page_size
+        )
+        self.next_position = inbox.position(entries[-1]) if has_next else None
+        return entries
+
+    def encode_cursor(self, position):
+        created_at, kind, pk = position
+        token = urlsafe_b64encode(f"{created_at.isoformat()}|{kind}|{pk}".encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            created_at, kind, pk = urlsafe_b64decode(token.encode()).decode().split('|')
+            position = datetime.fromisoformat(created_at), kind, int(pk)
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if kind not in (inbox.PERSONAL, inbox.BROADCAST):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.encode_cursor(self.next_position) if self.next_position else None,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
 
 class NotificationListAPI(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = NotificationPagination
+    pagination_class = InboxCursorPagination
 
-    def get_queryset(self):
-        queryset = Notification.objects.filter(user=self.request.user).order_by('-created_at')
-        notification_type = self.request.query_params.get('type')
-        if notification_type:
-            queryset = queryset.filter(notification_type=notification_type)
-        return queryset
+    def list(self, request, *args, **kwargs):
+        # Personal notifications and broadcasts, merged newest first
+        entries = self.paginator.paginate_inbox(request, request.query_params.get('type'))
+        serializer = InboxEntrySerializer(entries, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
 
 class NotificationDetailAPI(generics.RetrieveUpdateAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user)
+        return Notification.objects.filter(user=self.request.user).select_related('order_details')
 
 
     def perform_update(self, serializer):
@@ -43,12 +99,44 @@ class NotificationDetailAPI(generics.RetrieveUpdateAPIView):
     #         )
     #     return queryset
 
+class BroadcastDetailAPI(generics.RetrieveUpdateAPIView):
+    serializer_class = BroadcastNotificationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        cursor = inbox.get_cursor(self.request.user)
+        return inbox.with_read_state(inbox.visible_broadcasts(self.request.user, cursor), cursor)
+
+    def perform_update(self, serializer):
+        inbox.mark_broadcast_read(self.request.user, serializer.instance)
+        serializer.instance.is_read = True
+
+class UnreadCountAPI(generics.GenericAPIView):
+    """Badge count without listing the inbox"""
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = UnreadCountSerializer
+
+    def get(self, request):
+        return Response({'unread_count': inbox.unread_count(request.user)})
+
+class StreamTicketAPI(generics.GenericAPIView):
+    """Short-lived ticket for opening the notification stream from EventSource, which cannot send headers"""
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = StreamTicketSerializer
+
+    def post(self, request):
+        return Response({
+            'ticket': issue_ticket(request.user),
+            'expires_in': settings.NOTIFICATION_STREAM_TICKET_SECONDS,
+        })
+
 class MarkAllAsReadAPI(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = SuccessResponseSerializer
     
     def post(self, request):
         count = Notification.objects.mark_all_as_read(request.user)
+        count += inbox.mark_all_broadcasts_read(request.user)
         return Response({'status': 'success', 'marked_read': count})
     
     
@@ -107,6 +195,7 @@ class ClearAllNotificationsAPI(generics.GenericAPIView):
 
     def delete(self, request):
         deleted, _ = Notification.objects.filter(user=request.user).delete()
+        deleted += inbox.clear_broadcasts(request.user)
         return Response({'status': 'success', 'deleted': deleted})
 class DeviceRegistrationAPI(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -124,11 +213,15 @@ class DeviceRegistrationAPI(generics.GenericAPIView):
         ).delete()
         
         device = serializer.save(user=request.user)
+        # Queue the device's topic subscriptions; sync_push_topics applies them
+        topics.refresh_device(device)
         return Response({"status": "Device registered"}, status=201)
 
     def delete(self, request):
         token = request.data.get('token')
-        UserDevice.objects.filter(user=request.user, token=token).delete()
+        deleted, _ = UserDevice.objects.filter(user=request.user, token=token).delete()
+        if deleted:
+            topics.release_token(token)
         return Response({"status": "Device unregistered"})
 class OrderNotificationsAPI(generics.ListAPIView):
     serializer_class = NotificationSerializer
@@ -136,4 +229,8 @@ class OrderNotificationsAPI(generics.ListAPIView):
 
     def get_queryset(self):
         order_id = self.kwargs['order_id']
-        return Notification.objects.filter(user=self.request.user, payload__order_id=order_id)
+        # Indexed on (order, -created_at) instead of scanning payload JSON
+        return (
+            Notification.objects.filter(order_id=order_id, user=self.request.user)
+            .select_related('order_details').order_by('-created_at')
+        )
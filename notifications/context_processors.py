@@ -1,12 +1,14 @@
+from django.utils.functional import SimpleLazyObject
+
+from .inbox import unread_count
 from .models import Notification
 
 def unread_notifications(request):
     if request.user.is_authenticated:
-        unread_qs = Notification.objects.unread().filter(user=request.user)
+        user = request.user
+        # Both stay lazy: pages that don't show the badge run no queries
         return {
-               'unread_notifications': unread_qs[:5],
-               'unread_count': unread_qs.count()
-            # 'unread_notifications': Notification.objects.unread().filter(user=request.user)[:5],
-            # 'unread_count': Notification.objects.unread().filter(user=request.user).count()
+            'unread_notifications': Notification.objects.unread().filter(user=user)[:5],
+            'unread_count': SimpleLazyObject(lambda: unread_count(user)),
         }
-    return {}
\ No newline at end of file
+    return {}
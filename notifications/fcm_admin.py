@@ -1,64 +1,112 @@
 import requests
-import json
 import os
-import logging
-from google.oauth2 import service_account
-from google.auth.transport.requests import Request
 from django.conf import settings
-
-logger = logging.getLogger(__name__)
+from .fcm_credentials import get_credential_cache, metrics
 
 SERVICE_ACCOUNT_PATH = os.path.join(settings.BASE_DIR, "Push-notifications-key.json")
-PROJECT_ID = "kwick-6315e"  # You can also use settings.FIREBASE_PROJECT_ID if set
+FCM_SCOPES = ["https://www.googleapis.com/auth/firebase.messaging"]
 
-def send_push_notification(device_tokens, title, body, data=None):
-    try:
-        # Authenticate using service account
-        credentials = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_PATH,
-            scopes=["https://www.googleapis.com/auth/firebase.messaging"]
-        )
-        credentials.refresh(Request())
-        access_token = credentials.token
-
-        # Convert all payload data values to strings
-        data = {k: str(v) for k, v in (data or {}).items()}
-
-        # Firebase endpoint and headers
-        url = f"https://fcm.googleapis.com/v1/projects/{PROJECT_ID}/messages:send"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
+# Per-token outcomes of a send
+SENT = "sent"
+INVALID_TOKEN = "invalid_token"  # device should be forgotten
+RETRY = "retry"  # transient: try again later
+FAILED = "failed"  # permanent for this message, but the token is fine
+
+INVALID_TOKEN_ERRORS = {"UNREGISTERED", "INVALID_ARGUMENT", "NOT_FOUND", "SENDER_ID_MISMATCH"}
+# Per-token errors from the topic membership (IID) API that mean the token is gone
+INVALID_IID_ERRORS = {"NOT_FOUND", "INVALID_ARGUMENT"}
+IID_MAX_TOKENS = 1000  # registration tokens per batchAdd/batchRemove call
+
+
+def get_access_token():
+    """OAuth token for FCM from the process-wide cache (FCM_ACCESS_TOKEN skips the service account)"""
+    return get_credential_cache().token()
+
+
+def fcm_send_url():
+    return settings.FCM_SEND_URL.format(project_id=settings.FCM_PROJECT_ID)
+
+
+def send_to_token(session, access_token, token, title, body, data):
+    """Send one message to a device; returns (outcome, detail)"""
+    return _send(session, access_token, {"token": token}, title, body, data)
+
+
+def send_to_topic(session, access_token, topic, title, body, data):
+    """Send one message to every device subscribed to a topic; returns (outcome, detail)"""
+    outcome, detail = _send(session, access_token, {"topic": topic}, title, body, data)
+    # No token involved: an invalid topic message is just a failed message
+    return (FAILED if outcome == INVALID_TOKEN else outcome), detail
+
+
+def _send(session, access_token, target, title, body, data):
+    message = {
+        "message": {
+            **target,
+            "notification": {
+                "title": title,
+                "body": body
+            },
+            # FCM only accepts string values in data
+            "data": {k: str(v) for k, v in (data or {}).items()}
         }
+    }
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+    metrics.incr("sends")
+    try:
+        response = session.post(fcm_send_url(), headers=headers, json=message, timeout=settings.FCM_TIMEOUT)
+    except requests.RequestException as exc:
+        metrics.incr("send_errors")
+        return RETRY, str(exc)
+
+    if response.status_code == 200:
+        return SENT, ""
+    metrics.incr("send_errors")
+    if response.status_code == 401:
+        # Token revoked or expired early: the next send mints a fresh one
+        get_credential_cache().invalidate(access_token)
+    detail = f"{response.status_code} - {response.text[:500]}"
+    try:
+        error = response.json().get("error", {})
+    except ValueError:
+        error = {}
+    error_codes = {str(error.get("status", "")).upper()} | {
+        str(item.get("errorCode", "")).upper() for item in error.get("details", []) if isinstance(item, dict)
+    }
+    if response.status_code in (401, 429) or response.status_code >= 500:
+        return RETRY, detail
+    if error_codes & INVALID_TOKEN_ERRORS:
+        return INVALID_TOKEN, detail
+    return FAILED, detail
+
+
+def iid_batch(session, access_token, action, topic, tokens):
+    """
+    Subscribe ("batchAdd") or unsubscribe ("batchRemove") up to IID_MAX_TOKENS
+    tokens. Returns (RETRY, detail) when the call itself failed, else
+    (SENT, errors) with one error code or None per token.
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+        "access_token_auth": "true",
+    }
+    body = {"to": f"/topics/{topic}", "registration_tokens": list(tokens)}
+    metrics.incr("topic_syncs")
+    try:
+        response = session.post(f"{settings.FCM_IID_URL}:{action}", headers=headers, json=body, timeout=settings.FCM_TIMEOUT)
+    except requests.RequestException as exc:
+        return RETRY, str(exc)
+    if response.status_code != 200:
+        if response.status_code == 401:
+            get_credential_cache().invalidate(access_token)
+        return RETRY, f"{response.status_code} - {response.text[:500]}"
+    try:
+        results = response.json().get("results", [])
+    except ValueError:
+        return RETRY, f"unreadable response: {response.text[:500]}"
+    return SENT, [(result or {}).get("error") for result in results]
 
-        for token in device_tokens:
-            message = {
-                "message": {
-                    "token": token,
-                    "notification": {
-                        "title": title,
-                        "body": body
-                    },
-                    "data": data
-                }
-            }
-
-            response = requests.post(url, headers=headers, json=message)
-
-            if response.status_code == 200:
-                logger.info(f"Push sent to {token}")
-            else:
-                logger.warning(f"Failed to send push to {token}: {response.status_code} - {response.text}")
-                
-                try:
-                    # Parse error from FCM response
-                    error_status = response.json().get("error", {}).get("status", "").upper()
-                    if error_status in ["UNREGISTERED", "INVALID_ARGUMENT", "NOT_FOUND"]:
-                        from .models import UserDevice
-                        UserDevice.objects.filter(token=token).delete()
-                        logger.info(f"Deleted invalid token: {token}")
-                except Exception as parse_err:
-                    logger.warning(f"Could not parse FCM response JSON: {parse_err}")
-
-    except Exception as e:
-        logger.error(f"Error sending push notification: {str(e)}")
@@ -0,0 +1,79 @@
+"""
+Pooled, concurrent FCM delivery.
+
+One keep-alive HTTP session (pool sized to FCM_MAX_CONCURRENCY) and one
+bounded thread pool per process, so a fan-out to many devices reuses warm
+TLS connections and runs its round trips in parallel instead of serially.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+from . import fcm_admin
+
+
+class Topic(NamedTuple):
+    """A send target naming an FCM topic instead of a device token"""
+    name: str
+
+
+class FCMClient:
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="fcm-send")
+
+    def send_many(self, messages, access_token=None):
+        """
+        Send (target, title, body, data) tuples concurrently; a target is a
+        device token or a Topic. Returns [(target, outcome, detail)] in input order.
+        """
+        messages = list(messages)
+        if not messages:
+            return []
+        access_token = access_token or fcm_admin.get_access_token()
+
+        def send(message):
+            target, title, body, data = message
+            if isinstance(target, Topic):
+                return (target, *fcm_admin.send_to_topic(self.session, access_token, target.name, title, body, data))
+            return (target, *fcm_admin.send_to_token(self.session, access_token, target, title, body, data))
+
+        if len(messages) == 1:
+            return [send(messages[0])]
+        return list(self.executor.map(send, messages))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_fcm_client():
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            _client = FCMClient(settings.FCM_MAX_CONCURRENCY)
+        return _client
+
+
+@receiver(setting_changed)
+def reset_fcm_client(setting, **kwargs):
+    global _client
+    if setting == "FCM_MAX_CONCURRENCY" and _client is not None:
+        _client.close()
+        _client = None
@@ -0,0 +1,149 @@
+"""
+Process-wide FCM OAuth token cache.
+
+The service-account file is read once and its access token reused until
+FCM_TOKEN_REFRESH_MARGIN seconds before it expires. Inside that margin one
+caller refreshes while the rest keep using the still-valid token; only an
+expired token makes callers wait. With FCM_CREDENTIAL_CACHE set to a Django
+cache alias (e.g. a shared Redis cache), workers also reuse each other's
+tokens instead of each minting their own.
+"""
+import threading
+import time
+from collections import Counter
+from datetime import timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+SHARED_TOKEN_KEY = "notifications:fcm:access-token"
+
+
+class Counters:
+    """Thread-safe counters (token refreshes, sends, ...) for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+metrics = Counters()
+
+
+def service_account_loader(path, scopes):
+    """Loader minting tokens from a service-account key file read once"""
+    from google.auth.transport.requests import Request
+    from google.oauth2 import service_account
+
+    credentials = service_account.Credentials.from_service_account_file(path, scopes=scopes)
+
+    def load():
+        credentials.refresh(Request())
+        if credentials.expiry is None:
+            return credentials.token, time.time() + 3600
+        # google-auth reports expiry as naive UTC
+        return credentials.token, credentials.expiry.replace(tzinfo=timezone.utc).timestamp()
+
+    return load
+
+
+def static_loader(token):
+    return lambda: (token, float("inf"))
+
+
+class CredentialCache:
+    def __init__(self, loader, refresh_margin=300, shared_cache=None):
+        self._loader = loader
+        self.refresh_margin = refresh_margin
+        self.shared_cache = shared_cache
+        self._lock = threading.Lock()
+        self._token = None
+        self._expiry = 0.0
+
+    def token(self):
+        token, expiry = self._token, self._expiry
+        now = time.time()
+        if token and now < expiry - self.refresh_margin:
+            return token
+        if token and now < expiry:
+            # Refresh ahead of expiry without stalling concurrent senders
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._refresh()
+                finally:
+                    self._lock.release()
+            return self._token
+        with self._lock:
+            if not self._token or time.time() >= self._expiry - self.refresh_margin:
+                self._refresh()
+            return self._token
+
+    def invalidate(self, token=None):
+        """Drop the cached token (e.g. after FCM rejected it with 401)"""
+        with self._lock:
+            if token is None or token == self._token:
+                self._token, self._expiry = None, 0.0
+                if self.shared_cache is not None:
+                    self.shared_cache.delete(SHARED_TOKEN_KEY)
+
+    def _refresh(self):
+        now = time.time()
+        if self.shared_cache is not None:
+            shared = self.shared_cache.get(SHARED_TOKEN_KEY)
+            if shared and now < shared[1] - self.refresh_margin and shared[0] != self._token:
+                self._token, self._expiry = shared
+                metrics.incr("token_shared_hits")
+                return
+        token, expiry = self._loader()
+        self._token, self._expiry = token, expiry
+        metrics.incr("token_refreshes")
+        if self.shared_cache is not None and expiry != float("inf"):
+            timeout = int(expiry - now - self.refresh_margin)
+            if timeout > 0:
+                self.shared_cache.set(SHARED_TOKEN_KEY, (token, expiry), timeout)
+
+
+_credential_cache = None
+_credential_cache_lock = threading.Lock()
+
+
+def get_credential_cache():
+    global _credential_cache
+    if _credential_cache is not None:
+        return _credential_cache
+    with _credential_cache_lock:
+        if _credential_cache is None:
+            from .fcm_admin import FCM_SCOPES, SERVICE_ACCOUNT_PATH
+
+            if settings.FCM_ACCESS_TOKEN:
+                loader = static_loader(settings.FCM_ACCESS_TOKEN)
+            else:
+                loader = service_account_loader(SERVICE_ACCOUNT_PATH, FCM_SCOPES)
+            alias = settings.FCM_CREDENTIAL_CACHE
+            _credential_cache = CredentialCache(
+                loader,
+                refresh_margin=settings.FCM_TOKEN_REFRESH_MARGIN,
+                shared_cache=caches[alias] if alias else None,
+            )
+        return _credential_cache
+
+
+@receiver(setting_changed)
+def reset_credential_cache(setting, **kwargs):
+    global _credential_cache
+    if setting.startswith("FCM_"):
+        _credential_cache = None
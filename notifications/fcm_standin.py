@@ -0,0 +1,134 @@
+"""
+Local stand-in for the FCM HTTP v1 send endpoint and the IID topic membership
+API, for tests and benchmarks.
+
+Point FCM_SEND_URL at ``server.send_url``, FCM_IID_URL at ``server.iid_url``
+and FCM_ACCESS_TOKEN at the token it expects. Accepted messages (to a token or
+a topic) are recorded in ``server.messages`` and topic members in
+``server.topics``; tokens listed in ``server.unregistered`` get FCM's
+UNREGISTERED (or NOT_FOUND, for membership) error and ``server.fail_next``
+makes the next N requests return 503.
+"""
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEND_PATH_RE = re.compile(r"^/v1/projects/(?P<project>[^/]+)/messages:send$")
+IID_PATH_RE = re.compile(r"^/iid/v1:(?P<action>batchAdd|batchRemove)$")
+
+
+class FCMStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), access_token="test-token", latency=0.0):
+        super().__init__(address, FCMRequestHandler)
+        self.access_token = access_token
+        self.latency = latency
+        self.messages = []
+        self.topics = defaultdict(set)
+        self.unregistered = set()
+        self.fail_next = 0
+        self.requests = 0
+        self.iid_requests = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def send_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/projects/{{project_id}}/messages:send"
+
+    @property
+    def iid_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/iid/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def respond(self, path, headers, body):
+        """(status, payload) for one send or membership request"""
+        with self.lock:
+            self.requests += 1
+        iid = IID_PATH_RE.match(path)
+        if not iid and not SEND_PATH_RE.match(path):
+            return 404, {"error": {"code": 404, "status": "NOT_FOUND", "message": "Unknown endpoint"}}
+        if self.access_token and headers.get("Authorization") != f"Bearer {self.access_token}":
+            return 401, {"error": {"code": 401, "status": "UNAUTHENTICATED"}}
+        if iid:
+            return self.membership(iid["action"], body)
+        try:
+            message = json.loads(body)["message"]
+            token = message.get("token")
+            if token is None and not message["topic"]:
+                raise KeyError("topic")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return 400, {"error": {"code": 400, "status": "INVALID_ARGUMENT"}}
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return 503, {"error": {"code": 503, "status": "UNAVAILABLE"}}
+            if token is not None and token in self.unregistered:
+                return 404, {"error": {
+                    "code": 404,
+                    "status": "NOT_FOUND",
+                    "details": [{"@type": "type.googleapis.com/google.firebase.fcm.v1.FcmError",
+                                 "errorCode": "UNREGISTERED"}],
+                }}
+            self.messages.append(message)
+            return 200, {"name": f"projects/stand-in/messages/{len(self.messages)}"}
+
+    def membership(self, action, body):
+        try:
+            request = json.loads(body)
+            topic = request["to"].removeprefix("/topics/")
+            tokens = list(request["registration_tokens"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return 400, {"error": "InvalidParameters"}
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.iid_requests += 1
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return 503, {"error": "Unavailable"}
+            results = []
+            for token in tokens:
+                if token in self.unregistered:
+                    results.append({"error": "NOT_FOUND"})
+                    continue
+                if action == "batchAdd":
+                    self.topics[topic].add(token)
+                else:
+                    self.topics[topic].discard(token)
+                results.append({})
+            return 200, {"results": results}
+
+
+class FCMRequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so pooled clients reuse connections as they would against FCM
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        status, payload = self.server.respond(self.path, self.headers, body)
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
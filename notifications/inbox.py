@@ -0,0 +1,178 @@
+"""
+A user's inbox: their personal notifications merged with the broadcasts
+addressed to their audience.
+
+Broadcasts are written once (fan-out on read) and never copied per user.
+Whether a broadcast is read or cleared comes from the user's BroadcastCursor,
+so marking everything read or clearing the inbox is one row update no matter
+how many broadcasts there are. A user only sees broadcasts sent after they
+joined, as they would have with one row per existing user.
+"""
+from django.db import models, transaction
+from django.db.models import Case, Max, Q, Value, When
+from django.utils import timezone
+
+from .models import BroadcastCursor, BroadcastNotification, Notification, UnreadCounter
+
+PERSONAL = 'personal'
+BROADCAST = 'broadcast'
+
+
+def audiences_for(user):
+    from users.models import CustomUser
+
+    role_audience = {
+        CustomUser.SELLER: BroadcastNotification.SELLERS,
+        CustomUser.CUSTOMER: BroadcastNotification.CUSTOMERS,
+    }.get(user.role)
+    return [BroadcastNotification.ALL] + ([role_audience] if role_audience else [])
+
+
+def get_cursor(user):
+    """The user's cursor; unsaved (nothing read or cleared) if they never touched a broadcast"""
+    try:
+        return user.broadcast_cursor
+    except BroadcastCursor.DoesNotExist:
+        return BroadcastCursor(user=user)
+
+
+def _locked_cursor(user):
+    """
+    The user's cursor row, created if needed and locked for the current
+    transaction, so concurrent requests neither collide on the first insert
+    nor lose each other's read_ids
+    """
+    BroadcastCursor.objects.get_or_create(user=user)
+    cursor = BroadcastCursor.objects.select_for_update().get(user=user)
+    user.broadcast_cursor = cursor
+    return cursor
+
+
+def visible_broadcasts(user, cursor=None):
+    cursor = cursor or get_cursor(user)
+    queryset = BroadcastNotification.objects.filter(
+        audience__in=audiences_for(user),
+        created_at__gte=user.date_joined,
+    )
+    if cursor.cleared_until:
+        queryset = queryset.filter(created_at__gt=cursor.cleared_until)
+    return queryset
+
+
+def read_filter(cursor):
+    """Q matching the broadcasts the cursor counts as read"""
+    read = Q(pk__in=cursor.read_ids or [])
+    if cursor.read_until:
+        read |= Q(created_at__lte=cursor.read_until)
+    return read
+
+
+def with_read_state(queryset, cursor):
+    """Annotate broadcasts with the user's is_read"""
+    return queryset.annotate(is_read=Case(
+        When(read_filter(cursor), then=Value(True)),
+        default=Value(False),
+        output_field=models.BooleanField(),
+    ))
+
+
+def unread_broadcasts(user, cursor=None):
+    cursor = cursor or get_cursor(user)
+    return visible_broadcasts(user, cursor).exclude(read_filter(cursor))
+
+
+def unread_count(user):
+    """Unread inbox entries: the maintained personal counter plus unread broadcasts"""
+    return UnreadCounter.for_user(user) + unread_broadcasts(user).count()
+
+
+def entry_kind(entry):
+    return BROADCAST if isinstance(entry, BroadcastNotification) else PERSONAL
+
+
+def position(entry):
+    """Sort key of an inbox entry; the inbox is ordered by it, descending"""
+    return entry.created_at, entry_kind(entry), entry.pk
+
+
+def _older_than(queryset, kind, before):
+    """Entries of one kind that sort after `before` (a position) in the inbox"""
+    if before is None:
+        return queryset
+    created_at, before_kind, pk = before
+    if kind < before_kind:
+        return queryset.filter(created_at__lte=created_at)
+    if kind > before_kind:
+        return queryset.filter(created_at__lt=created_at)
+    return queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+
+def inbox_page(user, notification_type=None, before=None, limit=10):
+    """
+    Up to `limit` inbox entries after position `before`, newest first, and
+    whether more follow. Each kind is one LIMITed range scan on its
+    (user/audience, created_at) index, merged here; nothing is counted or
+    skipped with OFFSET, so deep pages cost the same as the first.
+    """
+    cursor = get_cursor(user)
+    personal = Notification.objects.filter(user=user)
+    broadcasts = visible_broadcasts(user, cursor)
+    if notification_type:
+        personal = personal.filter(notification_type=notification_type)
+        broadcasts = broadcasts.filter(notification_type=notification_type)
+    personal = _older_than(personal, PERSONAL, before).select_related('order_details')
+    broadcasts = with_read_state(_older_than(broadcasts, BROADCAST, before), cursor)
+    entries = [
+        *personal.order_by('-created_at', '-id')[:limit + 1],
+        *broadcasts.order_by('-created_at', '-id')[:limit + 1],
+    ]
+    entries.sort(key=position, reverse=True)
+    return entries[:limit], len(entries) > limit
+
+
+def _advance_read_until(user, cursor):
+    """Move read_until over the oldest broadcasts once every one of them is read"""
+    oldest_unread = (
+        unread_broadcasts(user, cursor).order_by('created_at').values_list('created_at', flat=True).first()
+    )
+    covered = BroadcastNotification.objects.filter(pk__in=cursor.read_ids)
+    if oldest_unread:
+        covered = covered.filter(created_at__lt=oldest_unread)
+    newest = covered.aggregate(newest=Max('created_at'))['newest']
+    if newest and (cursor.read_until is None or newest > cursor.read_until):
+        cursor.read_until = newest
+
+
+def mark_broadcast_read(user, broadcast):
+    cursor = get_cursor(user)
+    if cursor.read_until and broadcast.created_at <= cursor.read_until:
+        return cursor
+    with transaction.atomic():
+        cursor = _locked_cursor(user)
+        if broadcast.pk not in cursor.read_ids:
+            cursor.read_ids = [*cursor.read_ids, broadcast.pk]
+            _advance_read_until(user, cursor)
+            cursor.save()
+    return cursor
+
+
+def mark_all_broadcasts_read(user):
+    """Advance the read cursor to now; returns how many broadcasts became read"""
+    with transaction.atomic():
+        cursor = _locked_cursor(user)
+        count = unread_broadcasts(user, cursor).count()
+        cursor.read_until = timezone.now()
+        cursor.read_ids = []
+        cursor.save()
+    return count
+
+
+def clear_broadcasts(user):
+    """Hide every broadcast sent so far; returns how many were hidden"""
+    with transaction.atomic():
+        cursor = _locked_cursor(user)
+        count = visible_broadcasts(user, cursor).count()
+        cursor.read_until = cursor.cleared_until = timezone.now()
+        cursor.read_ids = []
+        cursor.save()
+    return count
@@ -0,0 +1,51 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from notifications import fcm_admin
+from notifications.fcm_client import get_fcm_client
+from notifications.fcm_standin import FCMStandIn
+
+
+class Command(BaseCommand):
+    help = "Compare serial per-token sends with the pooled concurrent FCM client against a local stand-in."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=200, help="Device tokens to send to.")
+        parser.add_argument("--latency", type=float, default=0.05, help="Simulated FCM latency per send (seconds).")
+        parser.add_argument("--concurrency", type=int, default=8, help="FCM_MAX_CONCURRENCY for the pooled run.")
+
+    def handle(self, *args, **options):
+        server = FCMStandIn(latency=options["latency"]).start()
+        tokens = [f"bench-token-{i}" for i in range(options["messages"])]
+        try:
+            with override_settings(
+                FCM_SEND_URL=server.send_url,
+                FCM_ACCESS_TOKEN=server.access_token,
+                FCM_MAX_CONCURRENCY=options["concurrency"],
+            ):
+                serial = self.run("serial, new connection per send", server, lambda: self.send_serial(tokens))
+                pooled = self.run("pooled client", server, lambda: self.send_pooled(tokens))
+        finally:
+            server.stop()
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {serial / pooled:.1f}x"))
+
+    def run(self, label, server, send):
+        server.messages.clear()
+        started = time.perf_counter()
+        send()
+        elapsed = time.perf_counter() - started
+        delivered = len(server.messages)
+        self.stdout.write(f"{label:<34} {delivered} sent in {elapsed:.2f}s ({delivered / elapsed:.0f} msg/s)")
+        return elapsed
+
+    def send_serial(self, tokens):
+        # How pushes were delivered before the pooled client: one bare requests.post per token
+        access_token = fcm_admin.get_access_token()
+        for token in tokens:
+            fcm_admin.send_to_token(requests, access_token, token, "Benchmark", "Hello", {"n": "1"})
+
+    def send_pooled(self, tokens):
+        get_fcm_client().send_many((token, "Benchmark", "Hello", {"n": "1"}) for token in tokens)
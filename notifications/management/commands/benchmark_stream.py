@@ -0,0 +1,131 @@
+import asyncio
+import resource
+import time
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework_simplejwt.tokens import AccessToken
+
+from notifications.pubsub import hub, publish, user_channel
+from users.models import CustomUser
+
+
+class StreamClient:
+    """One SSE connection driven straight through the ASGI application, no sockets"""
+
+    def __init__(self, application, token):
+        self.application = application
+        self.token = token
+        self.status = None
+        self.events = 0
+        self.connected = asyncio.Event()
+        self.received = asyncio.Event()
+        self.disconnect = asyncio.Event()
+        self.request_sent = False
+
+    def start(self):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/api/notifications/stream/",
+            "raw_path": b"/api/notifications/stream/",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"localhost"), (b"authorization", f"Bearer {self.token}".encode())],
+            "client": ("127.0.0.1", 0),
+            "server": ("localhost", 80),
+        }
+        self.task = asyncio.create_task(self.application(scope, self.receive, self.send))
+
+    async def receive(self):
+        if not self.request_sent:
+            self.request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self.disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+        elif message["type"] == "http.response.body":
+            self.connected.set()
+            if message.get("body", b"").startswith(b"event: notification"):
+                self.events += 1
+                self.received.set()
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many idle notification streams against the ASGI application in this one process, "
+        "then time a fan-out to all of them. Creates and deletes throwaway users, so it only runs with "
+        "DEBUG on and against a test database (one named as Django names test databases)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=2000, help="Streams to hold open.")
+        parser.add_argument("--users", type=int, default=20, help="Users the streams are spread over.")
+        parser.add_argument("--idle", type=float, default=2.0, help="Seconds to hold the streams idle.")
+
+    def check_safe_to_run(self):
+        if not settings.DEBUG:
+            raise CommandError("benchmark_stream only runs with DEBUG on.")
+        database = connection.settings_dict
+        test_name = database["TEST"].get("NAME") or f"test_{database['NAME']}"
+        if database["NAME"] != test_name and not connection.is_in_memory_db():
+            raise CommandError(
+                f"benchmark_stream only runs against a test database ({test_name}), not {database['NAME']}."
+            )
+
+    def handle(self, *args, **options):
+        self.check_safe_to_run()
+        users = [
+            CustomUser.objects.create_user(f"stream-bench-{i}@example.invalid", None, is_active=True)
+            for i in range(options["users"])
+        ]
+        try:
+            tokens = [(user.pk, str(AccessToken.for_user(user))) for user in users]
+            asyncio.run(self.bench(tokens, options["connections"], options["idle"]))
+        finally:
+            CustomUser.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    async def bench(self, tokens, connections, idle):
+        application = get_asgi_application()
+        clients = [(tokens[i % len(tokens)][0], StreamClient(application, tokens[i % len(tokens)][1]))
+                   for i in range(connections)]
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        started = time.perf_counter()
+        for _, client in clients:
+            client.start()
+        await asyncio.gather(*(client.connected.wait() for _, client in clients))
+        opened = time.perf_counter() - started
+        failed = sum(client.status != 200 for _, client in clients)
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write(
+            f"Opened {connections - failed}/{connections} streams in {opened:.2f}s; "
+            f"{hub.connection_count()} held by this process, "
+            f"~{(rss_after - rss_before) / max(connections, 1):.1f} KB peak RSS each"
+        )
+
+        await asyncio.sleep(idle)
+        alive = sum(not client.task.done() for _, client in clients)
+        self.stdout.write(f"{alive} still open after {idle:.1f}s idle")
+
+        started = time.perf_counter()
+        for user_id, _ in tokens:
+            publish(user_channel(user_id), {"kind": "personal", "id": 0, "message": "benchmark"})
+        await asyncio.gather(*(client.received.wait() for _, client in clients))
+        fanned_out = time.perf_counter() - started
+        self.stdout.write(f"Delivered {len(tokens)} notification(s) to {connections} streams in {fanned_out * 1000:.0f} ms")
+
+        for _, client in clients:
+            client.disconnect.set()
+        await asyncio.gather(*(client.task for _, client in clients), return_exceptions=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"Held {alive} idle streams on one event loop; {hub.connection_count()} left after disconnect."
+        ))
@@ -0,0 +1,39 @@
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.fcm_credentials import metrics
+from notifications.outbox import process_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver queued push notifications from the outbox, with retries and dead-lettering."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.PUSH_OUTBOX_BATCH_SIZE)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running, polling this many seconds apart when the outbox is empty. "
+            "Without it, drain what is due and exit.",
+        )
+
+    def handle(self, *args, **options):
+        totals = Counter()
+        while True:
+            counts = process_batch(options["batch_size"])
+            totals.update(counts)
+            if counts:
+                continue
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+        counters = metrics.snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['sent']}, retrying {totals['retried']}, dead-lettered {totals['dead']}. "
+            f"FCM requests: {counters.get('sends', 0)} ({counters.get('send_errors', 0)} failed), "
+            f"token refreshes: {counters.get('token_refreshes', 0)}."
+        ))
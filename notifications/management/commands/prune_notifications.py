@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from notifications.retention import compact_snapshots, prune_expired, prune_sent_pushes
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete notifications past their NOTIFICATION_RETENTION policy and compact all but the latest "
+        "snapshot of each order. Delivered pushes older than PUSH_OUTBOX_SENT_RETENTION_DAYS are deleted too."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.NOTIFICATION_PRUNE_BATCH_SIZE,
+            help="Rows deleted or compacted per transaction.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be reclaimed.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
+
+        deleted, deleted_bytes = prune_expired(batch_size, dry_run)
+        compacted, compacted_bytes = compact_snapshots(batch_size, dry_run)
+        pushes, push_bytes = prune_sent_pushes(batch_size, dry_run)
+
+        prune, compact = ("Would prune", "compact") if dry_run else ("Pruned", "compacted")
+        self.stdout.write(self.style.SUCCESS(
+            f"{prune} {deleted} notification(s), {pushes} sent push(es) and {compact} {compacted} "
+            f"order snapshot(s), {filesizeformat(deleted_bytes + push_bytes + compacted_bytes)} of notification data."
+        ))
@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from notifications.models import Notification, UnreadCounter
+
+
+class Command(BaseCommand):
+    help = "Recount unread notifications per user and fix counters that have drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Users checked per query.")
+        parser.add_argument("--dry-run", action="store_true", help="Only report drifted counters.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
+        checked = fixed = 0
+        user_ids = get_user_model().objects.order_by("pk").values_list("pk", flat=True)
+
+        last_id = None
+        while True:
+            batch = user_ids.filter(pk__gt=last_id) if last_id is not None else user_ids
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]
+            actual = dict(
+                Notification.objects.filter(user__in=batch, is_read=False).order_by()
+                .values("user").annotate(count=Count("pk")).values_list("user", "count")
+            )
+            stored = dict(UnreadCounter.objects.filter(user__in=batch).values_list("user", "count"))
+            for user_id in batch:
+                count = actual.get(user_id, 0)
+                if stored.get(user_id, 0) == count:
+                    continue
+                fixed += 1
+                self.stdout.write(f"User {user_id}: counter {stored.get(user_id, 0)}, actual {count}")
+                if not dry_run:
+                    UnreadCounter.objects.update_or_create(user_id=user_id, defaults={"count": count})
+            checked += len(batch)
+
+        verb = "Would fix" if dry_run else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} user(s). {verb} {fixed} counter(s)."))
@@ -0,0 +1,43 @@
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.topics import pending_changes, sync_pending
+
+
+class Command(BaseCommand):
+    help = "Apply pending device topic subscriptions and unsubscriptions to FCM in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.PUSH_TOPIC_SYNC_BATCH_SIZE,
+            help="Pending changes read per pass; each topic's tokens go to FCM 1000 per call.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running, polling this many seconds apart when nothing is pending. "
+            "Without it, apply what is pending and exit.",
+        )
+
+    def handle(self, *args, **options):
+        totals = Counter()
+        while True:
+            counts = sync_pending(options["batch_size"])
+            totals.update(counts)
+            # Stop on a pass that made no progress; failed rows wait out their backoff
+            if counts and set(counts) != {"failed"}:
+                continue
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Subscribed {totals['subscribed']}, unsubscribed {totals['unsubscribed']}, "
+            f"removed {totals['invalid']} invalid token(s); "
+            f"{pending_changes().count()} change(s) still pending."
+        ))
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:32
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalized_payload(payload):
+    """The payload as notify_user hashes it: order_id as an int, however it was stored"""
+    payload = payload or {}
+    try:
+        return {**payload, 'order_id': int(payload.get('order_id'))}
+    except (TypeError, ValueError):
+        return payload
+
+
+def backfill_payload_hashes(apps, schema_editor):
+    """
+    Hash rows notify_user would have deduplicated (no deduplication_key, not an
+    order snapshot). Only the first row of each duplicate group gets the hash.
+    order_id is normalised first, so a legacy "42" collides with a new 42.
+    """
+    Notification = apps.get_model('notifications', 'Notification')
+
+    seen = set()
+    batch = []
+    rows = (
+        Notification.objects.filter(deduplication_key__isnull=True, order_details__isnull=True)
+        .order_by('id')
+        .only('id', 'user_id', 'notification_type', 'payload')
+    )
+    for notification in rows.iterator(chunk_size=2000):
+        payload = normalized_payload(notification.payload)
+        canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+        digest = hashlib.sha256(canonical.encode()).hexdigest()
+        key = (notification.user_id, notification.notification_type, digest)
+        if key in seen:
+            continue
+        seen.add(key)
+        notification.payload_hash = digest
+        batch.append(notification)
+        if len(batch) >= 1000:
+            Notification.objects.bulk_update(batch, ['payload_hash'])
+            batch = []
+    Notification.objects.bulk_update(batch, ['payload_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0007_pushoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='payload_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_payload_hashes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('user', 'notification_type', 'payload_hash'), name='unique_notification_payload'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0008_notification_payload_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BroadcastCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_until', models.DateTimeField(blank=True, null=True)),
+                ('cleared_until', models.DateTimeField(blank=True, null=True)),
+                ('read_ids', models.JSONField(blank=True, default=list)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='broadcast_cursor', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BroadcastNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('audience', models.CharField(choices=[('all', 'Everyone'), ('sellers', 'Sellers'), ('customers', 'Customers')], max_length=10)),
+                ('message', models.TextField()),
+                ('notification_type', models.CharField(choices=[('order_confirmation', 'Order Confirmation'), ('order_status_change', 'Order Status Change'), ('delivery_delay', 'Delivery Delay'), ('order_cancellation', 'Order Cancellation'), ('payment_success', 'Payment Success'), ('payment_failed', 'Payment Failed'), ('refund_processed', 'Refund Processed'), ('discount_offer', 'Discount/Coupon Offer'), ('new_restaurant', 'New Restaurant Alert'), ('review_reminder', 'Review Reminder'), ('restaurant_reply', 'Restaurant Reply'), ('new_order', 'New Order Received'), ('restaurant_order_cancellation', 'Order Cancellation (Restaurant)'), ('new_review', 'New Review Posted'), ('low_stock', 'Low Stock Alert'), ('payment_received', 'Payment Received'), ('account', 'Account Activity')], max_length=50)),
+                ('payload', models.JSONField(blank=True, null=True)),
+                ('payload_hash', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['audience', '-created_at'], name='broadcast_audience_idx')],
+                'constraints': [models.UniqueConstraint(fields=('audience', 'notification_type', 'payload_hash'), name='unique_broadcast_payload')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_unread_counters(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    UnreadCounter = apps.get_model('notifications', 'UnreadCounter')
+
+    unread = (
+        Notification.objects.filter(is_read=False).order_by().values('user').annotate(count=Count('pk'))
+        .values_list('user', 'count')
+    )
+    batch = []
+    for user_id, count in unread.iterator(chunk_size=2000):
+        batch.append(UnreadCounter(user_id=user_id, count=count))
+        if len(batch) >= 1000:
+            UnreadCounter.objects.bulk_create(batch)
+            batch = []
+    UnreadCounter.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0009_broadcastnotification'),
+        ('users', '0012_profile_picture_blob_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
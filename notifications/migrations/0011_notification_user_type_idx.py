@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0010_unreadcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'notification_type', '-created_at'], name='notification_user_type_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def backfill_notification_orders(apps, schema_editor):
+    """Link existing rows through their order snapshot, or else payload['order_id'] (int or str)"""
+    Notification = apps.get_model('notifications', 'Notification')
+
+    rows = (
+        Notification.objects.filter(Q(order_details__isnull=False) | Q(payload__has_key='order_id'))
+        .order_by('id')
+        .values_list('id', 'order_details__order_id', 'payload')
+    )
+    batch = []
+    for pk, snapshot_order_id, payload in rows.iterator(chunk_size=2000):
+        order_id = snapshot_order_id
+        if order_id is None:
+            try:
+                order_id = int((payload or {}).get('order_id'))
+            except (TypeError, ValueError):
+                continue
+        batch.append(Notification(pk=pk, order_id=order_id))
+        if len(batch) >= 1000:
+            Notification.objects.bulk_update(batch, ['order'])
+            batch = []
+    Notification.objects.bulk_update(batch, ['order'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0011_notification_user_type_idx'),
+        ('store', '0017_productimage_blob_storage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='order',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='inbox_notifications', to='store.order'),
+        ),
+        migrations.RunPython(backfill_notification_orders, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['order', '-created_at'], name='notification_order_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:43
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def backfill_product_ids(apps, schema_editor):
+    """
+    Product ids from the payload, else the order snapshot, else the order's
+    items (one query per batch), mirroring the old read-time fallbacks.
+    """
+    Notification = apps.get_model('notifications', 'Notification')
+    OrderItem = apps.get_model('store', 'OrderItem')
+
+    def flush(rows):
+        missing = {order_id for _, order_id, product_ids in rows if product_ids is None and order_id}
+        by_order = defaultdict(list)
+        items = OrderItem.objects.filter(order_id__in=missing).order_by('id').values_list('order_id', 'product_id')
+        for order_id, product_id in items:
+            by_order[order_id].append(str(product_id))
+        Notification.objects.bulk_update(
+            [
+                Notification(pk=pk, product_ids=by_order.get(order_id, []) if product_ids is None else product_ids)
+                for pk, order_id, product_ids in rows
+            ],
+            ['product_ids'],
+        )
+
+    rows = []
+    queryset = (
+        Notification.objects.order_by('id')
+        .values_list('id', 'order_id', 'payload', 'order_details__snapshot')
+    )
+    for pk, order_id, payload, snapshot in queryset.iterator(chunk_size=2000):
+        product_ids = None
+        if payload and payload.get('product_ids') is not None:
+            product_ids = [str(product_id) for product_id in payload['product_ids']]
+        elif snapshot:
+            product_ids = [
+                str(item.get('product_id')) for item in snapshot.get('items', []) if item.get('product_id')
+            ]
+        if product_ids is None and not order_id:
+            continue
+        rows.append((pk, order_id, product_ids))
+        if len(rows) >= 1000:
+            flush(rows)
+            rows = []
+    flush(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0012_notification_order'),
+        ('store', '0017_productimage_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='product_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(backfill_product_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0013_notification_product_ids'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pushoutbox',
+            name='topic',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='userdevice',
+            name='city',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='pushoutbox',
+            name='notification',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pushes', to='notifications.notification'),
+        ),
+        migrations.AlterField(
+            model_name='pushoutbox',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='DeviceTopic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=255)),
+                ('topic', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('subscribe', 'Subscribe pending'), ('subscribed', 'Subscribed'), ('unsubscribe', 'Unsubscribe pending')], default='subscribe', max_length=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'topic'], name='devicetopic_pending_idx')],
+                'constraints': [models.UniqueConstraint(fields=('token', 'topic'), name='unique_device_topic')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0014_push_topics'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='devicetopic',
+            name='devicetopic_pending_idx',
+        ),
+        migrations.AddField(
+            model_name='devicetopic',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='devicetopic',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='devicetopic',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='devicetopic_due_idx'),
+        ),
+    ]
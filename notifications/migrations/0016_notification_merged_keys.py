@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0015_devicetopic_backoff'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='merged_keys',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -1,13 +1,50 @@
-from django.db import models
+import hashlib
+import json
+
+from django.db import models, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
 from django.conf import settings
 from django.utils import timezone
 
-class NotificationManager(models.Manager):
+
+def order_id_from(payload):
+    """The payload's order_id as an int (callers have stored both ints and strings), or None"""
+    try:
+        return int((payload or {}).get('order_id'))
+    except (TypeError, ValueError):
+        return None
+
+
+def payload_hash(payload):
+    """Canonical SHA-256 of a notification payload (key order and spacing don't matter)"""
+    canonical = json.dumps(payload or {}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class NotificationQuerySet(models.QuerySet):
     def unread(self):
         return self.filter(is_read=False)
 
+    def delete(self):
+        # Bulk deletes skip signals, so take the unread rows off the counters here
+        with transaction.atomic():
+            unread = list(
+                self.filter(is_read=False).order_by().values('user').annotate(count=Count('pk'))
+                .values_list('user', 'count')
+            )
+            result = super().delete()
+            for user_id, count in unread:
+                UnreadCounter.adjust(user_id, -count)
+        return result
+
+
+class NotificationManager(models.Manager.from_queryset(NotificationQuerySet)):
     def mark_all_as_read(self, user):
-        return self.filter(user=user, is_read=False).update(is_read=True)
+        with transaction.atomic():
+            count = self.filter(user=user, is_read=False).update(is_read=True)
+            UnreadCounter.adjust(user.pk, -count)
+        return count
 class Notification(models.Model):
     TYPE_CHOICES = [
         # User-facing
@@ -38,6 +75,19 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     payload = models.JSONField(blank=True, null=True)
     deduplication_key = models.CharField(max_length=255, blank=True, null=True, unique=True)
+    # Set by notify_user when no deduplication_key is given; NULL rows never collide
+    payload_hash = models.CharField(max_length=64, blank=True, null=True)
+    # "<type>:<payload_hash>" of the earlier notifications coalesced into this row (payload_hash
+    # is the latest one's), so repeats of any of them are still dropped as duplicates
+    merged_keys = models.JSONField(default=list, blank=True)
+    # Order the notification is about, set from payload['order_id'] when written.
+    # No FK constraint: a stale id in a payload must not fail the write
+    order = models.ForeignKey(
+        'store.Order', on_delete=models.DO_NOTHING, null=True, blank=True,
+        db_constraint=False, db_index=False, related_name='inbox_notifications'
+    )
+    # Products of that order (as strings), stored when written so the inbox never reads orders
+    product_ids = models.JSONField(default=list, blank=True)
 
     # ✅ Apply your custom manager here
     objects = NotificationManager()
@@ -46,8 +96,17 @@ class Notification(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', '-created_at']),
+            # Inbox pages filtered by type
+            models.Index(fields=['user', 'notification_type', '-created_at'], name='notification_user_type_idx'),
+            models.Index(fields=['order', '-created_at'], name='notification_order_idx'),
             models.Index(fields=['notification_type', 'is_read'])
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'notification_type', 'payload_hash'],
+                name='unique_notification_payload',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.email}: {self.message[:50]}"
@@ -55,6 +114,13 @@ class Notification(models.Model):
     def mark_as_read(self):
         self.is_read = True
         self.save()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            if self.__dict__.get('is_read') is False:
+                UnreadCounter.adjust(self.user_id, -1)
+        return result
 class OrderNotification(models.Model):
     notification = models.OneToOneField(
         Notification, 
@@ -79,7 +145,179 @@ class UserDevice(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     token = models.CharField(max_length=255, unique=True)
     platform = models.CharField(max_length=50)  # e.g., 'android', 'ios', 'web'
+    city = models.CharField(max_length=100, blank=True, default='')  # optional, subscribes to the city's topic
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.email} - {self.platform}" 
+
+class DeviceTopic(models.Model):
+    """
+    A device token's FCM topic membership. Registration records the wanted
+    state; sync_push_topics applies pending changes to FCM in batches.
+    Keyed by token rather than device so unsubscribes outlive the device row.
+    """
+    SUBSCRIBE = 'subscribe'
+    SUBSCRIBED = 'subscribed'
+    UNSUBSCRIBE = 'unsubscribe'
+    STATUS_CHOICES = [
+        (SUBSCRIBE, 'Subscribe pending'),
+        (SUBSCRIBED, 'Subscribed'),
+        (UNSUBSCRIBE, 'Unsubscribe pending'),
+    ]
+
+    token = models.CharField(max_length=255)
+    topic = models.CharField(max_length=255)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=SUBSCRIBE)
+    # Failed syncs of the pending change, and when it may be retried (backoff)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['token', 'topic'], name='unique_device_topic'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='devicetopic_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.token[:16]} -> {self.topic} ({self.status})"
+
+class UnreadCounter(models.Model):
+    """
+    Unread personal notifications per user, adjusted as notifications are
+    created, read and deleted so badges never need a COUNT(*).
+    reconcile_unread_counters repairs any drift.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='unread_counter'
+    )
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.count} unread"
+
+    @classmethod
+    def adjust(cls, user_id, delta):
+        if not delta:
+            return
+        new_count = Greatest(F('count') + delta, 0)
+        if cls.objects.filter(user_id=user_id).update(count=new_count, updated_at=timezone.now()):
+            return
+        counter, created = cls.objects.get_or_create(user_id=user_id, defaults={'count': max(delta, 0)})
+        if not created:
+            # Created concurrently; apply the change on top of it
+            cls.objects.filter(pk=counter.pk).update(count=new_count, updated_at=timezone.now())
+
+    @classmethod
+    def for_user(cls, user):
+        return cls.objects.filter(user=user).values_list('count', flat=True).first() or 0
+
+
+class PushOutbox(models.Model):
+    """
+    A push waiting to be sent, drained by process_push_outbox. Written with
+    its Notification for one user's devices, or with a broadcast as a single
+    message to an FCM topic.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead-lettered'),
+    ]
+
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='pushes', null=True, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    # Set instead of user for topic sends
+    topic = models.CharField(max_length=255, blank=True, default='')
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    data = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Next time a worker may pick the row up (retry backoff and in-flight lease)
+    available_at = models.DateTimeField(default=timezone.now)
+    # Tokens still owed a delivery after a partial failure; None means all of the user's devices
+    pending_tokens = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='pushoutbox_due_idx'),
+        ]
+
+    def __str__(self):
+        if self.topic:
+            return f"Push {self.pk} to topic {self.topic} ({self.status})"
+        return f"Push {self.pk} for notification {self.notification_id} ({self.status})"
+
+
+class BroadcastNotification(models.Model):
+    """One notification for a whole audience; each user's read state lives in their BroadcastCursor"""
+    ALL = 'all'
+    SELLERS = 'sellers'
+    CUSTOMERS = 'customers'
+    AUDIENCE_CHOICES = [
+        (ALL, 'Everyone'),
+        (SELLERS, 'Sellers'),
+        (CUSTOMERS, 'Customers'),
+    ]
+
+    audience = models.CharField(max_length=10, choices=AUDIENCE_CHOICES)
+    message = models.TextField()
+    notification_type = models.CharField(max_length=50, choices=Notification.TYPE_CHOICES)
+    payload = models.JSONField(blank=True, null=True)
+    payload_hash = models.CharField(max_length=64)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['audience', '-created_at'], name='broadcast_audience_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['audience', 'notification_type', 'payload_hash'],
+                name='unique_broadcast_payload',
+            ),
+        ]
+
     def __str__(self):
-        return f"{self.user.email} - {self.platform}" 
\ No newline at end of file
+        return f"{self.get_audience_display()}: {self.message[:50]}"
+
+
+class BroadcastCursor(models.Model):
+    """
+    A user's position in the broadcast stream: everything up to read_until is
+    read, everything up to cleared_until is hidden, and read_ids holds the
+    broadcasts read one by one since read_until.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='broadcast_cursor')
+    read_until = models.DateTimeField(null=True, blank=True)
+    cleared_until = models.DateTimeField(null=True, blank=True)
+    read_ids = models.JSONField(default=list, blank=True)
+
+    def __str__(self):
+        return f"Broadcast cursor for {self.user.email}"
+
+    def save(self, *args, **kwargs):
+        self.trim_read_ids()
+        super().save(*args, **kwargs)
+
+    def trim_read_ids(self):
+        """Drop ids the cursors already cover or whose broadcast is gone"""
+        if not self.read_ids:
+            return
+        kept = BroadcastNotification.objects.filter(pk__in=self.read_ids)
+        for bound in (self.read_until, self.cleared_until):
+            if bound:
+                kept = kept.filter(created_at__gt=bound)
+        self.read_ids = sorted(kept.values_list('pk', flat=True))
@@ -0,0 +1,140 @@
+"""
+Delivery side of the push outbox.
+
+notify_user writes a PushOutbox row in the same transaction as its
+Notification; workers (``manage.py process_push_outbox``) claim due rows in
+batches under a lease and send them to every device of the user (or as one
+message to the row's FCM topic, for broadcasts). Each row is then marked
+sent, rescheduled with exponential backoff for the tokens that hit transient
+errors, or dead-lettered after PUSH_OUTBOX_MAX_ATTEMPTS. Sent rows are
+deleted later by ``manage.py prune_notifications``.
+"""
+import logging
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import fcm_admin
+from .fcm_client import Topic, get_fcm_client
+from .models import PushOutbox, UserDevice
+from .topics import forget_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def claim_batch(batch_size):
+    """Lease up to batch_size due rows to this worker and count the attempt"""
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            PushOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=PushOutbox.PENDING, available_at__lte=now)
+            .order_by('available_at')[:batch_size]
+        )
+        if rows:
+            PushOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(
+                available_at=now + timedelta(seconds=settings.PUSH_OUTBOX_LEASE_SECONDS),
+                attempts=F('attempts') + 1,
+            )
+    for row in rows:
+        row.attempts += 1
+    return rows
+
+
+def backoff(attempts):
+    delay = min(
+        settings.PUSH_OUTBOX_MAX_BACKOFF_SECONDS,
+        settings.PUSH_OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1),
+    )
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def retry_later(row, error):
+    """Back off, or dead-letter once attempts are used up; pending_tokens is left as set"""
+    row.last_error = error[:2000]
+    if row.attempts >= settings.PUSH_OUTBOX_MAX_ATTEMPTS:
+        row.status = PushOutbox.DEAD
+        logger.error(f"Push {row.pk} dead-lettered after {row.attempts} attempts: {row.last_error}")
+    else:
+        row.available_at = timezone.now() + backoff(row.attempts)
+    row.save(update_fields=['status', 'pending_tokens', 'available_at', 'last_error'])
+    return 'dead' if row.status == PushOutbox.DEAD else 'retried'
+
+
+def finish(row, retry_tokens, errors):
+    if retry_tokens:
+        row.pending_tokens = retry_tokens
+        return retry_later(row, "\n".join(errors))
+    row.status = PushOutbox.SENT
+    row.sent_at = timezone.now()
+    row.pending_tokens = None
+    # Permanent per-token failures are kept for inspection but do not hold the row back
+    row.last_error = "\n".join(errors)[:2000]
+    row.save(update_fields=['status', 'sent_at', 'pending_tokens', 'last_error'])
+    return 'sent'
+
+
+def process_batch(batch_size=None):
+    """Deliver one batch; returns counts by result (sent/retried/dead)"""
+    counts = defaultdict(int)
+    rows = claim_batch(batch_size or settings.PUSH_OUTBOX_BATCH_SIZE)
+    if not rows:
+        return counts
+
+    tokens_by_user = defaultdict(list)
+    user_ids = {row.user_id for row in rows if row.user_id is not None}
+    devices = UserDevice.objects.filter(user_id__in=user_ids).values_list('user_id', 'token')
+    for user_id, token in devices:
+        tokens_by_user[user_id].append(token)
+
+    try:
+        access_token = fcm_admin.get_access_token()
+    except Exception as exc:
+        for row in rows:
+            counts[retry_later(row, f"auth: {exc}")] += 1
+        return counts
+
+    def targets(row):
+        if row.topic:
+            return [Topic(row.topic)]
+        return row.pending_tokens if row.pending_tokens is not None else tokens_by_user[row.user_id]
+
+    # Fan the batch out over the pooled client in two waves: the first send to
+    # each distinct target, then the repeats, so a token found invalid is tried
+    # once per batch rather than once per row
+    pairs = [(row, target) for row in rows for target in targets(row)]
+    seen = set()
+    first_wave, repeats = [], []
+    for pair in pairs:
+        (repeats if pair[1] in seen else first_wave).append(pair)
+        seen.add(pair[1])
+
+    retry_tokens, errors = defaultdict(list), defaultdict(list)
+    invalid = set()
+    client = get_fcm_client()
+    for wave in (first_wave, repeats):
+        wave = [(row, target) for row, target in wave if target not in invalid]
+        results = client.send_many(
+            ((target, row.title, row.body, row.data) for row, target in wave), access_token=access_token
+        )
+        for (row, _), (target, outcome, detail) in zip(wave, results):
+            label = f"topic {target.name}" if isinstance(target, Topic) else target[:16]
+            if outcome == fcm_admin.RETRY:
+                retry_tokens[row.pk].append(target.name if isinstance(target, Topic) else target)
+            elif outcome == fcm_admin.INVALID_TOKEN:
+                invalid.add(target)
+            if outcome != fcm_admin.SENT:
+                errors[row.pk].append(f"{label}: {detail}")
+    for row in rows:
+        counts[finish(row, retry_tokens[row.pk], errors[row.pk])] += 1
+
+    if invalid:
+        UserDevice.objects.filter(token__in=invalid).delete()
+        forget_tokens(invalid)
+        logger.info(f"Deleted {len(invalid)} invalid device token(s)")
+    return counts
@@ -0,0 +1,202 @@
+"""
+Publish/subscribe for the live notification stream.
+
+Each process has one Hub holding the open stream connections, keyed by
+channel ("user:<id>" for personal notifications, "audience:<name>" for
+broadcasts). Publishing goes through NOTIFICATION_STREAM_BACKEND:
+
+* LocalBackend hands messages straight to this process's hub. It is the
+  stand-in for development, tests and single-process deployments.
+* RedisBackend publishes over Redis pub/sub, and a listener thread in each
+  process that has subscribers feeds its own hub, so a notification written
+  by any worker reaches connections held by every other.
+
+A connection is an asyncio queue on the event loop serving it; publishers on
+other threads hand messages over with call_soon_threadsafe. A connection
+whose queue fills up (a client not reading) is closed rather than buffered
+without bound, and its client reconnects.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+def audience_channel(audience):
+    return f"audience:{audience}"
+
+
+class Subscription:
+    def __init__(self, channels, maxsize):
+        self.channels = tuple(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+
+    def deliver(self, message):
+        """Queue a message; runs on the subscription's event loop"""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow client: drop the connection, it will reconnect and refetch
+            self.closed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout):
+        """Next message, None once the subscription is closed; TimeoutError when idle"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class Hub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, channels, maxsize=None):
+        subscription = Subscription(channels, maxsize or settings.NOTIFICATION_STREAM_QUEUE_SIZE)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].add(subscription)
+        get_backend().listen()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def connection_count(self):
+        with self._lock:
+            return len(set().union(*self._subscriptions.values()))
+
+    def dispatch(self, channel, message):
+        """Fan a message out to this process's subscribers; safe from any thread"""
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        by_loop = defaultdict(list)
+        for subscription in subscribers:
+            by_loop[subscription.loop].append(subscription)
+        for loop, subscriptions in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver_all, subscriptions, message)
+            except RuntimeError:
+                # Loop already closed (server shutting down)
+                for subscription in subscriptions:
+                    self.unsubscribe(subscription)
+
+
+def _deliver_all(subscriptions, message):
+    for subscription in subscriptions:
+        subscription.deliver(message)
+
+
+hub = Hub()
+
+
+class LocalBackend:
+    """In-process stand-in: messages only reach connections held by this process"""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, channel, message):
+        self.hub.dispatch(channel, message)
+
+    def listen(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RedisBackend:
+    """Cross-process fan-out over Redis pub/sub (needs the optional ``redis`` package)"""
+    prefix = "notifications:stream:"
+
+    def __init__(self, hub, url=None):
+        import redis
+
+        self.hub = hub
+        self.client = redis.Redis.from_url(url or settings.NOTIFICATION_STREAM_REDIS_URL)
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        self.client.publish(self.prefix + channel, json.dumps(message))
+
+    def listen(self):
+        """Start this process's listener thread with its first subscriber"""
+        if self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is None:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(**{self.prefix + "*": self._on_message})
+                self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def _on_message(self, item):
+        channel = item["channel"]
+        channel = channel.decode() if isinstance(channel, bytes) else channel
+        try:
+            message = json.loads(item["data"])
+        except ValueError:
+            logger.warning(f"Ignoring malformed stream message on {channel}")
+            return
+        self.hub.dispatch(channel[len(self.prefix):], message)
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        self.client.close()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is not None:
+        return _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(settings.NOTIFICATION_STREAM_BACKEND)(hub)
+        return _backend
+
+
+def publish(channel, message):
+    """Publish to every process's subscribers; failures are logged, never raised"""
+    try:
+        get_backend().publish(channel, message)
+    except Exception as e:
+        logger.error(f"Failed to publish stream message to {channel}: {str(e)}")
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    global _backend
+    if setting.startswith("NOTIFICATION_STREAM_") and _backend is not None:
+        _backend.close()
+        _backend = None
@@ -0,0 +1,116 @@
+"""
+Retention for notifications (``manage.py prune_notifications``).
+
+NOTIFICATION_RETENTION gives, per notification type, how many days read and
+unread notifications are kept. Expired rows are deleted in primary-key
+chunks so each transaction stays short; their order snapshots and queued
+pushes go with them, and unread counters are adjusted by the queryset delete.
+
+Orders themselves are never touched: OrderNotification.order is PROTECT, so
+the notification holding an order's latest snapshot is kept whatever its
+age. Older snapshots of an order are compacted to {} instead, since the
+status history only needs their status columns.
+
+Delivered PushOutbox rows are deleted PUSH_OUTBOX_SENT_RETENTION_DAYS after
+they were sent; dead-lettered ones are left for inspection.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Sum, TextField, Value
+from django.db.models.functions import Cast, Coalesce, Length
+from django.utils import timezone
+
+from .models import Notification, OrderNotification, PushOutbox
+
+
+def stored_bytes(queryset, *fields):
+    """Approximate bytes held in the given text/JSON columns of queryset"""
+    if not fields:
+        return 0
+    sizes = [Coalesce(Length(Cast(field, TextField())), Value(0)) for field in fields]
+    total = queryset.aggregate(total=Sum(sum(sizes[1:], sizes[0])))['total']
+    return total or 0
+
+
+def latest_snapshots():
+    """Each order's newest OrderNotification"""
+    newest = (
+        OrderNotification.objects.filter(order=OuterRef('order'))
+        .order_by('-notification__created_at', '-pk').values('pk')[:1]
+    )
+    return OrderNotification.objects.filter(pk=Subquery(newest))
+
+
+def expired_notifications(now=None):
+    now = now or timezone.now()
+    retention = dict(settings.NOTIFICATION_RETENTION)
+    default = retention.pop('default', {})
+    policies = [(Q(notification_type=kind), policy) for kind, policy in retention.items()]
+    policies.append((~Q(notification_type__in=list(retention)), default))
+
+    expired = Q()
+    for type_filter, policy in policies:
+        for is_read, key in ((True, 'read_days'), (False, 'unread_days')):
+            days = policy.get(key)
+            if days is not None:
+                expired |= type_filter & Q(is_read=is_read, created_at__lt=now - timedelta(days=days))
+    if not expired:
+        return Notification.objects.none()
+    return Notification.objects.filter(expired).exclude(order_details__in=latest_snapshots())
+
+
+def _chunks(queryset, batch_size):
+    """Primary keys of queryset in ascending chunks, re-querying after each one"""
+    last_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        last_pk = pks[-1]
+        yield pks
+
+
+def prune_expired(batch_size, dry_run=False):
+    """Delete expired notifications; returns (rows, bytes)"""
+    deleted = reclaimed = 0
+    for pks in _chunks(expired_notifications(), batch_size):
+        chunk = Notification.objects.filter(pk__in=pks)
+        reclaimed += stored_bytes(chunk, 'message', 'payload', 'product_ids', 'merged_keys', 'order_details__snapshot')
+        if not dry_run:
+            with transaction.atomic():
+                chunk.delete()
+        deleted += len(pks)
+    return deleted, reclaimed
+
+
+def compact_snapshots(batch_size, dry_run=False):
+    """Empty every order snapshot but the latest; returns (rows, bytes)"""
+    compacted = reclaimed = 0
+    stale = OrderNotification.objects.exclude(snapshot={}).exclude(pk__in=latest_snapshots())
+    for pks in _chunks(stale, batch_size):
+        chunk = OrderNotification.objects.filter(pk__in=pks)
+        # Each compacted snapshot still stores "{}"
+        reclaimed += stored_bytes(chunk, 'snapshot') - 2 * len(pks)
+        if not dry_run:
+            chunk.update(snapshot={})
+        compacted += len(pks)
+    return compacted, reclaimed
+
+
+def prune_sent_pushes(batch_size, dry_run=False, now=None):
+    """Delete delivered outbox rows past their retention; returns (rows, bytes)"""
+    days = settings.PUSH_OUTBOX_SENT_RETENTION_DAYS
+    if days is None:
+        return 0, 0
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    sent = PushOutbox.objects.filter(status=PushOutbox.SENT, sent_at__lt=cutoff)
+    deleted = reclaimed = 0
+    for pks in _chunks(sent, batch_size):
+        chunk = PushOutbox.objects.filter(pk__in=pks)
+        reclaimed += stored_bytes(chunk, 'title', 'body', 'data')
+        if not dry_run:
+            chunk.delete()
+        deleted += len(pks)
+    return deleted, reclaimed
@@ -1,12 +1,21 @@
 from rest_framework import serializers
 from .models import Notification
-from .models import Notification, OrderNotification
+from .models import BroadcastNotification, Notification, OrderNotification
 from .models import UserDevice
 
         
 class SuccessResponseSerializer(serializers.Serializer):
     status = serializers.CharField()
     deleted = serializers.IntegerField(required=False) 
+
+
+class UnreadCountSerializer(serializers.Serializer):
+    unread_count = serializers.IntegerField()
+
+
+class StreamTicketSerializer(serializers.Serializer):
+    ticket = serializers.CharField()
+    expires_in = serializers.IntegerField()
     
     
 class OrderNotificationSerializer(serializers.ModelSerializer):
@@ -17,46 +26,64 @@ class OrderNotificationSerializer(serializers.ModelSerializer):
 # serializers.py
 
 class NotificationSerializer(serializers.ModelSerializer):
+    kind = serializers.SerializerMethodField()
     order_details = OrderNotificationSerializer(read_only=True)
-    product_ids = serializers.SerializerMethodField()
+    # Stored when the notification was written; no per-row order lookups
+    product_ids = serializers.ListField(child=serializers.CharField(), read_only=True)
 
     class Meta:
         model = Notification
         fields = [
-            'id', 'message', 'notification_type', 'is_read', 'created_at',
+            'id', 'kind', 'message', 'notification_type', 'is_read', 'created_at',
             'payload', 'order_details', 'product_ids'
         ]
         read_only_fields = ['id', 'created_at', 'payload']
 
+    def get_kind(self, obj):
+        return 'personal'
+
+
+
+class BroadcastNotificationSerializer(serializers.ModelSerializer):
+    """Same shape as NotificationSerializer; is_read comes from the user's broadcast cursor"""
+    kind = serializers.SerializerMethodField()
+    is_read = serializers.BooleanField(read_only=True)
+    order_details = serializers.SerializerMethodField()
+    product_ids = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BroadcastNotification
+        fields = [
+            'id', 'kind', 'message', 'notification_type', 'is_read', 'created_at',
+            'payload', 'order_details', 'product_ids'
+        ]
+        read_only_fields = fields
+
+    def get_kind(self, obj):
+        return 'broadcast'
+
+    def get_order_details(self, obj):
+        return None
+
     def get_product_ids(self, obj):
-        # Check payload for product_ids
-        if obj.payload and 'product_ids' in obj.payload:
-            return obj.payload.get('product_ids', [])
-        
-        # Check order_details snapshot
-        if hasattr(obj, 'order_details'):
-            return [
-                str(item.get('product_id')) 
-                for item in obj.order_details.snapshot.get('items', [])
-                if item.get('product_id')
-            ]
-        
-        # Fetch from Order using order_id in payload
-        order_id = obj.payload.get('order_id') if obj.payload else None
-        if order_id:
-            try:
-                from store.models import Order
-                order = Order.objects.get(id=order_id)
-                return [str(item.product.id) for item in order.items.all()]
-            except Order.DoesNotExist:
-                pass
-        
-        return []
+        return (obj.payload or {}).get('product_ids', [])
+
+
+class InboxEntrySerializer(serializers.BaseSerializer):
+    """Serializes a mixed list of personal notifications and broadcasts"""
+
+    def to_representation(self, instance):
+        if isinstance(instance, BroadcastNotification):
+            return BroadcastNotificationSerializer(instance, context=self.context).data
+        return NotificationSerializer(instance, context=self.context).data
+
+
 class UserDeviceSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserDevice
-        fields = ['token', 'platform']
+        fields = ['token', 'platform', 'city']
         extra_kwargs = {
             'platform': {'required': True},
-            'token': {'required': True}
+            'token': {'required': True},
+            'city': {'required': False}
         }
\ No newline at end of file
@@ -1,10 +1,51 @@
 
-from django.db.models.signals import pre_save, post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, pre_save, post_save
 from django.dispatch import receiver
 from notifications.utils import create_order_notification, notify_user  # ✅ Add notify_user
-from notifications.models import Notification
-from users.models import SellerProfile, CustomUser
-from store.models import Order
+from notifications.models import BroadcastNotification, Notification, UnreadCounter
+from notifications.stream import publish_broadcast, publish_notification
+from notifications.topics import refresh_customer
+from users.models import CustomerProfile, SellerProfile, CustomUser
+from store.models import FavouriteProduct, Order
+
+# 🔹 Keep unread counters in step with notification saves
+@receiver(post_init, sender=Notification)
+def remember_read_state(sender, instance, **kwargs):
+    # Deferred (e.g. .only()) rows stay untracked rather than costing a query
+    instance._was_read = instance.__dict__.get('is_read')
+
+@receiver(post_save, sender=Notification)
+def count_unread(sender, instance, created, raw=False, **kwargs):
+    is_read = instance.__dict__.get('is_read')
+    if raw or is_read is None:
+        return
+    was_read = True if created else instance._was_read
+    if was_read is not None and was_read != is_read:
+        UnreadCounter.adjust(instance.user_id, 1 if was_read else -1)
+    instance._was_read = is_read
+
+# 🔹 Push new notifications to open streams once they are committed
+@receiver(post_save, sender=Notification)
+def stream_notification(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: publish_notification(instance))
+
+@receiver(post_save, sender=BroadcastNotification)
+def stream_broadcast(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: publish_broadcast(instance))
+
+# 🔹 Follow sellers' push topics as customers favourite their products
+@receiver(post_save, sender=FavouriteProduct)
+@receiver(post_delete, sender=FavouriteProduct)
+def refresh_followed_sellers(sender, instance, raw=False, origin=None, **kwargs):
+    # Favourites deleted along with their customer or user leave nothing to refresh
+    if raw or getattr(origin, 'model', type(origin)) in (CustomerProfile, CustomUser):
+        return
+    # After commit, so bulk and cascading deletes don't recompute topics inside their transaction
+    customer_id = instance.customer_id
+    transaction.on_commit(lambda: refresh_customer(customer_id))
 
 # 🔹 Seller Verification
 @receiver(post_save, sender=SellerProfile)
@@ -0,0 +1,130 @@
+"""
+Live notification stream (server-sent events), served under ASGI.
+
+``GET /api/notifications/stream/`` keeps a ``text/event-stream`` response open
+and writes an ``event: notification`` for every personal notification or
+broadcast the user receives once it is committed. An idle connection is one
+asyncio queue on the worker's event loop (no thread, no database
+connection), with a comment line every NOTIFICATION_STREAM_HEARTBEAT seconds
+to keep proxies from closing it. Clients should refetch the inbox when they
+reconnect; events are not replayed.
+
+EventSource cannot send headers, and a JWT in the query string would end up
+in access logs, so browsers first POST to ``stream/ticket/`` (authenticated as
+usual) and open ``stream/?ticket=<ticket>``. A ticket is signed, names only the
+user and expires after NOTIFICATION_STREAM_TICKET_SECONDS.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .inbox import BROADCAST, PERSONAL, audiences_for
+from .pubsub import audience_channel, hub, publish, user_channel
+
+TICKET_SALT = 'notifications.stream'
+
+
+def notification_event(notification):
+    return {
+        'kind': PERSONAL,
+        'id': notification.pk,
+        'message': notification.message,
+        'notification_type': notification.notification_type,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat(),
+        'payload': notification.payload,
+        'product_ids': notification.product_ids,
+    }
+
+
+def broadcast_event(broadcast):
+    return {
+        'kind': BROADCAST,
+        'id': broadcast.pk,
+        'message': broadcast.message,
+        'notification_type': broadcast.notification_type,
+        'is_read': False,
+        'created_at': broadcast.created_at.isoformat(),
+        'payload': broadcast.payload,
+        'product_ids': (broadcast.payload or {}).get('product_ids', []),
+    }
+
+
+def publish_notification(notification):
+    publish(user_channel(notification.user_id), notification_event(notification))
+
+
+def publish_broadcast(broadcast):
+    publish(audience_channel(broadcast.audience), broadcast_event(broadcast))
+
+
+def format_event(message):
+    return f"event: notification\ndata: {json.dumps(message, default=str)}\n\n"
+
+
+def issue_ticket(user):
+    return signing.TimestampSigner(salt=TICKET_SALT).sign(str(user.pk))
+
+
+def ticket_user_id(ticket):
+    """The user id a ticket was issued for, or None if it is forged or expired"""
+    try:
+        return int(signing.TimestampSigner(salt=TICKET_SALT).unsign(
+            ticket, max_age=settings.NOTIFICATION_STREAM_TICKET_SECONDS
+        ))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+async def stream_user(request):
+    """The user behind the request's JWT (Authorization header) or ?ticket=, or None"""
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        authentication = JWTAuthentication()
+        try:
+            token = authentication.get_validated_token(header[len('Bearer '):])
+            return await sync_to_async(authentication.get_user)(token)
+        except (InvalidToken, AuthenticationFailed):
+            return None
+    user_id = ticket_user_id(request.GET.get('ticket', ''))
+    if user_id is None:
+        return None
+    return await get_user_model().objects.filter(pk=user_id, is_active=True).afirst()
+
+
+async def event_stream(channels):
+    subscription = hub.subscribe(channels)
+    try:
+        yield ": connected\n\n"
+        while True:
+            try:
+                message = await subscription.get(settings.NOTIFICATION_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if message is None:
+                return
+            yield format_event(message)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@require_GET
+async def notification_stream(request):
+    user = await stream_user(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    channels = [user_channel(user.pk)] + [audience_channel(audience) for audience in audiences_for(user)]
+    return StreamingHttpResponse(
+        event_stream(channels),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
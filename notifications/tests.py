@@ -1,3 +1,740 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from store.models import Categories, FavouriteProduct, Order, OrderItem, Product
+from users.models import CustomUser, CustomerProfile, SellerProfile
+from . import inbox
+from .fcm_credentials import CredentialCache, metrics
+from .fcm_standin import FCMStandIn
+from .models import (
+    BroadcastCursor, BroadcastNotification, DeviceTopic, Notification, OrderNotification, PushOutbox, UnreadCounter,
+    UserDevice,
+)
+from .outbox import process_batch
+from .topics import sync_pending
+from .pubsub import hub
+from .utils import create_order_notification, notify_customers, notify_sellers, notify_user
+
+
+class FCMStandInTestCase(TestCase):
+    """Runs a local FCM stand-in and points the FCM settings at it"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fcm = FCMStandIn().start()
+        cls.fcm_settings = override_settings(
+            FCM_SEND_URL=cls.fcm.send_url, FCM_IID_URL=cls.fcm.iid_url, FCM_ACCESS_TOKEN="test-token"
+        )
+        cls.fcm_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fcm_settings.disable()
+        cls.fcm.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.fcm.messages.clear()
+        self.fcm.topics.clear()
+        self.fcm.unregistered.clear()
+        self.fcm.fail_next = 0
+        self.fcm.iid_requests = 0
+
+
+@override_settings(NOTIFICATION_COALESCE_SECONDS=0)
+class PushOutboxTests(FCMStandInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user("customer@example.com", "pass", is_active=True)
+        UserDevice.objects.create(user=self.user, token="good-token", platform="android")
+        UserDevice.objects.create(user=self.user, token="stale-token", platform="ios")
+        self.fcm.unregistered.add("stale-token")
+
+    def notify(self, order_id=1):
+        return notify_user(self.user, "Confirmed", "order_confirmation", payload={"order_id": order_id})
+
+    def test_push_queued_with_notification_and_delivered_by_worker(self):
+        notification = self.notify()
+        push = PushOutbox.objects.get(notification=notification)
+        self.assertEqual(push.status, PushOutbox.PENDING)
+        self.assertEqual(self.fcm.messages, [])
+
+        call_command("process_push_outbox", stdout=open("/dev/null", "w"))
+
+        push.refresh_from_db()
+        self.assertEqual(push.status, PushOutbox.SENT)
+        self.assertEqual(push.attempts, 1)
+        [message] = self.fcm.messages
+        self.assertEqual(message["token"], "good-token")
+        self.assertEqual(message["notification"]["title"], "Order #1 Confirmed!")
+        self.assertEqual(message["data"], {"notification_id": str(notification.id), "type": "order_confirmation", "order_id": "1"})
+        # Unregistered tokens are forgotten
+        self.assertFalse(UserDevice.objects.filter(token="stale-token").exists())
+
+    def test_rolled_back_notification_leaves_no_push(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.notify()
+            raise RuntimeError
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(PushOutbox.objects.exists())
+
+    def test_transient_failure_retried_for_failed_tokens_only(self):
+        UserDevice.objects.filter(token="stale-token").delete()
+        UserDevice.objects.create(user=self.user, token="second-token", platform="web")
+        self.fcm.fail_next = 1
+        self.notify()
+
+        self.assertEqual(process_batch()["retried"], 1)
+        push = PushOutbox.objects.get()
+        self.assertEqual(push.status, PushOutbox.PENDING)
+        self.assertGreater(push.available_at, timezone.now())
+        self.assertEqual(len(push.pending_tokens), 1)
+        # Not due yet
+        self.assertEqual(process_batch(), {})
+
+        PushOutbox.objects.update(available_at=timezone.now())
+        self.assertEqual(process_batch()["sent"], 1)
+        self.assertEqual(sorted(m["token"] for m in self.fcm.messages), ["good-token", "second-token"])
+
+    def test_duplicate_payload_skipped_by_constraint(self):
+        first = self.notify()
+        # Same user, type and payload: rejected by the unique constraint
+        duplicate = notify_user(self.user, "Again", "order_confirmation", payload={"order_id": 1})
+        self.assertIsNotNone(first)
+        self.assertIsNone(duplicate)
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(PushOutbox.objects.count(), 1)
+        self.assertIsNotNone(self.notify(order_id=2))
+
+    def test_duplicate_deduplication_key_skipped(self):
+        notify_user(self.user, "Hi", "account", deduplication_key="welcome")
+        notify_user(self.user, "Hi", "account", payload={"x": 1}, deduplication_key="welcome")
+        self.assertEqual(Notification.objects.count(), 1)
+
+    @override_settings(FCM_ACCESS_TOKEN="test-token")  # fresh credential cache
+    def test_one_token_refresh_for_many_sends(self):
+        metrics.reset()
+        for order_id in range(5):
+            self.notify(order_id)
+        process_batch()
+        counters = metrics.snapshot()
+        self.assertEqual(counters["token_refreshes"], 1)
+        # Five to the good token; the stale one is tried once and skipped for the rest of the batch
+        self.assertEqual(counters["sends"], 6)
+        self.assertFalse(UserDevice.objects.filter(token="stale-token").exists())
+
+    @override_settings(PUSH_OUTBOX_MAX_ATTEMPTS=2)
+    def test_dead_lettered_after_max_attempts(self):
+        self.fcm.fail_next = 100
+        self.notify()
+        process_batch()
+        PushOutbox.objects.update(available_at=timezone.now())
+        self.assertEqual(process_batch()["dead"], 1)
+        push = PushOutbox.objects.get()
+        self.assertEqual(push.status, PushOutbox.DEAD)
+        self.assertIn("503", push.last_error)
+
+
+@override_settings(NOTIFICATION_COALESCE_SECONDS=30)
+class CoalescingTests(FCMStandInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user("customer@example.com", "pass", is_active=True)
+        UserDevice.objects.create(user=self.user, token="phone", platform="android")
+
+    def release_pushes(self):
+        PushOutbox.objects.update(available_at=timezone.now())
+        return process_batch()
+
+    def test_rapid_updates_to_one_order_share_a_row_and_a_push(self):
+        first = notify_user(self.user, "Order #1 confirmed", "order_confirmation", {"order_id": 1, "product_ids": [4]})
+        notify_user(self.user, "Order #1 is on the way", "order_status_change", {"order_id": "1"})
+        last = notify_user(self.user, "Payment for #1 received", "payment_success", {"order_id": 1, "amount": "9"})
+        notify_user(self.user, "Order #2 confirmed", "order_confirmation", {"order_id": 2})
+        # A repeat of an update already folded in is dropped
+        self.assertIsNone(notify_user(self.user, "Order #1 is on the way", "order_status_change", {"order_id": 1}))
+
+        self.assertEqual(last.pk, first.pk)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(UnreadCounter.for_user(self.user), 2)
+        merged = Notification.objects.get(pk=first.pk)
+        self.assertEqual(merged.notification_type, "payment_success")
+        self.assertEqual(merged.message.split("\n"), [
+            "Order #1 confirmed", "Order #1 is on the way", "Payment for #1 received",
+        ])
+        self.assertEqual(merged.payload, {"order_id": 1, "product_ids": [4], "amount": "9"})
+        self.assertEqual(merged.product_ids, ["4"])
+
+        # Held back for the window, then one push per order
+        self.assertEqual(process_batch(), {})
+        self.assertEqual(self.release_pushes()["sent"], 2)
+        pushed = {message["data"]["order_id"]: message for message in self.fcm.messages}
+        self.assertEqual(pushed["1"]["data"]["type"], "payment_success")
+        self.assertEqual(pushed["1"]["notification"]["title"], "Payment Successful")
+
+    def test_every_merged_payload_stays_deduplicated(self):
+        first = notify_user(self.user, "Order #1 confirmed", "order_confirmation", {"order_id": 1, "product_ids": [4]})
+        created_at = first.created_at
+        notify_user(self.user, "Order #1 is on the way", "order_status_change", {"order_id": 1})
+        merged = Notification.objects.get(pk=first.pk)
+        # Stays where it was in keyset pages
+        self.assertEqual(merged.created_at, created_at)
+        self.assertEqual(len(merged.merged_keys), 1)
+
+        # After the push left, repeats of either update are still duplicates
+        self.release_pushes()
+        confirmed = {"order_id": 1, "product_ids": [4]}
+        self.assertIsNone(notify_user(self.user, "Order #1 confirmed", "order_confirmation", confirmed))
+        self.assertIsNone(notify_user(self.user, "Order #1 is on the way", "order_status_change", {"order_id": 1}))
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_updates_after_the_push_left_start_a_new_row(self):
+        first = notify_user(self.user, "Order #1 confirmed", "order_confirmation", {"order_id": 1})
+        self.release_pushes()
+        second = notify_user(self.user, "Order #1 delivered", "order_status_change", {"order_id": 1})
+        self.assertNotEqual(second.pk, first.pk)
+
+        # Read notifications are not reopened either
+        second.mark_as_read()
+        third = notify_user(self.user, "Payment for #1 received", "payment_success", {"order_id": 1})
+        self.assertNotEqual(third.pk, second.pk)
+
+
+class PushTopicTests(FCMStandInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user("customer@example.com", "pass", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def register(self, token, **extra):
+        response = self.client.post("/api/notifications/devices/", {"token": token, "platform": "android", **extra})
+        self.assertEqual(response.status_code, 201)
+
+    def sync(self):
+        call_command("sync_push_topics", stdout=StringIO())
+
+    def test_registration_subscribes_audience_city_and_followed_sellers(self):
+        seller = SellerProfile.objects.create(
+            user=CustomUser.objects.create_user("seller@example.com", "pass", role="seller"), business_name="Shop"
+        )
+        product = Product.objects.create(
+            title="P", unit_price=5, inventory=10, category=Categories.objects.create(title="Food"), vendor=seller
+        )
+        customer = CustomerProfile.objects.create(user=self.user)
+        FavouriteProduct.objects.create(customer=customer, product=product)
+
+        self.register("phone", city="Lahore")
+        self.assertEqual(
+            set(DeviceTopic.objects.filter(token="phone").values_list("topic", flat=True)),
+            {"all", "customers", f"seller-{seller.pk}", "city-lahore"},
+        )
+        self.sync()
+        self.assertEqual(self.fcm.iid_requests, 4)
+        self.assertIn("phone", self.fcm.topics["city-lahore"])
+        self.assertFalse(DeviceTopic.objects.exclude(status=DeviceTopic.SUBSCRIBED).exists())
+
+        # Unfavouriting drops the seller's topic once committed, unregistering the rest
+        with self.captureOnCommitCallbacks(execute=True):
+            FavouriteProduct.objects.all().delete()
+            self.assertEqual(DeviceTopic.objects.filter(status=DeviceTopic.UNSUBSCRIBE).count(), 0)
+        self.sync()
+        self.assertNotIn("phone", self.fcm.topics[f"seller-{seller.pk}"])
+        self.client.delete("/api/notifications/devices/", {"token": "phone"})
+        self.sync()
+        self.assertFalse(any(self.fcm.topics.values()))
+        self.assertFalse(DeviceTopic.objects.exists())
+
+    def test_sync_batches_tokens_per_topic_and_drops_invalid_ones(self):
+        for i in range(1500):
+            UserDevice.objects.create(user=self.user, token=f"token-{i}", platform="android")
+        DeviceTopic.objects.bulk_create(DeviceTopic(token=f"token-{i}", topic="customers") for i in range(1500))
+        self.fcm.unregistered.add("token-7")
+
+        self.sync()
+        # 1000 tokens per call
+        self.assertEqual(self.fcm.iid_requests, 2)
+        self.assertEqual(len(self.fcm.topics["customers"]), 1499)
+        self.assertFalse(UserDevice.objects.filter(token="token-7").exists())
+        self.assertFalse(DeviceTopic.objects.filter(token="token-7").exists())
+
+    def test_failed_sync_backs_off(self):
+        self.register("phone")
+        self.fcm.fail_next = 10
+        self.sync()
+        pending = DeviceTopic.objects.filter(status=DeviceTopic.SUBSCRIBE)
+        self.assertEqual(pending.count(), 2)
+        self.assertTrue(all(row.attempts == 1 and row.next_attempt_at > timezone.now() for row in pending))
+
+        # Not retried before its backoff is up
+        self.fcm.fail_next = 0
+        requests = self.fcm.iid_requests
+        self.sync()
+        self.assertEqual(self.fcm.iid_requests, requests)
+        pending.update(next_attempt_at=timezone.now())
+        self.sync()
+        self.assertEqual(self.fcm.topics["customers"], {"phone"})
+        self.assertEqual(set(DeviceTopic.objects.values_list("attempts", flat=True)), {0})
+
+    def test_failing_changes_do_not_starve_newer_ones(self):
+        DeviceTopic.objects.bulk_create(DeviceTopic(token=f"stuck-{i}", topic="all") for i in range(3))
+        self.fcm.fail_next = 1
+        self.assertEqual(sync_pending(3)["failed"], 3)
+
+        DeviceTopic.objects.bulk_create(DeviceTopic(token=f"new-{i}", topic="customers") for i in range(3))
+        self.assertEqual(sync_pending(3)["subscribed"], 3)
+        self.assertEqual(self.fcm.topics["customers"], {"new-0", "new-1", "new-2"})
+
+    def test_cascade_delete_skips_topic_refresh(self):
+        seller = SellerProfile.objects.create(
+            user=CustomUser.objects.create_user("seller@example.com", "pass", role="seller"), business_name="Shop"
+        )
+        category = Categories.objects.create(title="Food")
+        customer = CustomerProfile.objects.create(user=self.user)
+        for i in range(3):
+            product = Product.objects.create(title=f"P{i}", unit_price=5, inventory=10, category=category, vendor=seller)
+            FavouriteProduct.objects.create(customer=customer, product=product)
+        with mock.patch("notifications.signals.refresh_customer") as refresh, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            customer.delete()
+        refresh.assert_not_called()
+        self.assertEqual(callbacks, [])
+
+    def test_broadcast_is_one_topic_message(self):
+        for i in range(50):
+            UserDevice.objects.create(user=self.user, token=f"token-{i}", platform="android")
+        broadcast = notify_customers("20% off today", "discount_offer", {"deal_id": 3})
+
+        counts = process_batch()
+        self.assertEqual(counts["sent"], 1)
+        self.assertEqual(len(self.fcm.messages), 1)
+        message = self.fcm.messages[0]
+        self.assertEqual(message["topic"], "customers")
+        self.assertNotIn("token", message)
+        self.assertEqual(message["data"]["broadcast_id"], str(broadcast.pk))
+        self.assertEqual(message["notification"]["body"], "20% off today")
+
+
+class BroadcastInboxTests(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user("seller@example.com", "pass", role=CustomUser.SELLER, is_active=True)
+        self.customer = CustomUser.objects.create_user("customer@example.com", "pass", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def inbox(self):
+        return self.client.get("/api/notifications/").json()["results"]
+
+    def test_broadcast_is_one_row_merged_into_each_inbox(self):
+        Notification.objects.create(user=self.seller, message="Personal", notification_type="account")
+        # One INSERT and one topic push (inside a savepoint), however many sellers there are
+        with self.assertNumQueries(4):
+            notify_sellers("New restaurant nearby", "new_restaurant", {"vendor_id": 7})
+        # Same payload again is ignored
+        self.assertIsNone(notify_sellers("New restaurant nearby", "new_restaurant", {"vendor_id": 7}))
+        self.assertEqual(BroadcastNotification.objects.count(), 1)
+
+        entries = self.inbox()
+        self.assertEqual([(e["kind"], e["message"]) for e in entries],
+                         [("broadcast", "New restaurant nearby"), ("personal", "Personal")])
+        self.assertFalse(entries[0]["is_read"])
+
+        # Not addressed to customers
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.inbox(), [])
+        notify_customers("10% off", "discount_offer")
+        self.assertEqual([e["message"] for e in self.inbox()], ["10% off"])
+
+    def test_read_state_tracked_by_cursor(self):
+        first = notify_sellers("One", "discount_offer", {"code": "A"})
+        notify_sellers("Two", "discount_offer", {"code": "B"})
+
+        self.client.patch(f"/api/notifications/broadcasts/{first.pk}/", {})
+        self.assertEqual({e["message"]: e["is_read"] for e in self.inbox()}, {"One": True, "Two": False})
+
+        response = self.client.post("/api/notifications/mark-all-read/")
+        self.assertEqual(response.json()["marked_read"], 1)
+        self.assertTrue(all(e["is_read"] for e in self.inbox()))
+        self.assertEqual(BroadcastCursor.objects.get(user=self.seller).read_ids, [])
+
+        notify_sellers("Three", "discount_offer", {"code": "C"})
+        self.assertFalse(self.inbox()[0]["is_read"])
+
+    def test_read_ids_folded_into_cursor(self):
+        broadcasts = [notify_sellers(f"B{i}", "discount_offer", {"n": i}) for i in range(4)]
+        now = timezone.now()
+        for i, broadcast in enumerate(broadcasts):
+            BroadcastNotification.objects.filter(pk=broadcast.pk).update(created_at=now + timedelta(seconds=i))
+            broadcast.refresh_from_db()
+
+        for broadcast in (broadcasts[2], broadcasts[0]):
+            inbox.mark_broadcast_read(self.seller, broadcast)
+        cursor = BroadcastCursor.objects.get(user=self.seller)
+        # B0 is the oldest and read: folded into read_until; B2 waits behind unread B1
+        self.assertEqual((cursor.read_until, cursor.read_ids), (broadcasts[0].created_at, [broadcasts[2].pk]))
+
+        inbox.mark_broadcast_read(self.seller, broadcasts[1])
+        cursor.refresh_from_db()
+        self.assertEqual((cursor.read_until, cursor.read_ids), (broadcasts[2].created_at, []))
+        self.assertEqual({e["message"]: e["is_read"] for e in self.inbox()},
+                         {"B0": True, "B1": True, "B2": True, "B3": False})
+
+        # Ids of deleted broadcasts are dropped on save
+        cursor.read_ids = [broadcasts[3].pk, 999]
+        cursor.save()
+        self.assertEqual(cursor.read_ids, [broadcasts[3].pk])
+
+    def test_cursor_created_by_a_concurrent_request(self):
+        broadcast = notify_sellers("One", "discount_offer")
+        self.assertIsNone(inbox.get_cursor(self.seller).pk)
+        # Another request saves the user's first cursor in the meantime
+        BroadcastCursor.objects.create(user=self.seller)
+        inbox.mark_broadcast_read(self.seller, broadcast)
+        self.assertEqual(BroadcastCursor.objects.get(user=self.seller).read_until, broadcast.created_at)
+
+    def test_clear_hides_sent_broadcasts_only(self):
+        notify_sellers("Old", "new_restaurant", {"vendor_id": 1})
+        self.assertEqual(self.client.delete("/api/notifications/clear/").json()["deleted"], 1)
+        self.assertEqual(self.inbox(), [])
+        notify_sellers("New", "new_restaurant", {"vendor_id": 2})
+        self.assertEqual([e["message"] for e in self.inbox()], ["New"])
+
+    def test_keyset_pages_walk_merged_inbox_without_count(self):
+        now = timezone.now()
+        for i in range(13):
+            Notification.objects.create(user=self.seller, message=f"p{i}", notification_type="new_order")
+            notify_sellers(f"b{i}", "discount_offer", {"n": i})
+        # Collide timestamps across kinds so the tie-breakers matter
+        for model in (Notification, BroadcastNotification):
+            for row in model.objects.all():
+                model.objects.filter(pk=row.pk).update(created_at=now + timedelta(seconds=row.pk // 2))
+
+        seen, url = [], "/api/notifications/"
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client.get(url).json()
+            # Cursor (first page only), personal page, broadcast page
+            self.assertLessEqual(len(queries), 3)
+            self.assertFalse(any("COUNT(" in q["sql"] for q in queries))
+            self.assertNotIn("count", page)
+            seen += [(e["kind"], e["id"], e["created_at"]) for e in page["results"]]
+            url = page["next"]
+        self.assertEqual(len(seen), 26)
+        self.assertEqual(len(set(seen)), 26)
+        self.assertEqual([e[2] for e in seen], sorted((e[2] for e in seen), reverse=True))
+
+        page = self.client.get("/api/notifications/?type=new_order").json()
+        self.assertEqual({e["notification_type"] for e in page["results"]}, {"new_order"})
+        self.assertEqual(len(page["results"]), 10)
+        self.assertEqual(self.client.get("/api/notifications/?cursor=bogus").status_code, 404)
+
+    def test_users_joining_later_do_not_see_earlier_broadcasts(self):
+        notify_sellers("Before", "new_restaurant", {"vendor_id": 1})
+        late = CustomUser.objects.create_user("late@example.com", "pass", role=CustomUser.SELLER, is_active=True)
+        self.client.force_authenticate(late)
+        self.assertEqual(self.inbox(), [])
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("customer@example.com", "pass", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def notify(self, n):
+        return [notify_user(self.user, "Hi", "account", payload={"n": i}) for i in range(n)]
+
+    def unread(self):
+        return self.client.get("/api/notifications/unread-count/").json()["unread_count"]
+
+    def test_counter_follows_create_read_and_delete(self):
+        first, second, third = self.notify(3)
+        self.assertEqual(UnreadCounter.for_user(self.user), 3)
+
+        self.client.patch(f"/api/notifications/{first.pk}/", {})
+        second.mark_as_read()
+        second.mark_as_read()  # already read: no change
+        self.assertEqual(UnreadCounter.for_user(self.user), 1)
+
+        third.delete()
+        self.assertEqual(UnreadCounter.for_user(self.user), 0)
+
+        self.notify(5)
+        self.client.post("/api/notifications/mark-all-read/")
+        self.assertEqual(UnreadCounter.for_user(self.user), 0)
+
+        Notification.objects.filter(user=self.user).update(is_read=False)  # bypasses the counter
+        self.client.delete("/api/notifications/clear/")
+        self.assertEqual(UnreadCounter.for_user(self.user), 0)
+
+    def test_endpoint_adds_unread_broadcasts(self):
+        self.notify(2)
+        notify_customers("10% off", "discount_offer")
+        # Counter row, broadcast cursor, unread broadcasts
+        with self.assertNumQueries(3):
+            self.assertEqual(self.unread(), 3)
+
+    def test_reconcile_fixes_drift(self):
+        self.notify(2)
+        UnreadCounter.objects.filter(user=self.user).update(count=7)
+        out = StringIO()
+        call_command("reconcile_unread_counters", "--dry-run", stdout=out)
+        self.assertIn("Would fix 1 counter(s)", out.getvalue())
+        self.assertEqual(UnreadCounter.for_user(self.user), 7)
+        call_command("reconcile_unread_counters", stdout=StringIO())
+        self.assertEqual(UnreadCounter.for_user(self.user), 2)
+
+
+class OrderLinkTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("customer@example.com", "pass", is_active=True)
+        customer = CustomerProfile.objects.create(user=self.user)
+        self.order = Order.objects.create(customer=customer, delivery_address="Street 1")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_order_linked_at_write_time_whatever_the_id_type(self):
+        as_int = notify_user(self.user, "Delayed", "delivery_delay", {"order_id": self.order.id})
+        as_str = notify_user(self.user, "Paid", "payment_success", {"order_id": str(self.order.id)})
+        notify_user(self.user, "Hi", "account")
+        for notification in (as_int, as_str):
+            self.assertEqual(notification.order_id, self.order.id)
+            self.assertEqual(notification.payload["order_id"], self.order.id)
+
+        response = self.client.get(f"/api/notifications/order/{self.order.id}/")
+        ids = {n["id"] for n in response.json()}
+        self.assertTrue({as_int.id, as_str.id} <= ids)
+        self.assertFalse(Notification.objects.filter(pk__in=ids, order__isnull=True).exists())
+
+    def test_product_ids_stored_at_write_time(self):
+        category = Categories.objects.create(title="Food")
+        seller = SellerProfile.objects.create(
+            user=CustomUser.objects.create_user("seller@example.com", "pass", role="seller"), business_name="Shop"
+        )
+        products = [
+            Product.objects.create(title=f"P{i}", unit_price=5, inventory=10, category=category, vendor=seller)
+            for i in range(2)
+        ]
+        for product in products:
+            OrderItem.objects.create(order=self.order, product=product, quantity=1, unit_price=5)
+        expected = [str(product.id) for product in products]
+
+        notification = notify_user(self.user, "Delayed", "delivery_delay", {"order_id": self.order.id})
+        self.assertEqual(notification.product_ids, expected)
+        for i in range(12):
+            create_order_notification(self.order, f"Update {i}", "order_status_change")
+
+        # Cursor, personal page, broadcast page: nothing per row
+        with self.assertNumQueries(3):
+            results = self.client.get("/api/notifications/").json()["results"]
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(entry["product_ids"] == expected for entry in results))
+
+    def test_status_history_from_linked_snapshots(self):
+        self.order.delivery_status = "ON_ROUTE"
+        create_order_notification(self.order, "On its way", "order_status_change", {"delivery_status": "PREPARING"})
+        history = self.order.get_status_history()
+        self.assertEqual(history[0]["status"], "ON_ROUTE")
+        self.assertEqual(history[0]["message"], "On its way")
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("customer@example.com", "pass", is_active=True)
+        customer = CustomerProfile.objects.create(user=self.user)
+        self.order = Order.objects.create(customer=customer, delivery_address="Street 1")
+
+    def age(self, notification, days):
+        Notification.objects.filter(pk=notification.pk).update(created_at=timezone.now() - timedelta(days=days))
+
+    def prune(self, *args):
+        out = StringIO()
+        call_command("prune_notifications", "--batch-size", "2", *args, stdout=out)
+        return out.getvalue()
+
+    @override_settings(NOTIFICATION_RETENTION={
+        "default": {"read_days": 90, "unread_days": None},
+        "order_status_change": {"read_days": 30, "unread_days": 60},
+    })
+    def test_prunes_by_policy_and_keeps_latest_order_snapshot(self):
+        Notification.objects.filter(user=self.user).delete()  # from the order signals
+        snapshots = [create_order_notification(self.order, f"Update {i}", "order_status_change") for i in range(4)]
+        snapshots[1].mark_as_read()
+        for days, notification in zip((70, 50, 40, 35), snapshots):
+            self.age(notification, days)
+        old_read = notify_user(self.user, "Hi", "account", payload={"n": 1})
+        old_unread = notify_user(self.user, "Hi", "account", payload={"n": 2})
+        old_read.mark_as_read()
+        self.age(old_read, 100)
+        self.age(old_unread, 400)
+
+        self.assertIn("Would prune 3 notification(s)", self.prune("--dry-run"))
+        self.assertEqual(Notification.objects.count(), 6)
+
+        output = self.prune()
+        self.assertIn("Pruned 3 notification(s), 0 sent push(es) and compacted 1 order snapshot(s)", output)
+        # Unread and 70 days old, read and 50 days old, read account notification
+        remaining = set(Notification.objects.values_list("pk", flat=True))
+        self.assertEqual(remaining, {snapshots[2].pk, snapshots[3].pk, old_unread.pk})
+        # Both remaining snapshots are kept, but only the newest keeps its JSON
+        self.assertEqual(OrderNotification.objects.get(notification=snapshots[2]).snapshot, {})
+        self.assertIn("items", OrderNotification.objects.get(notification=snapshots[3]).snapshot)
+        self.assertEqual(UnreadCounter.for_user(self.user), 3)
+        self.assertIn("Pruned 0 notification(s), 0 sent push(es) and compacted 0", self.prune())
+
+    @override_settings(PUSH_OUTBOX_SENT_RETENTION_DAYS=7)
+    def test_prunes_old_sent_pushes(self):
+        PushOutbox.objects.all().delete()  # from the order signals
+        now = timezone.now()
+        old = [
+            PushOutbox.objects.create(user=self.user, title="Old", body="", status=PushOutbox.SENT,
+                                      sent_at=now - timedelta(days=8))
+            for _ in range(3)
+        ]
+        recent = PushOutbox.objects.create(user=self.user, title="New", body="", status=PushOutbox.SENT,
+                                           sent_at=now - timedelta(days=1))
+        dead = PushOutbox.objects.create(user=self.user, title="Dead", body="", status=PushOutbox.DEAD)
+        PushOutbox.objects.filter(pk=dead.pk).update(created_at=now - timedelta(days=30))
+        pending = PushOutbox.objects.create(user=self.user, title="Pending", body="")
+
+        self.assertIn("Would prune 0 notification(s), 3 sent push(es)", self.prune("--dry-run"))
+        self.assertEqual(PushOutbox.objects.count(), 6)
+        self.assertIn("Pruned 0 notification(s), 3 sent push(es)", self.prune())
+        self.assertEqual(set(PushOutbox.objects.values_list("pk", flat=True)), {recent.pk, dead.pk, pending.pk})
+        self.assertFalse(PushOutbox.objects.filter(pk__in=[row.pk for row in old]).exists())
+
+
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("seller@example.com", "pass", role=CustomUser.SELLER, is_active=True)
+        self.headers = {"authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def notify_committed(self, notify):
+        with self.captureOnCommitCallbacks(execute=True):
+            notify()
+
+    async def next_event(self, stream):
+        chunk = await asyncio.wait_for(anext(stream), 2)
+        event, data = chunk.decode().strip().split("\n")
+        self.assertEqual(event, "event: notification")
+        return json.loads(data[len("data: "):])
+
+    async def test_committed_notifications_pushed_to_open_stream(self):
+        response = await self.async_client.get("/api/notifications/stream/", headers=self.headers)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = response.streaming_content
+        self.assertEqual(await anext(stream), b": connected\n\n")
+        self.assertEqual(hub.connection_count(), 1)
+
+        await sync_to_async(self.notify_committed)(
+            lambda: notify_user(self.user, "Order placed", "new_order", {"order_id": 5})
+        )
+        event = await self.next_event(stream)
+        self.assertEqual((event["kind"], event["message"]), ("personal", "Order placed"))
+
+        await sync_to_async(self.notify_committed)(lambda: notify_sellers("Sale", "discount_offer"))
+        event = await self.next_event(stream)
+        self.assertEqual((event["kind"], event["message"]), ("broadcast", "Sale"))
+
+        # A client disconnect cancels the idle read, as the ASGI handler does
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(hub.connection_count(), 0)
+
+    async def test_rejects_missing_or_bad_token(self):
+        response = await self.async_client.get("/api/notifications/stream/")
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get("/api/notifications/stream/", headers={"authorization": "Bearer bogus"})
+        self.assertEqual(response.status_code, 401)
+        # The JWT itself is never accepted in the query string
+        token = self.headers["authorization"][len("Bearer "):]
+        response = await self.async_client.get(f"/api/notifications/stream/?token={token}")
+        self.assertEqual(response.status_code, 401)
+
+    async def test_ticket_opens_stream_until_it_expires(self):
+        response = await self.async_client.post("/api/notifications/stream/ticket/", headers=self.headers)
+        ticket = response.json()["ticket"]
+        self.assertNotIn(self.headers["authorization"][len("Bearer "):], ticket)
+
+        response = await self.async_client.get("/api/notifications/stream/", {"ticket": ticket})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await anext(response.streaming_content), b": connected\n\n")
+        await response.streaming_content.aclose()
+
+        response = await self.async_client.get("/api/notifications/stream/", {"ticket": ticket + "x"})
+        self.assertEqual(response.status_code, 401)
+        with override_settings(NOTIFICATION_STREAM_TICKET_SECONDS=-1):
+            response = await self.async_client.get("/api/notifications/stream/", {"ticket": ticket})
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(DEBUG=False)
+    def test_benchmark_refuses_outside_debug(self):
+        with self.assertRaisesMessage(CommandError, "DEBUG"):
+            call_command("benchmark_stream", "--connections", "1", stdout=StringIO())
+
+    @override_settings(DEBUG=True)
+    def test_benchmark_refuses_a_non_test_database(self):
+        with mock.patch.dict(connection.settings_dict, NAME="wadiconnect"):
+            with self.assertRaisesMessage(CommandError, "test database (test_wadiconnect)"):
+                call_command("benchmark_stream", "--connections", "1", stdout=StringIO())
+        self.assertFalse(CustomUser.objects.filter(email__startswith="stream-bench-").exists())
+
+
+class CredentialCacheTests(TestCase):
+    def loader(self, lifetime):
+        def load():
+            self.minted += 1
+            return f"token-{self.minted}", time.time() + lifetime
+        return load
+
+    def setUp(self):
+        self.minted = 0
+
+    def test_token_reused_until_refresh_margin(self):
+        credentials = CredentialCache(self.loader(3600), refresh_margin=300)
+        threads = [threading.Thread(target=credentials.token) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(credentials.token(), "token-1")
+        self.assertEqual(self.minted, 1)
+
+    def test_refreshed_proactively_before_expiry(self):
+        # Inside the margin: still valid, but the caller refreshes it
+        credentials = CredentialCache(self.loader(200), refresh_margin=300)
+        self.assertEqual(credentials.token(), "token-1")
+        self.assertEqual(credentials.token(), "token-2")
+
+    def test_invalidated_token_replaced(self):
+        credentials = CredentialCache(self.loader(3600))
+        credentials.token()
+        credentials.invalidate("token-1")
+        self.assertEqual(credentials.token(), "token-2")
+
+    def test_token_shared_between_workers_through_cache(self):
+        shared = caches["default"]
+        shared.clear()
+        first = CredentialCache(self.loader(3600), shared_cache=shared)
+        second = CredentialCache(self.loader(3600), shared_cache=shared)
+        self.assertEqual(first.token(), second.token())
+        self.assertEqual(self.minted, 1)
@@ -0,0 +1,197 @@
+"""
+FCM topic subscriptions for multicast pushes.
+
+Every device is kept subscribed to topics derived from its owner and its
+registration: the broadcast audiences the user belongs to (``all``,
+``customers`` or ``sellers``), ``seller-<id>`` for every seller whose products
+a customer has favourited, and ``city-<slug>`` when the device registered with
+a city. A broadcast then goes out as one topic message instead of one send
+per device.
+
+Changes are only recorded here, as DeviceTopic rows waiting to subscribe or
+unsubscribe; ``manage.py sync_push_topics`` applies them with IID
+batchAdd/batchRemove calls of up to 1000 tokens per topic. A change that
+fails is retried with exponential backoff, and due changes are read oldest
+first, so rows that keep failing never hold back newer ones.
+"""
+import logging
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import fcm_admin
+from .fcm_client import get_fcm_client
+from .inbox import audiences_for
+from .models import DeviceTopic, UserDevice
+
+logger = logging.getLogger(__name__)
+
+
+def audience_topic(audience):
+    return audience
+
+
+def seller_topic(seller_id):
+    return f"seller-{seller_id}"
+
+
+def city_topic(city):
+    slug = slugify(city or '')
+    return f"city-{slug}" if slug else None
+
+
+def topics_for(device):
+    from store.models import FavouriteProduct
+    from users.models import CustomUser
+
+    user = device.user
+    topics = {audience_topic(audience) for audience in audiences_for(user)}
+    if user.role == CustomUser.CUSTOMER:
+        followed = (
+            FavouriteProduct.objects.filter(customer__user=user)
+            .values_list('product__vendor_id', flat=True).distinct()
+        )
+        topics.update(seller_topic(seller_id) for seller_id in followed if seller_id)
+    topics.add(city_topic(device.city))
+    topics.discard(None)
+    return topics
+
+
+def set_topics(token, topics):
+    """Record the topics a token should belong to; FCM is updated by the next sync"""
+    current = dict(DeviceTopic.objects.filter(token=token).values_list('topic', 'status'))
+    resubscribe = [topic for topic in topics if current.get(topic) == DeviceTopic.UNSUBSCRIBE]
+    new = [DeviceTopic(token=token, topic=topic) for topic in topics if topic not in current]
+    dropped = [topic for topic, status in current.items() if topic not in topics and status != DeviceTopic.UNSUBSCRIBE]
+    # A changed request starts over: due now, with no failures behind it
+    changed = {'attempts': 0, 'next_attempt_at': timezone.now()}
+    with transaction.atomic():
+        if resubscribe:
+            DeviceTopic.objects.filter(token=token, topic__in=resubscribe).update(
+                status=DeviceTopic.SUBSCRIBE, **changed
+            )
+        if new:
+            DeviceTopic.objects.bulk_create(new, ignore_conflicts=True)
+        if dropped:
+            # Never synced: nothing to undo at FCM
+            DeviceTopic.objects.filter(token=token, topic__in=dropped, status=DeviceTopic.SUBSCRIBE).delete()
+            DeviceTopic.objects.filter(token=token, topic__in=dropped).update(status=DeviceTopic.UNSUBSCRIBE, **changed)
+
+
+def refresh_device(device):
+    set_topics(device.token, topics_for(device))
+
+
+def refresh_user(user_id):
+    for device in UserDevice.objects.filter(user_id=user_id).select_related('user'):
+        refresh_device(device)
+
+
+def refresh_customer(customer_id):
+    from users.models import CustomerProfile
+
+    user_id = CustomerProfile.objects.filter(pk=customer_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        refresh_user(user_id)
+
+
+def release_token(token):
+    """A device was unregistered but its token may still be live: unsubscribe it everywhere"""
+    set_topics(token, set())
+
+
+def forget_tokens(tokens):
+    """Tokens FCM rejected; it has already dropped them from every topic"""
+    DeviceTopic.objects.filter(token__in=tokens).delete()
+
+
+def backoff(attempts):
+    delay = min(
+        settings.PUSH_TOPIC_SYNC_MAX_BACKOFF_SECONDS,
+        settings.PUSH_TOPIC_SYNC_BACKOFF_SECONDS * 2 ** (attempts - 1),
+    )
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def retry_later(pks):
+    """Push failed changes back by a backoff that grows with their failures"""
+    now = timezone.now()
+    by_attempts = defaultdict(list)
+    for pk, attempts in pending_changes().filter(pk__in=pks).values_list('pk', 'attempts'):
+        by_attempts[attempts].append(pk)
+    for attempts, group in by_attempts.items():
+        DeviceTopic.objects.filter(pk__in=group).update(
+            attempts=attempts + 1, next_attempt_at=now + backoff(attempts + 1)
+        )
+
+
+def pending_changes():
+    return DeviceTopic.objects.filter(status__in=[DeviceTopic.SUBSCRIBE, DeviceTopic.UNSUBSCRIBE])
+
+
+def sync_pending(limit):
+    """Apply up to `limit` pending membership changes; returns counts by result"""
+    counts = defaultdict(int)
+    rows = list(
+        pending_changes().filter(next_attempt_at__lte=timezone.now())
+        .order_by('next_attempt_at', 'pk').values_list('pk', 'token', 'topic', 'status')[:limit]
+    )
+    if not rows:
+        return counts
+    try:
+        access_token = fcm_admin.get_access_token()
+    except Exception as exc:
+        logger.error(f"Topic sync skipped, no FCM credentials: {exc}")
+        counts['failed'] += len(rows)
+        return counts
+
+    groups = defaultdict(list)
+    for pk, token, topic, status in rows:
+        groups[status, topic].append((pk, token))
+    calls = [
+        (status, topic, members[start:start + fcm_admin.IID_MAX_TOKENS])
+        for (status, topic), members in groups.items()
+        for start in range(0, len(members), fcm_admin.IID_MAX_TOKENS)
+    ]
+    client = get_fcm_client()
+
+    def call(batch):
+        status, topic, members = batch
+        action = 'batchAdd' if status == DeviceTopic.SUBSCRIBE else 'batchRemove'
+        return fcm_admin.iid_batch(client.session, access_token, action, topic, [token for _, token in members])
+
+    invalid, failed = set(), []
+    for (status, topic, members), (outcome, results) in zip(calls, client.executor.map(call, calls)):
+        if outcome != fcm_admin.SENT:
+            logger.warning(f"Topic sync for {topic} failed, will retry: {results}")
+            failed.extend(pk for pk, _ in members)
+            continue
+        done = []
+        for (pk, token), error in zip(members, results):
+            if error is None:
+                done.append(pk)
+            elif error.upper() in fcm_admin.INVALID_IID_ERRORS:
+                invalid.add(token)
+            else:
+                logger.warning(f"Topic sync of {token[:16]} to {topic} failed: {error}")
+                failed.append(pk)
+        if status == DeviceTopic.SUBSCRIBE:
+            DeviceTopic.objects.filter(pk__in=done, status=status).update(status=DeviceTopic.SUBSCRIBED, attempts=0)
+            counts['subscribed'] += len(done)
+        else:
+            DeviceTopic.objects.filter(pk__in=done, status=status).delete()
+            counts['unsubscribed'] += len(done)
+
+    if failed:
+        retry_later(failed)
+        counts['failed'] += len(failed)
+    if invalid:
+        UserDevice.objects.filter(token__in=invalid).delete()
+        forget_tokens(invalid)
+        counts['invalid'] += len(invalid)
+    return counts
@@ -2,17 +2,25 @@ from django.urls import path
 from .api import (
     NotificationListAPI,
     NotificationDetailAPI,
+    BroadcastDetailAPI,
+    UnreadCountAPI,
     MarkAllAsReadAPI,
     DeliveryDelayAPI,   # ✅ Import added
     RestaurantReplyAPI,
     ClearAllNotificationsAPI,
     DeviceRegistrationAPI,
-    OrderNotificationsAPI    
+    OrderNotificationsAPI,
+    StreamTicketAPI,
 )
+from .stream import notification_stream
 
 urlpatterns = [
     path('', NotificationListAPI.as_view(), name='notification-list'),
     path('<int:pk>/', NotificationDetailAPI.as_view(), name='notification-detail'),
+    path('broadcasts/<int:pk>/', BroadcastDetailAPI.as_view(), name='broadcast-detail'),
+    path('stream/', notification_stream, name='notification-stream'),
+    path('stream/ticket/', StreamTicketAPI.as_view(), name='notification-stream-ticket'),
+    path('unread-count/', UnreadCountAPI.as_view(), name='unread-count'),
     path('mark-all-read/', MarkAllAsReadAPI.as_view(), name='mark-all-read'),
     path('delivery-delay/<int:order_id>/', DeliveryDelayAPI.as_view(), name='delivery-delay'),
     path('restaurant-reply/<int:review_id>/', RestaurantReplyAPI.as_view(), name='restaurant-reply'),
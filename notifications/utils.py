@@ -1,7 +1,11 @@
-from .models import Notification, OrderNotification, UserDevice
-from django.db import IntegrityError
+from .models import BroadcastNotification, Notification, OrderNotification, PushOutbox, order_id_from, payload_hash
+from .stream import publish_notification
+from .topics import audience_topic
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 import logging
-from .fcm_admin import send_push_notification
 
 logger = logging.getLogger(__name__)
 def get_notification_content(notification_type, context):
@@ -20,6 +24,8 @@ def get_notification_content(notification_type, context):
         'restaurant_order_cancellation': f"Order #{order_id} Cancelled by Customer",
         'payment_received': "Payment Received",
         'account': "Account Update",
+        'new_restaurant': "New Restaurant",
+        'discount_offer': "Special Offer",
     }
 
     bodies = {
@@ -39,79 +45,178 @@ def get_notification_content(notification_type, context):
     return titles.get(notification_type, "New Notification"), bodies.get(notification_type, "You have a new update.")
 
 
-def notify_user(user, message, notification_type, payload=None, deduplication_key=None):
-    try:
-        # 1. Prevent duplicates
-        if deduplication_key and Notification.objects.filter(deduplication_key=deduplication_key).exists():
-            return
+def product_ids_for(payload, order_id):
+    """Product ids for a notification: from the payload, else from the order's items"""
+    if payload and payload.get('product_ids') is not None:
+        return [str(product_id) for product_id in payload['product_ids']]
+    if order_id is None:
+        return []
+    from store.models import OrderItem
+    return [
+        str(product_id) for product_id in
+        OrderItem.objects.filter(order_id=order_id).order_by('id').values_list('product_id', flat=True)
+    ]
 
-        if not deduplication_key and Notification.objects.filter(
-            user=user,
-            notification_type=notification_type,
-            payload=payload or {}
-        ).exists():
-            return
 
-        # 2. Create notification in DB
-        notification = Notification.objects.create(
+def push_data(notification):
+    return {
+        "notification_id": str(notification.id),
+        "type": notification.notification_type,
+        # Ensure all values in .data are strings
+        **{k: str(v) for k, v in (notification.payload or {}).items()}
+    }
+
+
+def pending_order_push(user, order_id, window):
+    """
+    The user's push for a notification about this order written in the last
+    `window` seconds and not yet picked up by a worker, locked; None if there is none.
+    """
+    return (
+        PushOutbox.objects.select_for_update()
+        .select_related('notification')
+        .filter(
             user=user,
-            message=message,
-            notification_type=notification_type,
-            payload=payload or {},
-            deduplication_key=deduplication_key
+            status=PushOutbox.PENDING,
+            attempts=0,
+            notification__order_id=order_id,
+            notification__is_read=False,
+            notification__deduplication_key__isnull=True,
+            notification__created_at__gte=timezone.now() - timedelta(seconds=window),
         )
+        .order_by('-notification__created_at')
+        .first()
+    )
+
+
+def notification_key(notification_type, hash_):
+    return f"{notification_type}:{hash_}"
 
-        # 3. Fetch user devices
-        devices = UserDevice.objects.filter(user=user)
-        if devices.exists():
-            device_tokens = list(devices.values_list('token', flat=True))
-            try:
-                # 4. Ensure all values in .data are strings
-                clean_data = {k: str(v) for k, v in (payload or {}).items()}
-                title, body = get_notification_content(notification_type, payload or {})
-
-                send_push_notification(
-                    device_tokens=device_tokens,
-                    title = title,
-                    body=body,
-                    data={
-                        "notification_id": str(notification.id),
-                        "type": notification_type,
-                        **clean_data
-                    }
-                )
-            except Exception as push_error:
-                logger.warning(f"Push failed for user {user.id}: {str(push_error)}")
-        else:
-            logger.info(f"No devices found for user {user.id}")
+
+def merged_elsewhere(user, order_id, key):
+    """Whether one of the user's notifications about the order already folded in this type and payload"""
+    merged = Notification.objects.filter(user=user, order_id=order_id).values_list('merged_keys', flat=True)
+    return any(key in keys for keys in merged)
+
+
+def coalesce(push, message, notification_type, payload, product_ids, title, body):
+    """
+    Fold a new notification into a pending one about the same order: still one
+    row and one push. Returns None if this type and payload were already folded in.
+    """
+    notification = push.notification
+    key = notification_key(notification_type, payload_hash(payload))
+    latest = notification_key(notification.notification_type, notification.payload_hash)
+    if key == latest or key in notification.merged_keys:
+        logger.debug(f"Duplicate {notification_type} notification for user {notification.user_id} skipped")
+        return None
+    notification.message = f"{notification.message}\n{message}"
+    notification.notification_type = notification_type
+    notification.payload = {**(notification.payload or {}), **(payload or {})}
+    # The row now stands for the latest call under the unique constraint; earlier ones are remembered
+    notification.merged_keys = [*notification.merged_keys, latest]
+    notification.payload_hash = payload_hash(payload)
+    notification.product_ids = product_ids or notification.product_ids
+    # created_at is left alone, so a merged row keeps its place in keyset inbox pages
+    notification.save(update_fields=[
+        'message', 'notification_type', 'payload', 'payload_hash', 'merged_keys', 'product_ids'
+    ])
+    # available_at is left alone: the push still goes out one window after the first update
+    push.title, push.body, push.data = title, body, push_data(notification)
+    push.save(update_fields=['title', 'body', 'data'])
+    transaction.on_commit(lambda: publish_notification(notification))
+    return notification
+
+
+def notify_user(user, message, notification_type, payload=None, deduplication_key=None):
+    try:
+        order_id = order_id_from(payload)
+        if order_id is not None:
+            # One representation for order ids, whichever caller wrote the payload
+            payload = {**payload, 'order_id': order_id}
+        product_ids = product_ids_for(payload, order_id)
+        # Duplicates are rejected by unique constraints (deduplication_key, or
+        # user + type + payload hash) rather than a read-then-write check; only
+        # payloads folded into a coalesced order notification are looked up
+        title, body = get_notification_content(notification_type, payload or {})
+        # Rapid updates about one order are merged; deduplicated notifications stay separate
+        window = settings.NOTIFICATION_COALESCE_SECONDS if order_id is not None and not deduplication_key else 0
+        with transaction.atomic():
+            if order_id is not None and not deduplication_key:
+                push = pending_order_push(user, order_id, window) if window else None
+                # The constraint only covers each row's latest payload; ones merged before it are checked here
+                key = notification_key(notification_type, payload_hash(payload))
+                if merged_elsewhere(user, order_id, key):
+                    logger.debug(f"Duplicate {notification_type} notification for user {user.id} skipped")
+                    return None
+                if push is not None:
+                    return coalesce(push, message, notification_type, payload, product_ids, title, body)
+
+            # Create notification and its queued push together; process_push_outbox delivers it
+            notification = Notification.objects.create(
+                user=user,
+                message=message,
+                notification_type=notification_type,
+                payload=payload or {},
+                deduplication_key=deduplication_key,
+                payload_hash=None if deduplication_key else payload_hash(payload),
+                order_id=order_id,
+                product_ids=product_ids,
+            )
+            PushOutbox.objects.create(
+                notification=notification,
+                user=user,
+                title=title,
+                body=body,
+                data=push_data(notification),
+                available_at=timezone.now() + timedelta(seconds=window),
+            )
 
         return notification
 
-    except IntegrityError as e:
-        logger.warning(f"Notification creation failed for user {user.id}: {str(e)}")
+    except IntegrityError:
+        logger.debug(f"Duplicate {notification_type} notification for user {user.id} skipped")
     except Exception as e:
         logger.error(f"Unexpected error in notify_user: {str(e)}")
 
 
+def broadcast(audience, message, notification_type, payload=None):
+    """
+    One BroadcastNotification for a whole audience, whatever its size; users
+    see it through their inbox and devices get one push through the audience's
+    FCM topic. The same payload is only broadcast once.
+    """
+    try:
+        with transaction.atomic():
+            notification = BroadcastNotification.objects.create(
+                audience=audience,
+                message=message,
+                notification_type=notification_type,
+                payload=payload or {},
+                payload_hash=payload_hash(payload),
+            )
+            title, _ = get_notification_content(notification_type, payload or {})
+            push_to_topic(audience_topic(audience), title, message, {
+                "broadcast_id": str(notification.id),
+                "type": notification_type,
+                **{k: str(v) for k, v in (payload or {}).items()}
+            })
+            return notification
+    except IntegrityError:
+        logger.debug(f"Duplicate {notification_type} broadcast to {audience} skipped")
+
+
+def push_to_topic(topic, title, body, data=None):
+    """Queue one push for every device subscribed to an FCM topic (see topics.py)"""
+    return PushOutbox.objects.create(topic=topic, title=title, body=body, data=data or {})
+
+
 def notify_sellers(message, notification_type, payload=None):
-    from users.models import CustomUser
-    sellers = CustomUser.objects.filter(role=CustomUser.SELLER)
-    
-    existing = Notification.objects.filter(
-        user__in=sellers,
-        notification_type=notification_type,
-        payload=payload or {}
-    ).values_list('user_id', flat=True)
-
-    new_notifications = [
-        Notification(
-            user=seller,
-            message=message,
-            notification_type=notification_type,
-            payload=payload or {}
-        ) for seller in sellers if seller.id not in existing
-    ]
-    return Notification.objects.bulk_create(new_notifications, ignore_conflicts=True)
+    return broadcast(BroadcastNotification.SELLERS, message, notification_type, payload)
+
+
+def notify_customers(message, notification_type, payload=None):
+    return broadcast(BroadcastNotification.CUSTOMERS, message, notification_type, payload)
 
 
 def notify_restaurant(seller, message, notification_type, payload=None):
@@ -123,7 +228,7 @@ def create_order_notification(order, message, notification_type, original_status
         product_ids = [str(item.product.id) for item in order.items.all()]
         
         payload = {
-            'order_id': str(order.id),
+            'order_id': order.id,
             'total_amount': str(order.calculate_total_amount()),
             'items_count': str(order.items.count()),
             'vendor_id': str(order.vendor.id) if order.vendor else None,
@@ -135,7 +240,9 @@ def create_order_notification(order, message, notification_type, original_status
             user=order.customer.user,
             message=message,
             notification_type=notification_type,
-            payload=payload
+            payload=payload,
+            order=order,
+            product_ids=product_ids,
         )
 
         # ✅ Always generate full snapshot here
@@ -12,7 +12,8 @@ from .models import (
     Cart,
     CartItem,
     Review,
-    Feedback
+    Feedback,
+    PendingReview,
 )
 from users.models import CustomerProfile
 
@@ -21,6 +22,7 @@ from users.models import CustomerProfile
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
     extra = 1
+    fields = ["image", "position", "thumbnail"]
     readonly_fields = ["thumbnail"]
 
     def thumbnail(self, instance):
@@ -87,14 +89,17 @@ class OrderItemInline(admin.TabularInline):
     readonly_fields = ["unit_price", "product_thumbnail"]
 
     def product_thumbnail(self, instance):
-        if instance.product and instance.product.productimage_set.exists():
+        if instance.product and instance.product.thumbnail_url:
             return format_html(
                 '<img src="{}" width="50" />',
-                instance.product.productimage_set.first().image.url
+                instance.product.thumbnail_url
             )
         return "-"
     product_thumbnail.short_description = "Product Image"
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("product")
+
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -152,7 +157,9 @@ class OrderAdmin(admin.ModelAdmin):
 
     @admin.action(description="Mark selected as completed")
     def mark_as_completed(self, request, queryset):
+        order_ids = list(queryset.values_list("pk", flat=True))
         updated = queryset.update(payment_status="C", delivery_status="DELIVERED")
+        PendingReview.add_for_orders(order_ids)
         self.message_user(request, f"{updated} orders marked complete")
 
     def save_formset(self, request, form, formset, change):
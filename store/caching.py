@@ -0,0 +1,65 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from mediafiles.remote import RemoteImageCache
+
+DEAL_FEED_VERSION_KEY = "store:deal-feed:version"
+
+_deal_banner_cache = None
+
+
+def deal_feed_cache_key(tag, host):
+    """Key for one feed variant; bumping the version orphans every variant at once"""
+    version = cache.get_or_set(DEAL_FEED_VERSION_KEY, int(time.time()), timeout=None)
+    variant = hashlib.md5(f"{host}|{tag or ''}".encode()).hexdigest()
+    return f"store:deal-feed:{version}:{variant}"
+
+
+def invalidate_deal_feed():
+    try:
+        cache.incr(DEAL_FEED_VERSION_KEY)
+    except ValueError:
+        cache.set(DEAL_FEED_VERSION_KEY, int(time.time()), timeout=None)
+
+
+def deal_feed_timeout(deals, now=None):
+    """Seconds the feed may be cached: never past the earliest valid_until it contains"""
+    timeout = settings.DEAL_FEED_CACHE_TIMEOUT
+    expiries = [deal.valid_until for deal in deals if deal.valid_until]
+    if expiries:
+        remaining = (min(expiries) - (now or timezone.now())).total_seconds()
+        timeout = min(timeout, int(remaining))
+    return timeout
+
+
+def deal_banner_cache():
+    """Process-wide cache of resized deal banners, built from the DEAL_BANNER_* settings"""
+    global _deal_banner_cache
+    if _deal_banner_cache is None:
+        _deal_banner_cache = RemoteImageCache(
+            settings.DEAL_BANNER_CACHE_DIR,
+            settings.DEAL_BANNER_SIZES,
+            max_bytes=settings.DEAL_BANNER_CACHE_MAX_BYTES,
+            max_source_bytes=settings.DEAL_BANNER_MAX_SOURCE_BYTES,
+            timeout=settings.DEAL_BANNER_FETCH_TIMEOUT,
+            allow_private_hosts=settings.DEAL_BANNER_ALLOW_PRIVATE_HOSTS,
+        )
+    return _deal_banner_cache
+
+
+def deal_banner_version(url):
+    """Short fingerprint of the source URL so banner links change when the image does"""
+    return hashlib.md5(url.encode()).hexdigest()[:10]
+
+
+@receiver(setting_changed)
+def reset_deal_banner_cache(setting, **kwargs):
+    global _deal_banner_cache
+    if setting.startswith("DEAL_BANNER_"):
+        _deal_banner_cache = None
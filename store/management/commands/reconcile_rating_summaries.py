@@ -0,0 +1,73 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from store.models import Review, VendorRatingSummary
+from users.models import SellerProfile
+
+
+class Command(BaseCommand):
+    help = "Recount each vendor's review summary and average rating from their reviews, fixing any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Vendors checked per query.")
+        parser.add_argument("--dry-run", action="store_true", help="Only report drifted summaries.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
+        checked = fixed = 0
+        vendor_ids = SellerProfile.objects.order_by("pk").values_list("pk", flat=True)
+
+        last_id = None
+        while True:
+            batch = vendor_ids.filter(pk__gt=last_id) if last_id is not None else vendor_ids
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]
+            actual = self.recount(batch)
+            stored = {summary.vendor_id: summary for summary in VendorRatingSummary.objects.filter(vendor__in=batch)}
+            for vendor_id in batch:
+                counts = actual[vendor_id]
+                summary = stored.get(vendor_id) or VendorRatingSummary(vendor_id=vendor_id)
+                current = {field: getattr(summary, field) for field in counts}
+                if current == counts:
+                    continue
+                fixed += 1
+                self.stdout.write(
+                    f"Vendor {vendor_id}: {current['review_count']} review(s) totalling {current['rating_total']}, "
+                    f"actual {counts['review_count']} totalling {counts['rating_total']}"
+                )
+                if not dry_run:
+                    VendorRatingSummary.objects.update_or_create(vendor_id=vendor_id, defaults=counts)
+            if not dry_run:
+                # One UPDATE for the batch also repairs averages that drifted on their own
+                VendorRatingSummary.update_seller_averages(batch)
+            checked += len(batch)
+
+        verb = "Would fix" if dry_run else "Fixed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} vendor(s). {verb} {fixed} rating summary record(s)."
+        ))
+
+    def recount(self, vendor_ids):
+        """Summary fields per vendor, as VendorRatingSummary.record would have left them"""
+        actual = defaultdict(lambda: {
+            "review_count": 0, "rating_total": Decimal("0"), **{f"stars_{stars}": 0 for stars in range(1, 6)},
+        })
+        ratings = (
+            Review.objects.filter(product__vendor__in=vendor_ids).order_by()
+            .values("product__vendor", "rating").annotate(count=Count("pk"))
+            .values_list("product__vendor", "rating", "count")
+        )
+        for vendor_id, rating, count in ratings:
+            counts = actual[vendor_id]
+            counts["review_count"] += count
+            bucket = VendorRatingSummary.star_bucket(rating)
+            if bucket is not None:
+                counts[f"stars_{bucket}"] += count
+                counts["rating_total"] += Decimal(rating) * count
+        return actual
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.caching import invalidate_deal_feed
+from store.models import Deal
+
+
+class Command(BaseCommand):
+    help = "Deactivate expired deals in bulk and refresh each affected seller's best deal."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running, sweeping at most this many seconds apart (and at each deal expiry).",
+        )
+
+    def handle(self, *args, **options):
+        interval = options["interval"]
+        while True:
+            swept = self.sweep()
+            self.stdout.write(self.style.SUCCESS(f"Deactivated {swept} expired deal(s)."))
+            if not interval:
+                return
+            time.sleep(self.seconds_until_next_expiry(interval))
+
+    def sweep(self):
+        expired = Deal.objects.filter(is_active=True, valid_until__lte=timezone.now())
+        seller_ids = set(expired.values_list("seller_id", flat=True))
+        if not seller_ids:
+            return 0
+        # queryset.update() skips Deal signals, so refresh pointers and the feed here
+        swept = expired.update(is_active=False)
+        Deal.refresh_best_deals(seller_ids)
+        invalidate_deal_feed()
+        return swept
+
+    def seconds_until_next_expiry(self, interval):
+        next_expiry = (
+            Deal.objects.filter(is_active=True, valid_until__gt=timezone.now())
+            .order_by("valid_until")
+            .values_list("valid_until", flat=True)
+            .first()
+        )
+        if next_expiry is None:
+            return interval
+        return max(1, min(interval, (next_expiry - timezone.now()).total_seconds()))
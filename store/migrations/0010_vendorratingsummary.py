@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:09
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_rating_summaries(apps, schema_editor):
+    Review = apps.get_model('store', 'Review')
+    VendorRatingSummary = apps.get_model('store', 'VendorRatingSummary')
+
+    summaries = {}
+    for vendor_id, rating in Review.objects.values_list('product__vendor_id', 'rating').iterator():
+        summary = summaries.setdefault(vendor_id, VendorRatingSummary(vendor_id=vendor_id))
+        summary.review_count += 1
+        if rating is None:
+            continue
+        stars = int(Decimal(rating).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+        field = f'stars_{min(5, max(1, stars))}'
+        setattr(summary, field, getattr(summary, field) + 1)
+        summary.rating_total += rating
+    VendorRatingSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_review_order'),
+        ('users', '0009_alter_customerprofile_address_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendorRatingSummary',
+            fields=[
+                ('vendor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='users.sellerprofile')),
+                ('review_count', models.IntegerField(default=0)),
+                ('rating_total', models.DecimalField(decimal_places=1, default=0, max_digits=12)),
+                ('stars_1', models.IntegerField(default=0)),
+                ('stars_2', models.IntegerField(default=0)),
+                ('stars_3', models.IntegerField(default=0)),
+                ('stars_4', models.IntegerField(default=0)),
+                ('stars_5', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_rating_summaries, migrations.RunPython.noop),
+    ]
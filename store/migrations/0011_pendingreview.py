@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def backfill_pending_reviews(apps, schema_editor):
+    OrderItem = apps.get_model('store', 'OrderItem')
+    Review = apps.get_model('store', 'Review')
+    PendingReview = apps.get_model('store', 'PendingReview')
+
+    items = (
+        OrderItem.objects.filter(order__delivery_status='DELIVERED')
+        .exclude(Exists(Review.objects.filter(
+            user=OuterRef('order__customer__user'), product=OuterRef('product')
+        )))
+        .values_list('order__customer__user_id', 'product_id', 'order_id')
+    )
+    PendingReview.objects.bulk_create(
+        [PendingReview(user_id=user_id, product_id=product_id, order_id=order_id)
+         for user_id, product_id, order_id in items.iterator()],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_vendorratingsummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingReview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='store.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_reviews', to='store.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_reviews', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'product')},
+            },
+        ),
+        migrations.RunPython(backfill_pending_reviews, migrations.RunPython.noop),
+    ]
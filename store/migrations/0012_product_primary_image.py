@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_primary_images(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductImage = apps.get_model('store', 'ProductImage')
+    storage = ProductImage._meta.get_field('image').storage
+
+    seen = set()
+    for image in ProductImage.objects.order_by('product_id', 'position', 'id').iterator():
+        if image.product_id in seen:
+            continue
+        seen.add(image.product_id)
+        Product.objects.filter(pk=image.product_id).update(
+            primary_image=image,
+            thumbnail_url=storage.url(image.image.name) if image.image else '',
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_pendingreview'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='productimage',
+            options={'ordering': ['position', 'id']},
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.productimage'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='thumbnail_url',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='position',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_primary_images, migrations.RunPython.noop),
+    ]
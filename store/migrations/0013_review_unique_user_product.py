@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:13
+
+from django.conf import settings
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+
+def remove_duplicate_reviews(apps, schema_editor):
+    """Keep each user's first review per product and rebuild the vendor summaries"""
+    Review = apps.get_model('store', 'Review')
+    VendorRatingSummary = apps.get_model('store', 'VendorRatingSummary')
+
+    seen = set()
+    duplicate_ids = []
+    for review_id, user_id, product_id in Review.objects.order_by('id').values_list('id', 'user_id', 'product_id').iterator():
+        if (user_id, product_id) in seen:
+            duplicate_ids.append(review_id)
+        seen.add((user_id, product_id))
+    if not duplicate_ids:
+        return
+    Review.objects.filter(id__in=duplicate_ids).delete()
+
+    summaries = {}
+    for vendor_id, rating in Review.objects.values_list('product__vendor_id', 'rating').iterator():
+        summary = summaries.setdefault(vendor_id, VendorRatingSummary(vendor_id=vendor_id))
+        summary.review_count += 1
+        if rating is None:
+            continue
+        stars = int(Decimal(rating).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+        field = f'stars_{min(5, max(1, stars))}'
+        setattr(summary, field, getattr(summary, field) + 1)
+        summary.rating_total += rating
+    VendorRatingSummary.objects.all().delete()
+    VendorRatingSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_product_primary_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_review_per_user_product'),
+        ),
+    ]
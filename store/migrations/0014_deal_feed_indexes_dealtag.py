@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_deal_tags(apps, schema_editor):
+    Deal = apps.get_model('store', 'Deal')
+    DealTag = apps.get_model('store', 'DealTag')
+
+    rows = []
+    for deal_id, tags in Deal.objects.values_list('id', 'tags').iterator():
+        for tag in {str(tag).strip()[:50] for tag in (tags or []) if str(tag).strip()}:
+            rows.append(DealTag(deal_id=deal_id, tag=tag))
+    DealTag.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_review_unique_user_product'),
+        ('users', '0009_alter_customerprofile_address_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DealTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=50)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['-priority', '-created_at'], name='deal_feed_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['valid_until'], name='deal_valid_until_idx'),
+        ),
+        migrations.AddField(
+            model_name='dealtag',
+            name='deal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_entries', to='store.deal'),
+        ),
+        migrations.AddIndex(
+            model_name='dealtag',
+            index=models.Index(fields=['tag', 'deal'], name='store_dealt_tag_9c6881_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dealtag',
+            unique_together={('deal', 'tag')},
+        ),
+        migrations.RunPython(backfill_deal_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:16
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def deactivate_expired_deals(apps, schema_editor):
+    Deal = apps.get_model('store', 'Deal')
+    Deal.objects.filter(valid_until__lte=timezone.now()).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_deal_feed_indexes_dealtag'),
+        ('users', '0009_alter_customerprofile_address_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='deal',
+            name='deal_feed_order_idx',
+        ),
+        migrations.AddField(
+            model_name='deal',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['is_active', '-priority', '-created_at'], name='deal_active_feed_idx'),
+        ),
+        migrations.RunPython(deactivate_expired_deals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:23
+
+import mediafiles.storage
+import store.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_productimage_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=mediafiles.storage.ContentAddressedStorage(), upload_to='products/', validators=[store.validators.validate_file_size]),
+        ),
+    ]
@@ -1,13 +1,18 @@
-from django.db import models
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from .validators import validate_file_size
 from django.conf import settings
 from uuid import uuid4
 from users.models import CustomerProfile, SellerProfile
 from django.utils.text import slugify
-from django.db.models import Avg 
+from django.db.models import F, Exists, OuterRef, Subquery, Case, When, Value, FloatField
+from django.db.models.functions import Cast, Round
 from notifications.utils import notify_user
+from mediafiles.derivatives import variant_url
+from mediafiles.storage import blob_storage
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 
 # Create your models here.
@@ -41,9 +46,27 @@ class Product(models.Model):
         related_name="products",
         
     )  
+    # Cover image, maintained from ProductImage writes so listings need no per-row lookup
+    primary_image = models.ForeignKey(
+        "ProductImage",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    thumbnail_url = models.CharField(max_length=500, blank=True, default="")
 
     def __str__(self) -> str:
         return self.title
+
+    @classmethod
+    def refresh_primary_image(cls, product_id):
+        """Point the product at its first image (by position) and cache its URL"""
+        image = ProductImage.objects.filter(product_id=product_id).order_by("position", "id").first()
+        thumbnail_url = ""
+        if image and image.image:
+            thumbnail_url = variant_url(image.image, image.image_variants, "thumbnail")
+        cls.objects.filter(pk=product_id).update(primary_image=image, thumbnail_url=thumbnail_url)
     def save(self, *args, **kwargs):
         # Generate slug from title if not present or changed
         if not self.slug or Product.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
@@ -81,7 +104,13 @@ class ProductImage(models.Model):
     )
     # image = models.ImageField(upload_to = r'store\images', validators = [validate_file_size])
     # image = models.URLField(max_length=500)
-    image = models.ImageField(upload_to="products/", validators=[validate_file_size])
+    image = models.ImageField(upload_to="products/", storage=blob_storage, validators=[validate_file_size])
+    # Derivative storage names by size, filled in by mediafiles after upload
+    image_variants = models.JSONField(default=dict, blank=True)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["position", "id"]
 
 class Order(models.Model):
     PAYMENT_STATUS_PENDING = "P"
@@ -122,13 +151,18 @@ class Order(models.Model):
     def notification_history(self):
         return self.notifications.select_related('notification').order_by('-notification__created_at')
     def get_status_history(self):
+        # Walks the (order, -created_at) notification index; no sort over a join
+        history = (
+            self.inbox_notifications.filter(order_details__isnull=False)
+            .select_related('order_details').order_by('-created_at')
+        )
         return [
             {
-                'status': n.status_after,
-                'timestamp': n.notification.created_at,
-                'message': n.notification.message
+                'status': n.order_details.status_after,
+                'timestamp': n.created_at,
+                'message': n.message
                 }
-            for n in self.notification_history
+            for n in history
     ]
 
     class Meta:
@@ -152,25 +186,10 @@ class Order(models.Model):
             old_payment_status = None
 
         super().save(*args, **kwargs)
-        product_ids = [str(item.product.id) for item in self.items.all()]
 
-        # 1. Order Confirmation (User + Vendor)
+        # 1. Order Confirmation (User + Vendor), once the items saved with the order exist
         if created:
-            notify_user(
-                self.customer.user,
-                f"Your order #{self.id} has been confirmed!",
-                'order_confirmation',
-                {'order_id': self.id,
-                 'product_ids': product_ids}
-                
-            )
-            if self.vendor:
-                notify_user(
-                    self.vendor.user,
-                    f"New order #{self.id} received!",
-                    'new_order',
-                    {'order_id': self.id}
-                )
+            transaction.on_commit(self.notify_created)
 
         # 2. Delivery Status Changes
         if not created and self.delivery_status != old_delivery_status:
@@ -186,6 +205,8 @@ class Order(models.Model):
                     'order_status_change',
                     {'order_id': self.id}
                 )
+            if self.delivery_status == "DELIVERED":
+                PendingReview.add_for_orders([self.pk])
 
         # 3. Payment Status Changes
         if not created and self.payment_status != old_payment_status:
@@ -211,6 +232,23 @@ class Order(models.Model):
                     {'order_id': self.id}
                 )
 
+    def notify_created(self):
+        product_ids = [str(product_id) for product_id in self.items.order_by('id').values_list('product_id', flat=True)]
+        notify_user(
+            self.customer.user,
+            f"Your order #{self.id} has been confirmed!",
+            'order_confirmation',
+            {'order_id': self.id,
+             'product_ids': product_ids}
+        )
+        if self.vendor:
+            notify_user(
+                self.vendor.user,
+                f"New order #{self.id} received!",
+                'new_order',
+                {'order_id': self.id}
+            )
+
     def cancel(self, cancelled_by_user=True):
         self.payment_status = self.PAYMENT_STATUS_FAILED
         self.save()
@@ -269,8 +307,23 @@ class Review(models.Model):
     )  # Rating out of 5
     date = models.DateField(auto_now_add=True)  # Date when the review was created
     order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "product"], name="unique_review_per_user_product"),
+        ]
+
     def __str__(self):
         return f"{self.user.email} - {self.rating} Stars"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rating and product so edits can adjust the vendor summaries
+        instance._loaded_rating = instance.__dict__.get("rating")
+        instance._loaded_product_id = instance.__dict__.get("product_id")
+        return instance
+
     def save(self, *args, **kwargs):
      created = not self.pk
      super().save(*args, **kwargs)
@@ -284,51 +337,159 @@ class Review(models.Model):
             {'review_id': self.id}
         )
 
-     self.update_vendor_rating()
+    @staticmethod
+    def delivered_items(user):
+        return OrderItem.objects.filter(order__customer__user=user, order__delivery_status="DELIVERED")
 
-    def delete(self, *args, **kwargs):
-        """Update vendor rating on delete"""
-        vendor = self.product.vendor
-        super().delete(*args, **kwargs)
-        self.update_vendor_rating(vendor)
+    @classmethod
+    def was_delivered_to(cls, user, product):
+        return cls.delivered_items(user).filter(product=product).exists()
 
-    def update_vendor_rating(self, vendor=None):
-        """Recalculate average for all vendor products"""
-        vendor = vendor or self.product.vendor
-        all_reviews = Review.objects.filter(
-            product__vendor=vendor, 
-            rating__isnull=False
-        )
-        avg_rating = all_reviews.aggregate(Avg('rating'))['rating__avg'] or 0
-        vendor.average_rating = round(avg_rating, 2)
-        vendor.save()
-        
     # This method returns products that the user can review 
     @classmethod
     def get_reviewable_products(cls, user):
         """Returns products that user can review (delivered but not reviewed)"""
-        if not hasattr(user, 'customer_profile'):
-            return Product.objects.none()
-            
-        # Get delivered orders with their items
-        delivered_orders = Order.objects.filter(
-            customer=user.customer_profile,
-            delivery_status="DELIVERED"
-        ).prefetch_related('items')
-
-        # Get product IDs from all delivered orders
-        delivered_product_ids = set()
-        for order in delivered_orders:
-            delivered_product_ids.update(order.items.values_list('product_id', flat=True))
-
-        # Exclude already reviewed products
-        reviewed_product_ids = set(
-            cls.objects.filter(user=user).values_list('product_id', flat=True)
+        if getattr(settings, "STORE_PENDING_REVIEWS", False):
+            return Product.objects.filter(pending_reviews__user=user)
+
+        # Single anti-join: delivered to this user and not reviewed by them
+        delivered = cls.delivered_items(user).filter(product=OuterRef("pk"))
+        reviewed = cls.objects.filter(product=OuterRef("pk"), user=user)
+        return Product.objects.filter(Exists(delivered)).exclude(Exists(reviewed))
+
+
+class PendingReview(models.Model):
+    """Delivered product the customer has not reviewed yet (feeds reviews/to_give)"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="pending_reviews"
+    )
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="pending_reviews"
+    )
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [["user", "product"]]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.product_id}"
+
+    @classmethod
+    def add_for_orders(cls, order_ids):
+        """Record every unreviewed product of the given (delivered) orders"""
+        items = (
+            OrderItem.objects.filter(order_id__in=order_ids)
+            .exclude(
+                Exists(Review.objects.filter(
+                    user=OuterRef("order__customer__user"), product=OuterRef("product")
+                ))
+            )
+            .values_list("order__customer__user_id", "product_id", "order_id")
+        )
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, product_id=product_id, order_id=order_id)
+             for user_id, product_id, order_id in items],
+            ignore_conflicts=True,
         )
 
-        return Product.objects.filter(
-            id__in=(delivered_product_ids - reviewed_product_ids)
+    @classmethod
+    def restore(cls, user_id, product_id):
+        """Re-open a product for review (e.g. after the review was deleted)"""
+        order_id = (
+            OrderItem.objects.filter(
+                product_id=product_id,
+                order__customer__user_id=user_id,
+                order__delivery_status="DELIVERED",
+            )
+            .order_by("-order__placed_at")
+            .values_list("order_id", flat=True)
+            .first()
+        )
+        if order_id:
+            cls.objects.bulk_create(
+                [cls(user_id=user_id, product_id=product_id, order_id=order_id)],
+                ignore_conflicts=True,
+            )
+
+class VendorRatingSummary(models.Model):
+    """Star histogram and totals per vendor, adjusted on every review write"""
+    vendor = models.OneToOneField(
+        SellerProfile,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="rating_summary",
+    )
+    review_count = models.IntegerField(default=0)
+    rating_total = models.DecimalField(max_digits=12, decimal_places=1, default=0)
+    stars_1 = models.IntegerField(default=0)
+    stars_2 = models.IntegerField(default=0)
+    stars_3 = models.IntegerField(default=0)
+    stars_4 = models.IntegerField(default=0)
+    stars_5 = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.vendor_id}: {self.review_count} reviews"
+
+    @staticmethod
+    def star_bucket(rating):
+        """Map a 1-5 rating (one decimal place) to its whole-star bucket"""
+        if rating is None:
+            return None
+        stars = int(Decimal(rating).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+        return min(5, max(1, stars))
+
+    @property
+    def histogram(self):
+        return {str(stars): getattr(self, f"stars_{stars}") for stars in range(1, 6)}
+
+    @property
+    def rating_count(self):
+        return sum(self.histogram.values())
+
+    @property
+    def average_rating(self):
+        count = self.rating_count
+        return round(self.rating_total / count, 2) if count else 0
+
+    @classmethod
+    def record(cls, vendor_id, old_rating=None, new_rating=None, review_delta=0):
+        """Apply one review write to the vendor's summary using in-place updates"""
+        changes = {}
+        if review_delta:
+            changes["review_count"] = F("review_count") + review_delta
+        for rating, sign in ((old_rating, -1), (new_rating, 1)):
+            bucket = cls.star_bucket(rating)
+            if bucket is None:
+                continue
+            field = f"stars_{bucket}"
+            changes[field] = changes.get(field, F(field)) + sign
+            changes["rating_total"] = changes.get("rating_total", F("rating_total")) + sign * Decimal(rating)
+        if not changes or not vendor_id:
+            return
+
+        if not cls.objects.filter(vendor_id=vendor_id).update(**changes):
+            cls.objects.get_or_create(vendor_id=vendor_id)
+            cls.objects.filter(vendor_id=vendor_id).update(**changes)
+
+        cls.update_seller_averages([vendor_id])
+
+    @classmethod
+    def update_seller_averages(cls, vendor_ids):
+        """Derive SellerProfile.average_rating from the stored totals in one UPDATE"""
+        rated = sum((F(f"stars_{stars}") for stars in range(2, 6)), F("stars_1"))
+        average = (
+            cls.objects.filter(vendor_id=OuterRef("pk"))
+            .annotate(rated=rated)
+            .annotate(average=Case(
+                When(rated__gt=0, then=Cast("rating_total", FloatField()) / F("rated")),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ))
+            .values("average")[:1]
         )
+        SellerProfile.objects.filter(pk__in=vendor_ids).update(average_rating=Round(Subquery(average), 2))
+
 
 class FavouriteProduct(models.Model):
     customer = models.ForeignKey(
@@ -398,6 +559,8 @@ class Deal(models.Model):
     is_limited_time = models.BooleanField(default=False)
     valid_until = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Follows valid_until on every save; sweep_deals clears it for deals that expire untouched
+    is_active = models.BooleanField(default=True)
 
     # Restaurant Link (replaces restaurant_name/restaurant_image)
     seller = models.ForeignKey(
@@ -411,6 +574,12 @@ class Deal(models.Model):
     tags = models.JSONField(default=list)  # e.g., ["featured", "discount"]
     priority = models.IntegerField(default=0)  # Higher = shown first
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["is_active", "-priority", "-created_at"], name="deal_active_feed_idx"),
+            models.Index(fields=["valid_until"], name="deal_valid_until_idx"),
+        ]
+
     # Auto-calculate final_price
     def save(self, *args, **kwargs):
         if self.discount_type == self.PERCENTAGE:
@@ -419,7 +588,63 @@ class Deal(models.Model):
             self.final_price = self.original_price - self.discount_value
         elif self.discount_type == self.FREE_DELIVERY:
             self.final_price = self.original_price  # No price change, just free delivery
+        # Extending a swept deal brings it back
+        self.is_active = self.valid_until is None or self.valid_until > timezone.now()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "is_active"}
         super().save(*args, **kwargs)
+        self.sync_tags()
+
+    def __str__(self):
+        return f"{self.title} (by {self.seller.business_name})"
+
+    @classmethod
+    def active(cls):
+        """Deals that have not expired, in feed order (highest priority first)"""
+        return cls.objects.filter(
+            models.Q(valid_until__isnull=True) | models.Q(valid_until__gt=timezone.now()),
+            is_active=True,
+        ).order_by("-priority", "-created_at")
+
+    @classmethod
+    def refresh_best_deals(cls, seller_ids):
+        """Recompute SellerProfile.best_deal: top priority, then biggest saving, then newest"""
+        seller_ids = set(seller_ids)
+        if not seller_ids:
+            return
+        best = {}
+        deals = (
+            cls.active()
+            .filter(seller_id__in=seller_ids)
+            .annotate(savings=F("original_price") - F("final_price"))
+            .order_by("seller_id", "-priority", "-savings", "-created_at")
+            .values_list("seller_id", "id")
+        )
+        for seller_id, deal_id in deals:
+            best.setdefault(seller_id, deal_id)
+        sellers = SellerProfile.objects.filter(pk__in=seller_ids).only("pk", "best_deal")
+        for seller in sellers:
+            seller.best_deal_id = best.get(seller.pk)
+        SellerProfile.objects.bulk_update(sellers, ["best_deal"])
+
+    def sync_tags(self):
+        """Mirror the tags JSON into the indexed DealTag table"""
+        tags = {str(tag).strip()[:50] for tag in (self.tags or []) if str(tag).strip()}
+        DealTag.objects.filter(deal=self).exclude(tag__in=tags).delete()
+        DealTag.objects.bulk_create(
+            [DealTag(deal=self, tag=tag) for tag in tags], ignore_conflicts=True
+        )
+
+
+class DealTag(models.Model):
+    """One row per deal tag so tag filters use an index instead of scanning JSON"""
+    deal = models.ForeignKey(Deal, on_delete=models.CASCADE, related_name="tag_entries")
+    tag = models.CharField(max_length=50)
+
+    class Meta:
+        unique_together = [["deal", "tag"]]
+        indexes = [models.Index(fields=["tag", "deal"])]
 
     def __str__(self):
-        return f"{self.title} (by {self.seller.business_name})"
\ No newline at end of file
+        return self.tag
\ No newline at end of file
@@ -14,10 +14,29 @@ from .models import (
     Review,
     FavouriteProduct,
     Feedback,
+    VendorRatingSummary,
 )
 from users.models import SellerProfile
+from users.serializers import SellerProfileSerializer
+from mediafiles.derivatives import variant_url
+from mediafiles.fields import DerivativeImageField, ReencodedImageField
+from django.utils import timezone
+from django.conf import settings
+from django.urls import reverse
+from urllib.parse import urlencode
+from .caching import deal_banner_version
 from django.db.models import Avg
+from django.db import transaction
 from django.utils.dateparse import parse_datetime
+
+
+def absolute_media_url(request, url):
+    """Build an absolute URL for a stored media URL when a request is available"""
+    if not url:
+        return None
+    return request.build_absolute_uri(url) if request else url
+
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Categories
@@ -26,20 +45,15 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    # Uploads are re-encoded to fit; output size follows the view's "image_variant" context
+    image = ReencodedImageField()
+
     class Meta:
         model = ProductImage
-        fields = ["id", "image", "product"]
+        fields = ["id", "image", "product", "position"]
         read_only_fields = ["id"]
         extra_kwargs = {"product": {"write_only": True}}
 
-    def to_representation(self, instance):
-        """Add full image URL in API response"""
-        representation = super().to_representation(instance)
-        request = self.context.get("request")
-        if request and instance.image:
-            representation["image"] = request.build_absolute_uri(instance.image.url)
-        return representation
-
 
 class ProductCreateSerializer(serializers.ModelSerializer):
     vendor = serializers.PrimaryKeyRelatedField(
@@ -47,7 +61,7 @@ class ProductCreateSerializer(serializers.ModelSerializer):
         required=False  # You'll set this manually
     )
     images = serializers.ListField(
-        child=serializers.ImageField(), write_only=True, required=False
+        child=ReencodedImageField(), write_only=True, required=False
     )
     class Meta:
         model = Product
@@ -76,6 +90,7 @@ class ProductSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source="category.title", read_only=True)
     review_count = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
+    is_favourited = serializers.SerializerMethodField()
     class Meta:
         model = Product
         fields = [
@@ -90,17 +105,23 @@ class ProductSerializer(serializers.ModelSerializer):
             "vendor",
             "vendor_name",
             "images",
+            "thumbnail_url",
             "last_update",
             "review_count",
             "average_rating",
+            "is_favourited",
         ]
-        read_only_fields = ["id", "slug", "last_update", "category_name", "vendor_name", "review_count", "average_rating",]
+        read_only_fields = ["id", "slug", "thumbnail_url", "last_update", "category_name", "vendor_name", "review_count", "average_rating", "is_favourited",]
         extra_kwargs = {"category": {"required": True}}
 
     
     def get_vendor_name(self, obj):
         return obj.vendor.business_name if obj.vendor and obj.vendor.business_name else None
 
+    def get_is_favourited(self, obj):
+        # Annotated by ProductViewSet; nested uses (e.g. cart items) default to False
+        return getattr(obj, "is_favourited", False)
+
     def get_review_count(self, obj):
         return obj.reviews.count()
 
@@ -109,22 +130,19 @@ class ProductSerializer(serializers.ModelSerializer):
         return round(avg, 1) if avg is not None else 0
 class ReviewSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
+    # Vendor and its user ride along for the new-review notification
+    product = serializers.PrimaryKeyRelatedField(
+        queryset=Product.objects.select_related("vendor__user"), write_only=True
+    )
     product_name = serializers.CharField(source='product.title', read_only=True)
     product_image = serializers.SerializerMethodField()
     class Meta:
         model = Review
         fields = ["id", "user", "product","product_name", "product_image", "comment", "rating", "date"]
         read_only_fields = ["id", "user", "date", "product_name", "product_image"]
-        extra_kwargs = {"product": {"write_only": True}}
 
     def get_product_image(self, obj):
-        # Fetch the first related image
-        image_obj = obj.product.images.first()
-        request = self.context.get('request')
-
-        if image_obj and image_obj.image and hasattr(image_obj.image, 'url'):
-            return request.build_absolute_uri(image_obj.image.url) if request else image_obj.image.url
-        return None
+        return absolute_media_url(self.context.get('request'), obj.product.thumbnail_url)
     
     def validate_rating(self, value):
         if not 1 <= value <= 5:
@@ -133,8 +151,21 @@ class ReviewSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """Auto-set the user from request"""
-        validated_data["user"] = self.context["request"].user
-        return super().create(validated_data)
+        review = Review(user=self.context["request"].user, **validated_data)
+        review._pending_claimed = self.context.get("pending_claimed", False)
+        review.save()
+        return review
+
+class VendorRatingSummarySerializer(serializers.ModelSerializer):
+    """Storefront header: stored star histogram and totals for a vendor"""
+    rating_count = serializers.IntegerField(read_only=True)
+    average_rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = VendorRatingSummary
+        fields = ["review_count", "rating_count", "average_rating", "histogram"]
+
 
 class CreateOrderSerializer(serializers.ModelSerializer):
     class Meta:
@@ -189,15 +220,17 @@ class OrderSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         """Handle nested order items creation"""
         items_data = validated_data.pop("items")
-        order = Order.objects.create(**validated_data)
-
-        for item_data in items_data:
-            OrderItem.objects.create(
-                order=order,
-                product=item_data["product"],
-                quantity=item_data["quantity"],
-                unit_price=item_data["product"].unit_price,
-            )
+        # One transaction, so the creation notifications (sent on commit) see the items
+        with transaction.atomic():
+            order = Order.objects.create(**validated_data)
+
+            for item_data in items_data:
+                OrderItem.objects.create(
+                    order=order,
+                    product=item_data["product"],
+                    quantity=item_data["quantity"],
+                    unit_price=item_data["product"].unit_price,
+                )
         return order
 
 
@@ -309,20 +342,19 @@ class FavouriteProductSerializer(serializers.ModelSerializer):
     
     
     def get_product_image(self, obj):
-        """Return full URL of the first product image"""
-        request = self.context.get("request")
-        first_image = obj.product.images.first()
-        if first_image and first_image.image:
-            if request:
-                return request.build_absolute_uri(first_image.image.url)
-            return first_image.image.url
-        return None
+        """Return full URL of the product's cover image"""
+        return absolute_media_url(self.context.get("request"), obj.product.thumbnail_url)
     
     def get_review_count(self, obj):
+        if hasattr(obj, "product_review_count"):
+            return obj.product_review_count
         return obj.product.reviews.count()
 
     def get_average_rating(self, obj):
-        avg = obj.product.reviews.aggregate(Avg("rating"))["rating__avg"]
+        if hasattr(obj, "product_average_rating"):
+            avg = obj.product_average_rating
+        else:
+            avg = obj.product.reviews.aggregate(Avg("rating"))["rating__avg"]
         return round(avg, 1) if avg is not None else 0
 
 
@@ -364,11 +396,34 @@ class DealSerializer(serializers.ModelSerializer):
         }
 
     def get_seller_profile_picture(self, obj):
-        profile_picture = obj.seller.profile_picture
-        request = self.context.get('request')
-        if profile_picture and hasattr(profile_picture, 'url'):
-            return request.build_absolute_uri(profile_picture.url) if request else profile_picture.url
-        return None
+        seller = obj.seller
+        url = variant_url(seller.profile_picture, seller.profile_picture_variants, "thumbnail")
+        return absolute_media_url(self.context.get('request'), url)
+
+    def to_representation(self, instance):
+        """Point clients at the resized, locally cached banner instead of the remote original"""
+        representation = super().to_representation(instance)
+        if instance.image:
+            representation['image'] = self.banner_url(instance, 'card')
+            representation['image_sizes'] = {
+                size: self.banner_url(instance, size) for size in settings.DEAL_BANNER_SIZES
+            }
+        else:
+            representation['image_sizes'] = {}
+        return representation
+
+    def banner_url(self, deal, size):
+        query = urlencode({'size': size, 'v': deal_banner_version(deal.image)})
+        url = f"{reverse('store:deal-banner', args=[deal.pk])}?{query}"
+        return absolute_media_url(self.context.get('request'), url)
+
+    def validate_image(self, value):
+        # Clients may send back the proxied URL they were given; keep the stored source then
+        if self.instance and value and value.split('?')[0].endswith(
+            reverse('store:deal-banner', args=[self.instance.pk])
+        ):
+            return self.instance.image
+        return value
 
     def validate(self, data):
         """Ensure discount_value is provided for percentage/fixed deals."""
@@ -395,12 +450,41 @@ class ProductMinimalSerializer(serializers.ModelSerializer):
         model = Product
         fields = ['id', 'title', 'image', 'unit_price']
     def get_image(self, obj):
-        first_image = obj.images.first()
-        return first_image.image.url if first_image and first_image.image else None
+        return obj.thumbnail_url or None
 class ReviewHistorySerializer(serializers.ModelSerializer):
     """For review history with product details"""
     product = ProductMinimalSerializer()
     
     class Meta:
         model = Review
-        fields = ['id', 'product', 'rating', 'comment', 'date']
\ No newline at end of file
+        fields = ['id', 'product', 'rating', 'comment', 'date']
+
+
+class BestDealSerializer(serializers.ModelSerializer):
+    """Compact deal shown on seller cards and storefronts"""
+    class Meta:
+        model = Deal
+        fields = [
+            "id", "title", "subtitle", "discount_type", "discount_value",
+            "original_price", "final_price", "valid_until",
+        ]
+
+
+def serialize_best_deal(seller):
+    """Serialize the seller's precomputed best deal, hiding one that expired since the last sweep"""
+    deal = seller.best_deal
+    if deal is None or not deal.is_active or (deal.valid_until and deal.valid_until <= timezone.now()):
+        return None
+    return BestDealSerializer(deal).data
+
+
+class SellerListingSerializer(SellerProfileSerializer):
+    """Seller profile plus its best current deal (select_related("best_deal") upstream)"""
+    best_deal = serializers.SerializerMethodField()
+    profile_picture = DerivativeImageField(variant="card", read_only=True)
+
+    class Meta(SellerProfileSerializer.Meta):
+        fields = SellerProfileSerializer.Meta.fields + ["best_deal"]
+
+    def get_best_deal(self, obj):
+        return serialize_best_deal(obj)
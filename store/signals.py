@@ -1,8 +1,67 @@
 # store/signals.py
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Review
+from mediafiles.derivatives import derivatives_ready
+from .caching import invalidate_deal_feed
+from .models import Deal, PendingReview, Product, ProductImage, Review, VendorRatingSummary
 
-@receiver([post_save, post_delete], sender=Review)
-def handle_review_changes(sender, instance, **kwargs):
-    instance.update_vendor_rating()
\ No newline at end of file
+@receiver(post_save, sender=Review)
+def update_rating_summary_on_save(sender, instance, created, **kwargs):
+    vendor_id = instance.product.vendor_id
+    if created:
+        VendorRatingSummary.record(vendor_id, new_rating=instance.rating, review_delta=1)
+    else:
+        old_rating = getattr(instance, "_loaded_rating", instance.rating)
+        old_product_id = getattr(instance, "_loaded_product_id", instance.product_id)
+        old_vendor_id = vendor_id
+        if old_product_id != instance.product_id:
+            old_vendor_id = Product.objects.filter(pk=old_product_id).values_list("vendor_id", flat=True).first()
+        if old_vendor_id != vendor_id:
+            # Moved to another vendor's product: the review leaves one summary and joins the other
+            VendorRatingSummary.record(old_vendor_id, old_rating=old_rating, review_delta=-1)
+            VendorRatingSummary.record(vendor_id, new_rating=instance.rating, review_delta=1)
+        elif old_rating != instance.rating:
+            VendorRatingSummary.record(vendor_id, old_rating=old_rating, new_rating=instance.rating)
+    instance._loaded_rating = instance.rating
+    instance._loaded_product_id = instance.product_id
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_summary_on_delete(sender, instance, **kwargs):
+    VendorRatingSummary.record(
+        instance.product.vendor_id, old_rating=instance.rating, review_delta=-1
+    )
+
+
+@receiver(post_save, sender=Review)
+def clear_pending_review(sender, instance, created, **kwargs):
+    # The review API claims the pending row itself as its eligibility check
+    if created and not getattr(instance, "_pending_claimed", False):
+        PendingReview.objects.filter(user_id=instance.user_id, product_id=instance.product_id).delete()
+
+
+@receiver(post_delete, sender=Review)
+def restore_pending_review(sender, instance, **kwargs):
+    PendingReview.restore(instance.user_id, instance.product_id)
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def refresh_product_primary_image(sender, instance, **kwargs):
+    Product.refresh_primary_image(instance.product_id)
+
+
+@receiver(derivatives_ready, sender=ProductImage)
+def use_thumbnail_derivative(sender, pk, **kwargs):
+    product_id = ProductImage.objects.filter(pk=pk).values_list("product_id", flat=True).first()
+    if product_id is not None:
+        Product.refresh_primary_image(product_id)
+
+
+@receiver([post_save, post_delete], sender=Deal)
+def invalidate_deal_feed_cache(sender, instance, **kwargs):
+    invalidate_deal_feed()
+
+
+@receiver([post_save, post_delete], sender=Deal)
+def refresh_seller_best_deal(sender, instance, **kwargs):
+    Deal.refresh_best_deals([instance.seller_id])
@@ -1,3 +1,685 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from notifications.models import Notification
+from users.models import CustomUser, CustomerProfile, SellerProfile
+from .caching import deal_feed_timeout
+from .models import (
+    Cart, CartItem, Categories, Deal, DealTag, PendingReview, Product, ProductImage, Order, OrderItem, Review,
+    VendorRatingSummary,
+)
+
+
+class ReviewCreateTests(TestCase):
+    def setUp(self):
+        seller_user = CustomUser.objects.create_user("seller@example.com", "pass", role="seller", is_active=True)
+        self.seller = SellerProfile.objects.create(user=seller_user, business_name="Shop", phone="1")
+        VendorRatingSummary.objects.create(vendor=self.seller)
+        self.user = CustomUser.objects.create_user("customer@example.com", "pass", is_active=True)
+        customer = CustomerProfile.objects.create(user=self.user)
+        category = Categories.objects.create(title="Food")
+        self.delivered, self.undelivered = [
+            Product.objects.create(title=title, unit_price=5, inventory=10, category=category, vendor=self.seller)
+            for title in ("Delivered", "Undelivered")
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(customer=customer, delivery_address="Street 1", vendor=self.seller)
+            OrderItem.objects.create(order=order, product=self.delivered, quantity=1, unit_price=5)
+        order.delivery_status = "DELIVERED"
+        order.save()
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_review(self, product, rating="4.0"):
+        return self.client.post(
+            "/store/reviews/", {"product": product.id, "comment": "Tasty", "rating": rating}, format="json"
+        )
+
+    def test_create_runs_in_fixed_number_of_queries(self):
+        # product, savepoint, claim pending row, insert, summary, seller average,
+        # savepoint, notification insert (deduplicated by constraint), unread counter,
+        # push outbox insert, release, release (no push is sent inside the request)
+        with self.assertNumQueries(12):
+            response = self.post_review(self.delivered)
+        self.assertEqual(response.status_code, 201)
+
+        summary = VendorRatingSummary.objects.get(vendor=self.seller)
+        self.assertEqual(summary.review_count, 1)
+        self.assertEqual(summary.histogram["4"], 1)
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.average_rating, 4)
+
+    def test_duplicate_review_rejected(self):
+        self.assertEqual(self.post_review(self.delivered).status_code, 201)
+        response = self.post_review(self.delivered)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Review.objects.count(), 1)
+
+    def test_undelivered_product_rejected(self):
+        response = self.post_review(self.undelivered)
+        self.assertEqual(response.status_code, 403)
+
+    def test_delivered_product_accepted_without_the_pending_row(self):
+        # Delivered by a queryset update, so Order.save never recorded the product
+        customer = CustomerProfile.objects.get(user=self.user)
+        order = Order.objects.create(customer=customer, delivery_address="Street 1", vendor=self.seller)
+        OrderItem.objects.create(order=order, product=self.undelivered, quantity=1, unit_price=5)
+        Order.objects.filter(pk=order.pk).update(delivery_status="DELIVERED")
+        self.assertEqual(self.post_review(self.undelivered).status_code, 201)
+        self.assertEqual(self.post_review(self.undelivered).status_code, 400)
+
+    @override_settings(STORE_PENDING_REVIEWS=False)
+    def test_delivery_checked_against_orders_when_the_table_is_off(self):
+        PendingReview.objects.all().delete()
+        self.assertEqual(self.post_review(self.undelivered).status_code, 403)
+        self.assertEqual(self.post_review(self.delivered).status_code, 201)
+        self.assertEqual(self.post_review(self.delivered).status_code, 400)
+
+    def test_unique_constraint(self):
+        Review.objects.create(product=self.delivered, user=self.user, comment="One", rating=5)
+        with self.assertRaises(IntegrityError):
+            Review.objects.create(product=self.delivered, user=self.user, comment="Two", rating=4)
+
+
+class OrderCreateTests(TestCase):
+    def setUp(self):
+        seller_user = CustomUser.objects.create_user("seller@example.com", "pass", role="seller", is_active=True)
+        self.seller = SellerProfile.objects.create(user=seller_user, business_name="Shop", phone="1")
+        self.user = CustomUser.objects.create_user("customer@example.com", "pass", is_active=True)
+        self.customer = CustomerProfile.objects.create(user=self.user)
+        category = Categories.objects.create(title="Food")
+        self.products = [
+            Product.objects.create(title=title, unit_price=5, inventory=10, category=category, vendor=self.seller)
+            for title in ("Pie", "Tart")
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_confirmation_lists_the_ordered_products(self):
+        cart = Cart.objects.create(customer=self.customer)
+        for product in self.products:
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/store/orders/", {"cart_id": str(cart.id), "delivery_address": "Street 1"}, format="json"
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["items"]), 2)
+
+        confirmation = Notification.objects.get(user=self.user, notification_type="order_confirmation")
+        expected = [str(product.id) for product in self.products]
+        self.assertEqual(confirmation.product_ids, expected)
+        self.assertEqual(confirmation.payload["product_ids"], expected)
+        self.assertEqual(confirmation.payload["order_id"], response.json()["id"])
+
+    def test_vendor_notified_with_the_items(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                order = Order.objects.create(customer=self.customer, delivery_address="Street 1", vendor=self.seller)
+                OrderItem.objects.create(order=order, product=self.products[1], quantity=1, unit_price=5)
+            # Nothing is sent before the items are committed with the order
+            self.assertFalse(Notification.objects.exists())
+        new_order = Notification.objects.get(user=self.seller.user, notification_type="new_order")
+        self.assertEqual(new_order.product_ids, [str(self.products[1].id)])
+
+
+class PendingReviewTests(TestCase):
+    def setUp(self):
+        seller_user = CustomUser.objects.create_user("seller@example.com", "pass", role="seller", is_active=True)
+        self.seller = SellerProfile.objects.create(user=seller_user, business_name="Shop", phone="1")
+        self.user = CustomUser.objects.create_user("customer@example.com", "pass", is_active=True)
+        self.customer = CustomerProfile.objects.create(user=self.user)
+        category = Categories.objects.create(title="Food")
+        self.products = [
+            Product.objects.create(title=title, unit_price=5, inventory=10, category=category, vendor=self.seller)
+            for title in ("Pie", "Tart")
+        ]
+        self.order = Order.objects.create(customer=self.customer, delivery_address="Street 1", vendor=self.seller)
+        for product in self.products:
+            OrderItem.objects.create(order=self.order, product=product, quantity=1, unit_price=5)
+
+    def deliver(self, order=None):
+        order = order or self.order
+        order.delivery_status = "DELIVERED"
+        order.save()
+
+    def pending(self):
+        return set(PendingReview.objects.filter(user=self.user).values_list("product_id", "order_id"))
+
+    def test_delivery_records_each_unreviewed_product_once(self):
+        Review.objects.create(product=self.products[1], user=self.user, comment="Early", rating=4)
+        self.order.delivery_status = "ON_ROUTE"
+        self.order.save()
+        self.assertEqual(self.pending(), set())
+
+        self.deliver()
+        self.assertEqual(self.pending(), {(self.products[0].pk, self.order.pk)})
+        # Re-saving a delivered order adds nothing
+        self.order.save()
+        self.assertEqual(PendingReview.objects.count(), 1)
+
+    def test_deleting_a_review_reopens_the_product(self):
+        self.deliver()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            "/store/reviews/", {"product": self.products[0].pk, "comment": "Tasty", "rating": "5.0"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.pending(), {(self.products[1].pk, self.order.pk)})
+
+        Review.objects.get(user=self.user, product=self.products[0]).delete()
+        self.assertEqual(self.pending(), {(p.pk, self.order.pk) for p in self.products})
+
+    def test_admin_mark_as_completed_records_products(self):
+        admin_user = CustomUser.objects.create_superuser("admin@example.com", "pass")
+        self.client.force_login(admin_user)
+        response = self.client.post(
+            "/admin/store/order/", {"action": "mark_as_completed", "_selected_action": [self.order.pk]}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.delivery_status, "DELIVERED")
+        self.assertEqual(self.pending(), {(p.pk, self.order.pk) for p in self.products})
+
+    def test_reviewable_products_with_and_without_the_table(self):
+        self.deliver()
+        Review.objects.create(product=self.products[0], user=self.user, comment="Ok", rating=3)
+        for enabled in (True, False):
+            with self.subTest(STORE_PENDING_REVIEWS=enabled), override_settings(STORE_PENDING_REVIEWS=enabled):
+                self.assertEqual(list(Review.get_reviewable_products(self.user)), [self.products[1]])
+
+
+class VendorRatingSummaryTests(TestCase):
+    def setUp(self):
+        seller_user = CustomUser.objects.create_user("seller@example.com", "pass", role="seller", is_active=True)
+        self.seller = SellerProfile.objects.create(user=seller_user, business_name="Shop", phone="1")
+        category = Categories.objects.create(title="Food")
+        self.product = Product.objects.create(
+            title="Pie", unit_price=5, inventory=10, category=category, vendor=self.seller
+        )
+
+    def review(self, rating, number=0):
+        user = CustomUser.objects.create_user(f"customer{number}@example.com", "pass", is_active=True)
+        return Review.objects.create(product=self.product, user=user, comment="Ok", rating=rating)
+
+    def summary(self):
+        self.seller.refresh_from_db()
+        return VendorRatingSummary.objects.get(vendor=self.seller)
+
+    def test_create_edit_and_delete_adjust_the_summary(self):
+        self.review("4.0", 1)
+        review = self.review("2.4", 2)
+        summary = self.summary()
+        self.assertEqual((summary.review_count, summary.rating_total), (2, Decimal("6.4")))
+        self.assertEqual(summary.histogram, {"1": 0, "2": 1, "3": 0, "4": 1, "5": 0})
+        self.assertEqual(self.seller.average_rating, Decimal("3.2"))
+
+        # Edits move the rating between buckets, whether the review was loaded or just saved
+        loaded = Review.objects.get(pk=review.pk)
+        loaded.rating = Decimal("4.6")
+        loaded.save()
+        loaded.rating = Decimal("5.0")
+        loaded.save()
+        summary = self.summary()
+        self.assertEqual((summary.review_count, summary.rating_total), (2, Decimal("9.0")))
+        self.assertEqual(summary.histogram, {"1": 0, "2": 0, "3": 0, "4": 1, "5": 1})
+        self.assertEqual(self.seller.average_rating, Decimal("4.5"))
+
+        # Saving without a rating change leaves it alone
+        loaded.comment = "Better"
+        loaded.save()
+        self.assertEqual(self.summary().rating_total, Decimal("9.0"))
+
+        Review.objects.get(pk=review.pk).delete()
+        summary = self.summary()
+        self.assertEqual((summary.review_count, summary.rating_total), (1, Decimal("4.0")))
+        self.assertEqual(summary.histogram["5"], 0)
+        self.assertEqual(self.seller.average_rating, 4)
+
+    def test_moving_a_review_to_another_vendor_moves_its_rating(self):
+        other_user = CustomUser.objects.create_user("other@example.com", "pass", role="seller", is_active=True)
+        other = SellerProfile.objects.create(user=other_user, business_name="Other", phone="2")
+        other_product = Product.objects.create(
+            title="Tart", unit_price=5, inventory=10, category=self.product.category, vendor=other
+        )
+        self.review("2.0", 1)
+        review = Review.objects.get(pk=self.review("4.0", 2).pk)
+
+        review.product = other_product
+        review.rating = Decimal("5.0")
+        review.save()
+        summary = self.summary()
+        self.assertEqual((summary.review_count, summary.rating_total), (1, Decimal("2.0")))
+        self.assertEqual(summary.histogram["4"], 0)
+        self.assertEqual(self.seller.average_rating, 2)
+        moved = VendorRatingSummary.objects.get(vendor=other)
+        self.assertEqual((moved.review_count, moved.rating_total, moved.histogram["5"]), (1, Decimal("5.0"), 1))
+        other.refresh_from_db()
+        self.assertEqual(other.average_rating, 5)
+
+    def test_reconcile_repairs_drifted_summaries(self):
+        self.review("4.0", 1)
+        self.review("2.4", 2)
+        self.review(None, 3)
+        VendorRatingSummary.objects.filter(vendor=self.seller).update(review_count=9, stars_4=0, rating_total=1)
+        SellerProfile.objects.filter(pk=self.seller.pk).update(average_rating=1)
+
+        out = StringIO()
+        call_command("reconcile_rating_summaries", "--dry-run", stdout=out)
+        self.assertIn("Would fix 1 rating summary record(s)", out.getvalue())
+        self.assertEqual(self.summary().review_count, 9)
+
+        call_command("reconcile_rating_summaries", stdout=out)
+        summary = self.summary()
+        self.assertEqual((summary.review_count, summary.rating_total), (3, Decimal("6.4")))
+        self.assertEqual(summary.histogram, {"1": 0, "2": 1, "3": 0, "4": 1, "5": 0})
+        self.assertEqual(self.seller.average_rating, Decimal("3.2"))
+        out = StringIO()
+        call_command("reconcile_rating_summaries", stdout=out)
+        self.assertIn("Fixed 0 rating summary record(s)", out.getvalue())
+
+    def test_unrated_reviews_count_but_do_not_move_the_average(self):
+        self.review("3.0", 1)
+        self.review(None, 2)
+        summary = self.summary()
+        self.assertEqual((summary.review_count, summary.rating_count), (2, 1))
+        self.assertEqual(self.seller.average_rating, 3)
+
+    def test_vendor_reviews_are_paginated_with_the_whole_summary(self):
+        for number in range(12):
+            self.review("5.0" if number % 2 else "3.0", number)
+        client = APIClient()
+        client.force_authenticate(self.seller.user)
+
+        data = client.get(f"/store/reviews/vendor/{self.seller.pk}/", {"page_size": 5}).json()
+        self.assertEqual(data["count"], 12)
+        self.assertEqual(len(data["results"]), 5)
+        self.assertIsNotNone(data["next"])
+        self.assertEqual(data["rating_summary"]["review_count"], 12)
+        self.assertEqual(data["rating_summary"]["average_rating"], "4.00")
+        self.assertEqual(data["rating_summary"]["histogram"], {"1": 0, "2": 0, "3": 6, "4": 0, "5": 6})
+
+        last = client.get(f"/store/reviews/vendor/{self.seller.pk}/", {"page_size": 5, "page": 3}).json()
+        self.assertEqual(len(last["results"]), 2)
+        self.assertEqual(last["rating_summary"], data["rating_summary"])
+        self.assertEqual(client.get("/store/reviews/vendor/999999/").status_code, 404)
+
+
+class FavouriteProductTests(TestCase):
+    def setUp(self):
+        seller_user = CustomUser.objects.create_user("seller@example.com", "pass", role="seller", is_active=True)
+        self.seller = SellerProfile.objects.create(user=seller_user, business_name="Shop", phone="1")
+        category = Categories.objects.create(title="Food")
+        self.products = [
+            Product.objects.create(title=f"P{i}", unit_price=5, inventory=10, category=category, vendor=self.seller)
+            for i in range(4)
+        ]
+        self.user = CustomUser.objects.create_user("customer@example.com", "pass", is_active=True)
+        self.customer = CustomerProfile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def favourite(self, product):
+        self.assertEqual(self.client.post("/store/favourites/", {"product": product.pk}).status_code, 201)
+
+    def test_is_favourited_comes_from_one_subquery(self):
+        self.favourite(self.products[1])
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get("/store/products/").json()
+        self.assertEqual({p["id"]: p["is_favourited"] for p in data}, {
+            product.pk: product == self.products[1] for product in self.products
+        })
+        favourite_queries = [q for q in queries.captured_queries if "favouriteproduct" in q["sql"]]
+        self.assertEqual(len(favourite_queries), 1)
+
+        detail = self.client.get(f"/store/products/{self.products[1].pk}/").json()
+        self.assertTrue(detail["is_favourited"])
+        anonymous = APIClient().get("/store/products/").json()
+        self.assertFalse(any(p["is_favourited"] for p in anonymous))
+
+    def test_favourites_list_annotates_review_stats_in_fixed_queries(self):
+        other = CustomUser.objects.create_user("other@example.com", "pass", is_active=True)
+        Review.objects.create(product=self.products[0], user=self.user, comment="Ok", rating="3.0")
+        Review.objects.create(product=self.products[0], user=other, comment="Ok", rating="4.0")
+        self.favourite(self.products[0])
+        with CaptureQueriesContext(connection) as one:
+            self.client.get("/store/favourites/")
+        for product in self.products[1:]:
+            self.favourite(product)
+        with CaptureQueriesContext(connection) as many:
+            data = self.client.get("/store/favourites/").json()
+        self.assertEqual(len(many), len(one))
+
+        stats = {f["product"]: (f["review_count"], f["average_rating"]) for f in data}
+        self.assertEqual(stats[self.products[0].pk], (2, 3.5))
+        self.assertEqual(stats[self.products[2].pk], (0, 0))
+        self.assertEqual({f["vendor_name"] for f in data}, {"Shop"})
+
+
+def png_upload(name, color="red", size=(64, 64)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+class PrimaryImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, IMAGE_DERIVATIVES_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        seller_user = CustomUser.objects.create_user("seller@example.com", "pass", role="seller", is_active=True)
+        seller = SellerProfile.objects.create(user=seller_user, business_name="Shop", phone="1")
+        self.product = Product.objects.create(
+            title="Pie", unit_price=5, inventory=10, category=Categories.objects.create(title="Food"), vendor=seller
+        )
+
+    def add_image(self, color, position):
+        return ProductImage.objects.create(product=self.product, image=png_upload(f"{color}.png", color), position=position)
+
+    def primary(self):
+        self.product.refresh_from_db()
+        return self.product.primary_image_id
+
+    def test_primary_image_follows_the_lowest_position(self):
+        self.assertIsNone(self.primary())
+        second = self.add_image("red", 2)
+        self.assertEqual(self.primary(), second.pk)
+        self.assertEqual(self.product.thumbnail_url, second.image.url)
+        first = self.add_image("blue", 1)
+        self.assertEqual(self.primary(), first.pk)
+
+        # Reorder
+        second.position = 0
+        second.save()
+        self.assertEqual(self.primary(), second.pk)
+
+        second.delete()
+        self.assertEqual(self.primary(), first.pk)
+        first.delete()
+        self.assertIsNone(self.primary())
+        self.assertEqual(self.product.thumbnail_url, "")
+
+    def test_thumbnail_url_switches_to_the_derivative(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = self.add_image("green", 0)
+        self.assertEqual(self.primary(), image.pk)
+        self.assertTrue(self.product.thumbnail_url.endswith("_thumbnail.webp"))
+
+
+class DealFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seller_user = CustomUser.objects.create_user("seller@example.com", "pass", role="seller", is_active=True)
+        self.seller = SellerProfile.objects.create(user=seller_user, business_name="Shop", phone="1")
+        self.client = APIClient()
+        self.client.force_authenticate(seller_user)
+
+    def deal(self, title, **fields):
+        fields.setdefault("discount_type", Deal.FREE_DELIVERY)
+        return Deal.objects.create(title=title, description="x", original_price=10, seller=self.seller, **fields)
+
+    def feed(self, tag=None):
+        return [deal["title"] for deal in self.client.get("/store/deals/active/", {"tag": tag} if tag else {}).json()]
+
+    def test_feed_is_cached_until_a_deal_changes(self):
+        deal = self.deal("Low", priority=1)
+        self.deal("High", priority=5)
+        expired = self.deal("Expired", valid_until=timezone.now() - timedelta(minutes=1))
+        self.assertFalse(expired.is_active)
+        self.assertEqual(self.feed(), ["High", "Low"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.feed(), ["High", "Low"])
+
+        deal.priority = 9
+        deal.save()
+        self.assertEqual(self.feed(), ["Low", "High"])
+        deal.delete()
+        self.assertEqual(self.feed(), ["High"])
+
+    def test_tag_feeds_follow_the_tag_table(self):
+        deal = self.deal("Tagged", tags=["featured"])
+        self.deal("Plain")
+        self.assertEqual(self.feed("featured"), ["Tagged"])
+        self.assertEqual(list(DealTag.objects.values_list("tag", flat=True)), ["featured"])
+
+        deal.tags = ["weekend"]
+        deal.save()
+        self.assertEqual(self.feed("featured"), [])
+        self.assertEqual(self.feed("weekend"), ["Tagged"])
+
+    def test_cache_never_outlives_the_first_expiry(self):
+        self.deal("Open-ended")
+        self.deal("Soon", valid_until=timezone.now() + timedelta(seconds=42))
+        with mock.patch("store.views.cache.set", wraps=cache.set) as cache_set:
+            self.feed()
+        self.assertLessEqual(cache_set.call_args.args[2], 42)
+
+        now = timezone.now()
+        deals = [Deal(valid_until=None), Deal(valid_until=now + timedelta(hours=1))]
+        with override_settings(DEAL_FEED_CACHE_TIMEOUT=300):
+            self.assertEqual(deal_feed_timeout(deals[:1], now), 300)
+            self.assertEqual(deal_feed_timeout(deals, now), 300)
+            self.assertEqual(deal_feed_timeout([Deal(valid_until=now + timedelta(seconds=30))], now), 30)
+
+    def test_best_deal_by_priority_then_saving_then_age(self):
+        self.deal("Small saving", priority=1, discount_type=Deal.FIXED, discount_value=2)
+        half = self.deal("Half off", priority=1, discount_type=Deal.PERCENTAGE, discount_value=50)
+        self.deal("Biggest but low priority", discount_type=Deal.FIXED, discount_value=9)
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.best_deal, half)
+
+        top = self.deal("Top", priority=2)
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.best_deal, top)
+        top.delete()
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.best_deal, half)
+
+    def test_sweep_deactivates_expired_deals_and_moves_best_deal(self):
+        fallback = self.deal("Fallback")
+        expiring = self.deal("Expiring", priority=5, valid_until=timezone.now() + timedelta(hours=1))
+        self.assertEqual(self.feed(), ["Expiring", "Fallback"])
+        # Expiry passes without any write to the deal
+        Deal.objects.filter(pk=expiring.pk).update(valid_until=timezone.now() - timedelta(seconds=1))
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.best_deal, expiring)
+
+        out = StringIO()
+        call_command("sweep_deals", stdout=out)
+        self.assertIn("Deactivated 1 expired deal(s).", out.getvalue())
+        expiring.refresh_from_db()
+        self.assertFalse(expiring.is_active)
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.best_deal, fallback)
+        self.assertEqual(self.feed(), ["Fallback"])
+
+        call_command("sweep_deals", stdout=out)
+        self.assertIn("Deactivated 0 expired deal(s).", out.getvalue())
+
+    def test_extending_a_swept_deal_reactivates_it(self):
+        self.deal("Fallback")
+        expiring = self.deal("Expiring", priority=5, valid_until=timezone.now() + timedelta(hours=1))
+        Deal.objects.filter(pk=expiring.pk).update(valid_until=timezone.now() - timedelta(seconds=1))
+        call_command("sweep_deals", stdout=StringIO())
+        self.assertEqual(self.feed(), ["Fallback"])
+
+        data = self.client.get(f"/store/deals/{expiring.pk}/").json()
+        data.update(seller=self.seller.pk, valid_until=(timezone.now() + timedelta(days=1)).isoformat())
+        response = self.client.put(f"/store/deals/{expiring.pk}/", data, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        expiring.refresh_from_db()
+        self.assertTrue(expiring.is_active)
+        self.assertEqual(self.feed(), ["Expiring", "Fallback"])
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.best_deal, expiring)
+
+        # Partial saves keep the flag in step too
+        expiring.valid_until = timezone.now() - timedelta(seconds=1)
+        expiring.save(update_fields=["valid_until"])
+        expiring.refresh_from_db()
+        self.assertFalse(expiring.is_active)
+
+    def test_feed_not_cached_past_an_expiry(self):
+        self.deal("Stale", valid_until=timezone.now() + timedelta(milliseconds=500))
+        with mock.patch("store.views.cache.set") as cache_set:
+            self.assertEqual(self.feed(), ["Stale"])
+        cache_set.assert_not_called()
+
+
+class BannerServer(ThreadingHTTPServer):
+    """Local stand-in for a remote image host"""
+
+    def __init__(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (2000, 1000), "orange").save(buffer, "PNG")
+        self.banner = buffer.getvalue()
+        self.hits = 0
+        super().__init__(("127.0.0.1", 0), BannerRequestHandler)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+
+class BannerRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits += 1
+        if not self.path.startswith("/banner.png"):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(self.server.banner)))
+        self.end_headers()
+        self.wfile.write(self.server.banner)
+
+    def log_message(self, *args):
+        pass
+
+
+class DealBannerProxyTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = BannerServer()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        settings_override = override_settings(
+            DEAL_BANNER_CACHE_DIR=self.cache_dir, DEAL_BANNER_ALLOW_PRIVATE_HOSTS=True
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.server.hits = 0
+
+        seller_user = CustomUser.objects.create_user("seller@example.com", "pass", role="seller", is_active=True)
+        seller = SellerProfile.objects.create(user=seller_user, business_name="Shop", phone="1")
+        self.deal = Deal.objects.create(
+            title="30% Off", description="All food", image=self.server.url("/banner.png"),
+            original_price=10, discount_type=Deal.FREE_DELIVERY, seller=seller,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(seller_user)
+
+    def get_banner(self, size="card", deal=None):
+        return APIClient().get(f"/store/deals/{(deal or self.deal).pk}/banner/", {"size": size})
+
+    def test_banner_fetched_once_and_resized(self):
+        response = self.get_banner("card")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        image = Image.open(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(image.size, (720, 360))
+
+        self.assertEqual(self.get_banner("thumbnail").status_code, 200)
+        self.assertEqual(self.get_banner("card").status_code, 200)
+        self.assertEqual(self.server.hits, 1)
+
+    def test_concurrent_misses_fetch_once(self):
+        from .caching import deal_banner_cache
+
+        paths = []
+        threads = [
+            threading.Thread(target=lambda: paths.append(deal_banner_cache().get(self.deal.image, "card")))
+            for _ in range(6)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(paths)), 1)
+        self.assertEqual(len(paths), 6)
+        self.assertEqual(self.server.hits, 1)
+        # Locks are striped, not kept per URL
+        self.assertEqual(len(deal_banner_cache()._locks), deal_banner_cache().lock_stripes)
+
+    def test_serializer_returns_proxy_urls(self):
+        data = self.client.get(f"/store/deals/{self.deal.pk}/").json()
+        self.assertIn(f"/store/deals/{self.deal.pk}/banner/?size=card", data["image"])
+        self.assertEqual(set(data["image_sizes"]), {"thumbnail", "card", "full"})
+
+        # Echoing the proxied URL back keeps the original source
+        self.client.patch(f"/store/deals/{self.deal.pk}/", {"image": data["image"]}, format="json")
+        self.deal.refresh_from_db()
+        self.assertEqual(self.deal.image, self.server.url("/banner.png"))
+
+    def test_upstream_failure_and_unknown_size(self):
+        self.assertEqual(self.get_banner("huge").status_code, 400)
+        Deal.objects.filter(pk=self.deal.pk).update(image=self.server.url("/missing.png"))
+        self.assertEqual(self.get_banner().status_code, 502)
+
+    def test_private_hosts_refused_by_default(self):
+        with override_settings(DEAL_BANNER_ALLOW_PRIVATE_HOSTS=False):
+            self.assertEqual(self.get_banner().status_code, 502)
+        self.assertEqual(self.server.hits, 0)
+
+    def test_least_recently_used_banners_evicted(self):
+        other = Deal.objects.create(
+            title="Other", description="x", image=self.server.url("/banner.png?v=2"),
+            original_price=10, discount_type=Deal.FREE_DELIVERY, seller=self.deal.seller,
+        )
+        self.get_banner(deal=self.deal)
+        one_banner = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(self.cache_dir) for name in files
+        )
+        # Room for a single banner's renders: fetching the other one evicts the first
+        with override_settings(DEAL_BANNER_CACHE_MAX_BYTES=one_banner):
+            self.get_banner(deal=other)
+            self.get_banner(deal=other)
+            self.assertEqual(self.server.hits, 2)
+            self.get_banner(deal=self.deal)
+            self.assertEqual(self.server.hits, 3)
@@ -5,9 +5,10 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.exceptions import ValidationError
-from django.db.models import Avg, Count
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, Exists, OuterRef, Value, BooleanField
 from django.core.exceptions import PermissionDenied
-from .models import Deal, Product, Categories, Order, OrderItem, Cart, CartItem, Review, FavouriteProduct, Feedback
+from .models import Deal, Product, Categories, Order, OrderItem, Cart, CartItem, Review, FavouriteProduct, Feedback, VendorRatingSummary, PendingReview
 from .serializers import (
     DealSerializer,
     ProductMinimalSerializer,
@@ -25,21 +26,36 @@ from .serializers import (
     CreateOrderSerializer,
     FavouriteProductSerializer,
     FeedbackSerializer,
+    VendorRatingSummarySerializer,
+    SellerListingSerializer,
+    serialize_best_deal,
 )
 from users.models import SellerProfile, CustomerProfile
 from .permissions import CategoryPermission
 from django.db.models import Count
 from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiParameter
-from users.serializers import SellerProfileSerializer
 from notifications.utils import notify_user
 from django.http import Http404
 from rest_framework import status
+from rest_framework.pagination import PageNumberPagination
+from django.core.cache import cache
+from .caching import deal_banner_cache, deal_feed_cache_key, deal_feed_timeout
+from django.conf import settings
+from django.http import FileResponse
+from mediafiles.remote import RemoteImageError
+
+
+class VendorReviewPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 50
+
 class SellerProfileViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     """
     API endpoint to list verified sellers with their profile information and ratings.
     """
-    queryset = SellerProfile.objects.filter(verification_status=SellerProfile.VERIFIED).select_related('user')
-    serializer_class = SellerProfileSerializer
+    queryset = SellerProfile.objects.filter(verification_status=SellerProfile.VERIFIED).select_related('user', 'best_deal')
+    serializer_class = SellerListingSerializer
     permission_classes = []  # Public access
 
     # Optional: Enable filtering, searching, and ordering
@@ -65,7 +81,10 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     def get_serializer_context(self):
         """Inject request context for image URL generation"""
-        return {"request": self.request}
+        return {
+            "request": self.request,
+            "image_variant": "card" if self.action == "list" else "full",
+        }
 
     def get_serializer_class(self):
         """Dynamically choose serializer based on action"""
@@ -82,10 +101,19 @@ class ProductViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Filter products based on user role"""
         queryset = super().get_queryset()
+        user = self.request.user
+
+        # Favourite flag for the whole page in one EXISTS subquery
+        if user.is_authenticated:
+            queryset = queryset.annotate(is_favourited=Exists(
+                FavouriteProduct.objects.filter(customer__user=user, product=OuterRef("pk"))
+            ))
+        else:
+            queryset = queryset.annotate(is_favourited=Value(False, output_field=BooleanField()))
 
         # For sellers, only show their own products
-        if hasattr(self.request.user, "seller_profile"):
-            return queryset.filter(vendor=self.request.user.seller_profile)
+        if hasattr(user, "seller_profile"):
+            return queryset.filter(vendor=user.seller_profile)
 
         # For customers/admins, show all available products
         return queryset
@@ -122,7 +150,9 @@ class ProductViewSet(viewsets.ModelViewSet):
             return Response({"error": "Only sellers can access this"}, status=403)
 
         queryset = self.get_queryset().filter(vendor=request.user.seller_profile)
-        serializer = SellerProductSerializer(queryset, many=True)
+        serializer = SellerProductSerializer(
+            queryset, many=True, context={**self.get_serializer_context(), "image_variant": "card"}
+        )
         return Response(serializer.data)
 
 @extend_schema(tags=["Category APi's"])
@@ -215,22 +245,24 @@ class OrderViewSet(viewsets.ModelViewSet):
         )
     
         order_serializer.is_valid(raise_exception=True)
-        order = order_serializer.save()  # Customer is set in serializer's create method
-
-    # Convert cart items to order items
-        order_items = [
-            OrderItem(
-                order=order,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.product.unit_price,
-            )
-            for cart_item in cart.items.all()
-        ]
-        OrderItem.objects.bulk_create(order_items)
+        # One transaction, so the creation notifications (sent on commit) see the items
+        with transaction.atomic():
+            order = order_serializer.save()  # Customer is set in serializer's create method
+
+            # Convert cart items to order items
+            order_items = [
+                OrderItem(
+                    order=order,
+                    product=cart_item.product,
+                    quantity=cart_item.quantity,
+                    unit_price=cart_item.product.unit_price,
+                )
+                for cart_item in cart.items.all()
+            ]
+            OrderItem.objects.bulk_create(order_items)
 
-    # Clear the cart
-        cart.delete()
+            # Clear the cart
+            cart.delete()
         
         # Return the full order using OrderSerializer
         full_order_serializer = OrderSerializer(order)
@@ -373,14 +405,29 @@ class ReviewViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=["get"], url_path="vendor/(?P<vendor_id>[^/.]+)")
     def vendor_reviews(self, request, vendor_id=None):
+        """Paginated vendor review feed with the stored rating summary"""
         try:
-            vendor = SellerProfile.objects.get(pk=vendor_id)
+            vendor = SellerProfile.objects.select_related("rating_summary", "best_deal").get(pk=vendor_id)
         except SellerProfile.DoesNotExist:
             return Response({"error": "Vendor not found"}, status=404)
 
-        reviews = Review.objects.filter(product__vendor=vendor)
-        serializer = self.get_serializer(reviews, many=True)
-        return Response(serializer.data)
+        try:
+            summary = vendor.rating_summary
+        except VendorRatingSummary.DoesNotExist:
+            summary = VendorRatingSummary(vendor=vendor)
+
+        reviews = (
+            Review.objects.filter(product__vendor=vendor)
+            .select_related("user", "product")
+            .order_by("-date", "-id")
+        )
+        paginator = VendorReviewPagination()
+        page = paginator.paginate_queryset(reviews, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        response = paginator.get_paginated_response(serializer.data)
+        response.data["rating_summary"] = VendorRatingSummarySerializer(summary).data
+        response.data["best_deal"] = serialize_best_deal(vendor)
+        return response
 
     @action(detail=False, methods=['get'])
     def to_give(self, request):
@@ -397,34 +444,40 @@ class ReviewViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     def create(self, request, *args, **kwargs):
-        """Override creation to validate delivery status"""
-        product_id = request.data.get("product")
-        
-        # Check if product exists
-        try:
-            product = Product.objects.get(pk=product_id)
-        except Product.DoesNotExist:
-            return Response({"error": "Product not found"}, status=404)
+        """Create a review; delivery and duplicates are enforced by the database"""
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            if any(error.code == "does_not_exist" for error in serializer.errors.get("product", [])):
+                return Response({"error": "Product not found"}, status=404)
+            raise ValidationError(serializer.errors)
+        product = serializer.validated_data["product"]
 
-        # Verify delivery
-        if not Order.objects.filter(
-            customer=request.user.customer_profile,
-            items__product=product,
-            delivery_status="DELIVERED"
-        ).exists():
+        try:
+            with transaction.atomic():
+                # Claiming the pending-review row (written on delivery) is the eligibility check;
+                # without the table, or for orders delivered without Order.save, check the orders
+                claimed = 0
+                if settings.STORE_PENDING_REVIEWS:
+                    claimed, _ = PendingReview.objects.filter(user=request.user, product=product).delete()
+                eligible = bool(claimed) or Review.was_delivered_to(request.user, product)
+                if eligible:
+                    serializer.context["pending_claimed"] = bool(claimed)
+                    serializer.save()
+        except IntegrityError:
+            eligible = False
+
+        if not eligible:
+            if Review.objects.filter(user=request.user, product=product).exists():
+                return Response(
+                    {"error": "You've already reviewed this product"},
+                    status=400
+                )
             return Response(
                 {"error": "You can only review delivered products"},
                 status=403
             )
 
-        # Prevent duplicate reviews
-        if Review.objects.filter(user=request.user, product=product).exists():
-            return Response(
-                {"error": "You've already reviewed this product"},
-                status=400
-            )
-
-        return super().create(request, *args, **kwargs)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
 class CartViewSet(
@@ -498,7 +551,15 @@ class FavouriteProductViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return FavouriteProduct.objects.filter(customer=self.request.user.customer_profile)
+        """Favourites with vendor, cover image and review stats loaded in one query"""
+        return (
+            FavouriteProduct.objects.filter(customer__user=self.request.user)
+            .select_related("product__vendor")
+            .annotate(
+                product_review_count=Count("product__reviews"),
+                product_average_rating=Avg("product__reviews__rating"),
+            )
+        )
 
     def create(self, request, *args, **kwargs):
         customer = request.user.customer_profile
@@ -573,13 +634,54 @@ class DealViewSet(viewsets.ModelViewSet):
         user = self.request.user
         # Allow everyone to view all deals
         if self.request.method in permissions.SAFE_METHODS:
-            return Deal.objects.all()
+            return Deal.objects.select_related("seller")
 
         # For write operations, restrict to owner or admin
         if user.is_staff:
             return Deal.objects.all()
         return Deal.objects.filter(seller=user.seller_profile)
 
+    @action(detail=False, methods=["get"])
+    def active(self, request):
+        """Unexpired deals by priority, optionally ?tag=; cached until the earliest expiry"""
+        tag = request.query_params.get("tag")
+        cache_key = deal_feed_cache_key(tag, request.get_host())
+        data = cache.get(cache_key)
+        if data is None:
+            deals = Deal.active().select_related("seller")
+            if tag:
+                deals = deals.filter(tag_entries__tag=tag)
+            deals = list(deals)
+            data = list(self.get_serializer(deals, many=True).data)
+            timeout = deal_feed_timeout(deals)
+            if timeout > 0:
+                cache.set(cache_key, data, timeout)
+        return Response(data)
+
+    @action(detail=True, methods=["get"], permission_classes=[permissions.AllowAny])
+    def banner(self, request, pk=None):
+        """The deal's banner resized to ?size= (thumbnail/card/full), from the local banner cache"""
+        deal = self.get_object()
+        size = request.query_params.get("size", "card")
+        if size not in settings.DEAL_BANNER_SIZES:
+            return Response(
+                {"error": f"size must be one of: {', '.join(settings.DEAL_BANNER_SIZES)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not deal.image:
+            return Response({"error": "This deal has no banner"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            try:
+                banner = open(deal_banner_cache().get(deal.image, size), "rb")
+            except FileNotFoundError:
+                # Evicted between lookup and open; fetch again
+                banner = open(deal_banner_cache().get(deal.image, size), "rb")
+        except RemoteImageError:
+            return Response({"error": "Banner could not be fetched"}, status=status.HTTP_502_BAD_GATEWAY)
+        response = FileResponse(banner, content_type="image/webp")
+        response["Cache-Control"] = f"public, max-age={settings.DEAL_BANNER_BROWSER_CACHE_SECONDS}"
+        return response
+
     def perform_create(self, serializer):
         """Auto-set the seller to the current user's SellerProfile."""
         serializer.save(seller=self.request.user.seller_profile)
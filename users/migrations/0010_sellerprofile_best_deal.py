@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+def backfill_best_deals(apps, schema_editor):
+    Deal = apps.get_model('store', 'Deal')
+    SellerProfile = apps.get_model('users', 'SellerProfile')
+
+    best = {}
+    deals = (
+        Deal.objects.filter(Q(valid_until__isnull=True) | Q(valid_until__gt=timezone.now()), is_active=True)
+        .annotate(savings=F('original_price') - F('final_price'))
+        .order_by('seller_id', '-priority', '-savings', '-created_at')
+        .values_list('seller_id', 'id')
+    )
+    for seller_id, deal_id in deals.iterator():
+        best.setdefault(seller_id, deal_id)
+    for seller_id, deal_id in best.items():
+        SellerProfile.objects.filter(pk=seller_id).update(best_deal_id=deal_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_deal_is_active'),
+        ('users', '0009_alter_customerprofile_address_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sellerprofile',
+            name='best_deal',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.deal'),
+        ),
+        migrations.RunPython(backfill_best_deals, migrations.RunPython.noop),
+    ]
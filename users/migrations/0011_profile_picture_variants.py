@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_sellerprofile_best_deal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerprofile',
+            name='profile_picture_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='sellerprofile',
+            name='profile_picture_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
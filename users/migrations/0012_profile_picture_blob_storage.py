@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:23
+
+import mediafiles.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_profile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customerprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=mediafiles.storage.ContentAddressedStorage(), upload_to='profile_pictures/customers/'),
+        ),
+        migrations.AlterField(
+            model_name='sellerprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=mediafiles.storage.ContentAddressedStorage(), upload_to='profile_pictures/'),
+        ),
+    ]
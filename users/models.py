@@ -5,6 +5,7 @@ from django.conf import settings
 import random
 from datetime import timedelta
 from django.utils import timezone
+from mediafiles.storage import blob_storage
 
 class CustomUserManager(BaseUserManager):
     
@@ -71,8 +72,9 @@ class CustomerProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     profile_picture = models.ImageField(
-    upload_to='profile_pictures/customers/', blank=True, null=True
+    upload_to='profile_pictures/customers/', storage=blob_storage, blank=True, null=True
         )
+    profile_picture_variants = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return self.user.email
@@ -98,8 +100,9 @@ class SellerProfile(models.Model):
     business_description = models.TextField(blank=True, null=True)
     opening_closing_time = models.CharField(max_length=255, blank=True, null=True)  # E.g. "9 AM - 5 PM"
     profile_picture = models.ImageField(
-        upload_to="profile_pictures/", blank=True, null=True
+        upload_to="profile_pictures/", storage=blob_storage, blank=True, null=True
     )
+    profile_picture_variants = models.JSONField(default=dict, blank=True)
     business_address = models.TextField(blank=True, default="")
     phone = models.CharField(max_length=15)
     verification_status = models.CharField(
@@ -107,6 +110,10 @@ class SellerProfile(models.Model):
     )
     # //new l
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    # Precomputed by store.Deal.refresh_best_deals so listings need no deal scan
+    best_deal = models.ForeignKey(
+        "store.Deal", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
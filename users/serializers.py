@@ -1,6 +1,7 @@
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 from .models import CustomerProfile, SellerProfile, CustomUser, EmailOTP
+from mediafiles.fields import DerivativeImageField
 
 class CustomUserCreateSerializer(UserCreateSerializer):
     role = serializers.ChoiceField(
@@ -65,6 +66,7 @@ class ResendOTPSerializer(serializers.Serializer):
 
 class CustomerProfileSerializer(serializers.ModelSerializer):
     role = serializers.CharField(source='user.role', read_only=True)
+    profile_picture = DerivativeImageField(required=False, allow_null=True)
     class Meta:
         model = CustomerProfile
         fields = ["id", "name", "phone", "address", "role", "profile_picture", "created_at", "updated_at"]
@@ -72,6 +74,7 @@ class CustomerProfileSerializer(serializers.ModelSerializer):
 
 class SellerProfileSerializer(serializers.ModelSerializer):
     role = serializers.CharField(source='user.role', read_only=True)
+    profile_picture = DerivativeImageField(required=False, allow_null=True)
     class Meta:
         model = SellerProfile
         fields = [
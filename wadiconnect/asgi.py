@@ -2,6 +2,8 @@
 ASGI config for wadiconnect project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. uvicorn) for the live notification stream,
+whose idle connections are held on the event loop rather than by threads.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
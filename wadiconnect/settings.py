@@ -55,6 +55,7 @@ INSTALLED_APPS = [
     # 'notifications',
     'notifications.apps.NotificationsConfig',
     "store",
+    "mediafiles",
 ]
 
 MIDDLEWARE = [
@@ -129,6 +130,87 @@ SIMPLE_JWT = {
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
 }
 
+# Per-process cache by default; point at a shared backend (e.g. Redis/Memcached) when running several workers
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Upper bound for the cached active-deals feed; entries are also capped at the earliest valid_until
+DEAL_FEED_CACHE_TIMEOUT = 300
+
+# Deal banners (remote URLs) are fetched once, resized and served from a local LRU disk cache
+DEAL_BANNER_SIZES = {
+    "thumbnail": (320, 160),
+    "card": (720, 360),
+    "full": (1440, 720),
+}
+DEAL_BANNER_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'deal_banners')
+DEAL_BANNER_CACHE_MAX_BYTES = 200 * 1024 * 1024
+DEAL_BANNER_MAX_SOURCE_BYTES = 10 * 1024 * 1024
+DEAL_BANNER_FETCH_TIMEOUT = (3, 10)  # (connect, read) seconds
+# Refuse banner URLs that resolve to loopback/private networks (SSRF guard)
+DEAL_BANNER_ALLOW_PRIVATE_HOSTS = False
+DEAL_BANNER_BROWSER_CACHE_SECONDS = 7 * 24 * 3600
+
+# Serve reviews/to_give from the maintained PendingReview table instead of an anti-join
+STORE_PENDING_REVIEWS = True
+
+# Firebase Cloud Messaging (HTTP v1). FCM_SEND_URL/FCM_IID_URL/FCM_ACCESS_TOKEN can point at a local stand-in.
+FCM_PROJECT_ID = "kwick-6315e"
+FCM_SEND_URL = "https://fcm.googleapis.com/v1/projects/{project_id}/messages:send"
+FCM_IID_URL = "https://iid.googleapis.com/iid/v1"  # topic membership (batchAdd/batchRemove)
+FCM_ACCESS_TOKEN = None  # static bearer token; None uses the service account key
+FCM_TIMEOUT = (3, 10)  # (connect, read) seconds
+# Parallel sends (and pooled keep-alive connections) per process
+FCM_MAX_CONCURRENCY = 8
+# OAuth tokens are cached per process and refreshed this many seconds before they expire
+FCM_TOKEN_REFRESH_MARGIN = 300
+# Cache alias to share tokens between worker processes (needs a shared backend); None = per process
+FCM_CREDENTIAL_CACHE = None
+
+# Push outbox drained by `manage.py process_push_outbox`
+PUSH_OUTBOX_BATCH_SIZE = 100
+PUSH_OUTBOX_MAX_ATTEMPTS = 6
+PUSH_OUTBOX_BACKOFF_SECONDS = 30  # doubled per attempt, with jitter
+PUSH_OUTBOX_MAX_BACKOFF_SECONDS = 3600
+PUSH_OUTBOX_LEASE_SECONDS = 120  # rows claimed by a worker that dies reappear after this
+# Days delivered pushes are kept before `manage.py prune_notifications` deletes them (None keeps forever);
+# dead-lettered rows are kept for inspection
+PUSH_OUTBOX_SENT_RETENTION_DAYS = 7
+# Pending topic membership changes applied per run of `manage.py sync_push_topics`
+PUSH_TOPIC_SYNC_BATCH_SIZE = 5000
+PUSH_TOPIC_SYNC_BACKOFF_SECONDS = 60  # doubled per failed attempt of a change, with jitter
+PUSH_TOPIC_SYNC_MAX_BACKOFF_SECONDS = 6 * 3600
+
+# Seconds in which a user's notifications about the same order are merged into one row and
+# one push; order pushes are held back this long so later updates can join them (0 disables)
+NOTIFICATION_COALESCE_SECONDS = 10
+
+# Days read/unread notifications are kept, per type, by `manage.py prune_notifications`
+# ("default" covers unlisted types, None keeps forever). An order's latest snapshot is always kept.
+NOTIFICATION_RETENTION = {
+    "default": {"read_days": 90, "unread_days": 365},
+    "order_status": {"read_days": 30, "unread_days": 180},
+    "order_status_change": {"read_days": 30, "unread_days": 180},
+    "review_reminder": {"read_days": 14, "unread_days": 60},
+    "delivery_delay": {"read_days": 14, "unread_days": 60},
+    "account": {"read_days": 30, "unread_days": None},
+}
+# Rows deleted or compacted per transaction by prune_notifications
+NOTIFICATION_PRUNE_BATCH_SIZE = 1000
+
+# Live notification stream (/api/notifications/stream/, needs an ASGI server).
+# LocalBackend only reaches connections in the publishing process; use RedisBackend with several workers.
+NOTIFICATION_STREAM_BACKEND = "notifications.pubsub.LocalBackend"
+NOTIFICATION_STREAM_REDIS_URL = "redis://localhost:6379/0"  # used by RedisBackend
+NOTIFICATION_STREAM_HEARTBEAT = 15  # seconds between keep-alive comments on idle streams
+NOTIFICATION_STREAM_QUEUE_SIZE = 100  # undelivered events per connection before it is dropped
+# Lifetime of the ?ticket= that EventSource clients open the stream with (from POST stream/ticket/).
+# Query strings are written to access logs, so the stream never takes a JWT there.
+NOTIFICATION_STREAM_TICKET_SECONDS = 60
+
 # Added for Custom User Model
 AUTH_USER_MODEL = 'users.CustomUser'
 
@@ -232,6 +314,34 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 # Media files
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Media is served by mediafiles.views.serve_media. Set the backend to "nginx" (X-Accel-Redirect to
+# MEDIA_SENDFILE_ROOT, an internal location aliasing MEDIA_ROOT) or "xsendfile" (Apache/lighttpd)
+# to let the front server stream files; None streams them from Django.
+SERVE_MEDIA = True
+MEDIA_SENDFILE_BACKEND = None
+MEDIA_SENDFILE_ROOT = '/protected-media/'
+# Browser cache lifetime for media other than content-addressed blobs (those are cached for a year)
+MEDIA_CACHE_SECONDS = 3600
+
+# Sized WebP derivatives generated for uploaded images (bounding box in pixels)
+IMAGE_DERIVATIVES = {
+    "thumbnail": (160, 160),
+    "card": (480, 480),
+    "full": (1280, 1280),
+}
+IMAGE_DERIVATIVE_QUALITY = 80
+# Render in a process pool after commit; False renders synchronously (handy for tests/dev)
+IMAGE_DERIVATIVES_ASYNC = True
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Product image uploads are re-encoded server-side; larger uploads spill to a temp file
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+IMAGE_UPLOAD_MAX_SIZE = 15 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 50_000_000
+IMAGE_UPLOAD_MAX_DIMENSION = 1600
+IMAGE_UPLOAD_FORMAT = "WEBP"  # or "JPEG"
+# Stored files must still pass store.validators.validate_file_size (80 KB)
+IMAGE_UPLOAD_TARGET_BYTES = 80 * 1024
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
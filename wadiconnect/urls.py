@@ -15,13 +15,13 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularSwaggerView,
 )
-from django.conf.urls.static import static
 from django.conf import settings
+from mediafiles.views import serve_media
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("auth/", include("users.urls")),  # custom register and otp endpoints
@@ -33,6 +33,8 @@ urlpatterns = [
     path('api/notifications/', include('notifications.urls')),
 ]
 
-# 👇 This will serve media files during development (when DEBUG = True)
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# 👇 Media files, streamed by Django or handed to the front server via sendfile
+if settings.SERVE_MEDIA:
+    urlpatterns += [
+        re_path(rf"^{settings.MEDIA_URL.strip('/')}/(?P<path>.*)$", serve_media, name="media"),
+    ]